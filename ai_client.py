@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+AI API客户端模块
+负责请求重试（指数退避 + 随机抖动，遵循 Retry-After）、
+按每分钟请求数 / 每分钟token数进行限流，以及共享的HTTP连接池
+"""
+
+import json
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from typing import List, Dict, Any, Optional, Callable
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# 需要重试的HTTP状态码
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def _setting(settings, key: str, fallback):
+    """从 [SETTINGS] 配置（或普通字典）中读取配置项，按默认值的类型转换"""
+    if settings is None or key not in settings:
+        return fallback
+    try:
+        return type(fallback)(settings[key])
+    except (TypeError, ValueError):
+        return fallback
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的token数：ASCII字符约4个一token，其余字符（如中文）约1个一token"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟额度，按秒匀速补充"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.refill_rate = per_minute / 60.0
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, per_minute: float):
+        """修改每分钟额度，保留桶中已有的令牌（按新容量截断）"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+            self.updated_at = now
+            self.capacity = per_minute
+            self.refill_rate = per_minute / 60.0
+            self.tokens = min(self.tokens, per_minute)
+
+    def acquire(self, amount: float = 1):
+        """取出指定数量的令牌，不足时阻塞等待"""
+        # 单次请求超过桶容量时，最多等到桶满
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+                self.updated_at = now
+
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.refill_rate
+
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """同时限制每分钟请求数和每分钟token数，0表示不限制"""
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+
+    def update(self, requests_per_minute: int, tokens_per_minute: int):
+        """修改限额，已有的令牌桶原地调整，不重置当前剩余额度"""
+        self._requests = self._resize(self._requests, requests_per_minute)
+        self._tokens = self._resize(self._tokens, tokens_per_minute)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+    @staticmethod
+    def _resize(bucket: Optional[TokenBucket], per_minute: int) -> Optional[TokenBucket]:
+        if per_minute <= 0:
+            return None
+        if bucket is None:
+            return TokenBucket(per_minute)
+        bucket.set_rate(per_minute)
+        return bucket
+
+    def acquire(self, tokens: int):
+        if self._requests:
+            self._requests.acquire(1)
+        if self._tokens:
+            self._tokens.acquire(tokens)
+
+
+# 同一API端点共享一个限流器，保证并发批次和并发任务共用同一份额度
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(base_url: str, requests_per_minute: int, tokens_per_minute: int) -> RateLimiter:
+    """获取（或创建）指定端点的共享限流器；限额配置变化时原地修改限额，
+    已消耗的额度仍然有效，避免换配置后瞬间放出一整桶请求"""
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(base_url)
+        if limiter is None:
+            limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+            _rate_limiters[base_url] = limiter
+        elif (limiter.requests_per_minute != requests_per_minute
+                or limiter.tokens_per_minute != tokens_per_minute):
+            limiter.update(requests_per_minute, tokens_per_minute)
+        return limiter
+
+
+class ConnectionStats:
+    """统计请求次数、新建连接数和平均延迟，用于观察连接复用效果"""
+
+    def __init__(self):
+        self.requests = 0
+        self.total_latency = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        with self._lock:
+            self.requests += 1
+            self.total_latency += latency
+
+    def snapshot(self, adapters: List[HTTPAdapter]) -> Dict[str, Any]:
+        connections = 0
+        for adapter in adapters:
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+
+        with self._lock:
+            requests_count = self.requests
+            avg_latency = self.total_latency / requests_count if requests_count else 0.0
+
+        return {
+            'requests': requests_count,
+            'connections_opened': connections,
+            'connections_reused': max(0, requests_count - connections),
+            'avg_latency_ms': round(avg_latency * 1000, 1)
+        }
+
+
+# 进程内共享的HTTP会话（keep-alive连接池），命令行工具和Web工作线程共用
+_session = None
+_session_adapters = []   # 挂载过的所有适配器（旧适配器上可能仍有正在进行的请求，不关闭）
+_session_pool_size = 0
+_session_lock = threading.Lock()
+connection_stats = ConnectionStats()
+
+
+def get_session(pool_size: int = 10) -> requests.Session:
+    """获取共享的HTTP会话
+
+    其他任务的客户端可能仍在使用会话，会话创建后不再关闭或替换；需要更大的连接池时
+    在同一会话上挂载更大的适配器（之后的请求使用新连接池，旧连接池上进行中的请求不受影响），连接池只增不减
+    """
+    global _session, _session_pool_size
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+        if pool_size > _session_pool_size:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+            _session_adapters.append(adapter)
+            _session_pool_size = pool_size
+        return _session
+
+
+def get_connection_stats() -> Dict[str, Any]:
+    """返回共享连接池的复用统计"""
+    with _session_lock:
+        adapters = list(_session_adapters)
+    return connection_stats.snapshot(adapters)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或HTTP日期），返回需要等待的秒数"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AIClient:
+    """兼容OpenAI格式的聊天补全客户端"""
+
+    def __init__(self, api_config: Dict[str, str], settings=None):
+        self.api_key = api_config.get('api_key')
+        self.base_url = api_config.get('base_url', 'https://api.deepseek.com')
+        self.model = api_config.get('model', 'deepseek-chat')
+
+        self.timeout = _setting(settings, 'api_timeout', 30.0)
+        self.max_retries = _setting(settings, 'max_retries', 3)
+        self.backoff_base = _setting(settings, 'retry_backoff_base', 1.0)
+        self.backoff_max = _setting(settings, 'retry_backoff_max', 60.0)
+        self.rate_limiter = get_rate_limiter(
+            self.base_url,
+            _setting(settings, 'requests_per_minute', 0),
+            _setting(settings, 'tokens_per_minute', 0)
+        )
+        # 连接池至少能容纳所有并发批次
+        pool_size = _setting(settings, 'http_pool_size', 0) or max(10, _setting(settings, 'max_concurrency', 4))
+        self.session = get_session(pool_size)
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/chat/completions"
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _backoff(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待时间（指数退避 + 全抖动）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(self, data: Dict[str, Any], estimated_tokens: int = 0,
+             stream: bool = False) -> requests.Response:
+        """发送请求，对 429/5xx/超时/连接错误进行重试
+
+        流式请求只在收到响应头之前重试，避免重复回调已经收到的内容
+        """
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(estimated_tokens)
+
+            try:
+                started_at = time.monotonic()
+                response = self.session.post(self.url, headers=self._headers(), json=data,
+                                             timeout=self.timeout, stream=stream)
+                connection_stats.record(time.monotonic() - started_at)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                wait = self._backoff(attempt)
+                print(f"API请求失败（{e.__class__.__name__}），{wait:.1f} 秒后重试 ({attempt + 1}/{self.max_retries})")
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response
+
+                # 释放连接回连接池后再重试
+                response.close()
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                wait = retry_after if retry_after is not None else self._backoff(attempt)
+                wait = min(wait, self.backoff_max)
+                print(f"API返回 {response.status_code}，{wait:.1f} 秒后重试 ({attempt + 1}/{self.max_retries})")
+
+            time.sleep(wait)
+            attempt += 1
+
+    def check(self, timeout: float = 5) -> int:
+        """发送一个最小请求测试API连接，返回HTTP状态码（不重试、不限流）"""
+        data = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": "test"}],
+            "max_tokens": 1
+        }
+        response = self.session.post(self.url, headers=self._headers(), json=data, timeout=timeout)
+        return response.status_code
+
+    def chat(self, messages: List[Dict[str, str]], max_tokens: int = 500,
+             temperature: float = 0.1) -> str:
+        """调用聊天补全接口，返回回复文本"""
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        estimated = sum(estimate_tokens(m['content']) for m in messages) + max_tokens
+
+        response = self.post(data, estimated)
+        result = response.json()
+        return result['choices'][0]['message']['content'].strip()
+
+    def chat_stream(self, messages: List[Dict[str, str]], max_tokens: int = 500,
+                    temperature: float = 0.1,
+                    on_line: Optional[Callable[[str], None]] = None) -> str:
+        """以流式（SSE）方式调用聊天补全接口
+
+        每收到完整的一行就调用 on_line(行内容)，最终返回完整的回复文本
+        """
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+        estimated = sum(estimate_tokens(m['content']) for m in messages) + max_tokens
+
+        response = self.post(data, estimated, stream=True)
+        # SSE响应通常不声明编码，需要手动指定，否则中文会被按 ISO-8859-1 解码
+        response.encoding = 'utf-8'
+
+        pieces = []
+        buffer = ''
+        try:
+            for raw_line in response.iter_lines(decode_unicode=True):
+                if not raw_line or not raw_line.startswith('data:'):
+                    continue
+                payload = raw_line[5:].strip()
+                if payload == '[DONE]':
+                    break
+
+                choices = json.loads(payload).get('choices') or []
+                if not choices:
+                    continue
+                delta = (choices[0].get('delta') or {}).get('content') or ''
+                pieces.append(delta)
+
+                buffer += delta
+                while '\n' in buffer:
+                    line, buffer = buffer.split('\n', 1)
+                    if on_line:
+                        on_line(line)
+        finally:
+            response.close()
+
+        if buffer and on_line:
+            on_line(buffer)
+        return ''.join(pieces).strip()
@@ -0,0 +1,179 @@
+# app/job_store.py
+"""
+分类任务的持久化存储
+任务状态和每个文件的分类结果保存在 SQLite（WAL 模式）中，服务重启后任务仍然存在；
+启动时只读取任务列表，任务的文件和分类结果在第一次访问时才加载。
+分类结果先在内存中攒批，每完成一个API批次（或攒够 batch_size 条）在一个事务中写入，
+中断的任务重新开始时从最后写入的结果继续，已分类的文件不再调用API
+"""
+
+import json
+import sqlite3
+import threading
+import configparser
+from typing import Dict, Any, List, Optional, Iterable
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    source_folder TEXT NOT NULL,
+    status TEXT NOT NULL,
+    file_count INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_files (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    category_index INTEGER,
+    PRIMARY KEY (job_id, idx)
+) WITHOUT ROWID;
+"""
+
+# 单独存放的字段（其余状态字段以 JSON 保存在 jobs.state 中）；executing 只在内存中有效
+SEPARATE_FIELDS = ('status', 'files', 'classifications', 'results', 'executing')
+
+
+class JobStore:
+    """任务存储，所有线程共享一个连接"""
+
+    def __init__(self, db_file: str, batch_size: int = 500):
+        self.db_file = db_file
+        self.batch_size = max(1, batch_size)
+        self._lock = threading.Lock()
+        self._pending = {}    # (任务ID, 文件下标) -> 分类下标，等待写入
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    def load_jobs(self, interrupted_status: str, active_statuses: Iterable[str]) -> List[Dict[str, Any]]:
+        """启动时读取任务列表（不含文件和分类结果），按创建时间排序
+
+        上次服务退出时仍在排队或分类的任务标记为 interrupted_status
+        """
+        active_statuses = list(active_statuses)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET status = ? WHERE status IN ({','.join('?' * len(active_statuses))})",
+                [interrupted_status] + active_statuses
+            )
+            rows = self._conn.execute(
+                "SELECT id, source_folder, status, file_count, created_at, updated_at, "
+                "json_extract(state, '$.progress') AS progress, json_extract(state, '$.run_id') AS run_id "
+                "FROM jobs ORDER BY created_at"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def load_state(self, job_id: str) -> Dict[str, Any]:
+        """读取单个任务的完整状态；未得到结果的文件分类为 None"""
+        self.flush()
+        with self._lock:
+            job = self._conn.execute("SELECT status, state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            rows = self._conn.execute(
+                "SELECT filename, category_index FROM job_files WHERE job_id = ? ORDER BY idx", (job_id,)
+            ).fetchall()
+        if job is None:
+            return {}
+        state = json.loads(job['state'])
+        state['status'] = job['status']
+        state['files'] = [row['filename'] for row in rows]
+        state['classifications'] = [row['category_index'] for row in rows]
+        return state
+
+    def create(self, job_id: str, source_folder: str, state: Dict[str, Any], created_at: float):
+        """保存新任务和它的文件列表"""
+        files = state['files']
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, source_folder, status, file_count, state, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, source_folder, state['status'], len(files), self._dump(state), created_at, created_at)
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO job_files (job_id, idx, filename, category_index) VALUES (?, ?, ?, NULL)",
+                [(job_id, i, filename) for i, filename in enumerate(files)]
+            )
+
+    def record_results(self, job_id: str, results: Dict[int, Optional[int]]):
+        """记录文件的分类结果（文件下标 -> 分类下标），攒够 batch_size 条时写入"""
+        with self._lock:
+            for i, category_idx in results.items():
+                self._pending[(job_id, i)] = category_idx
+            if len(self._pending) >= self.batch_size:
+                self._write_pending()
+
+    def save(self, job_id: str, state: Dict[str, Any], updated_at: float):
+        """写入任务状态和所有待写入的分类结果（同一个事务）"""
+        with self._lock:
+            self._write_pending(
+                "UPDATE jobs SET status = ?, state = ?, updated_at = ? WHERE id = ?",
+                (state['status'], self._dump(state), updated_at, job_id)
+            )
+
+    def reset_results(self, job_id: str):
+        """重新分类前清空任务已保存的分类结果"""
+        with self._lock, self._conn:
+            for key in [key for key in self._pending if key[0] == job_id]:
+                del self._pending[key]
+            self._conn.execute("UPDATE job_files SET category_index = NULL WHERE job_id = ?", (job_id,))
+
+    def flush(self):
+        with self._lock:
+            self._write_pending()
+
+    def delete(self, job_ids: Iterable[str]):
+        job_ids = [(job_id,) for job_id in job_ids]
+        if not job_ids:
+            return
+        with self._lock, self._conn:
+            for key in [key for key in self._pending if (key[0],) in job_ids]:
+                del self._pending[key]
+            self._conn.executemany("DELETE FROM job_files WHERE job_id = ?", job_ids)
+            self._conn.executemany("DELETE FROM jobs WHERE id = ?", job_ids)
+
+    def _write_pending(self, sql: str = None, params: tuple = ()):
+        """在一个事务中写入待写入的分类结果（和可选的一条语句），调用时已持有 _lock"""
+        if not self._pending and sql is None:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE job_files SET category_index = ? WHERE job_id = ? AND idx = ?",
+                [(category_idx, job_id, i) for (job_id, i), category_idx in self._pending.items()]
+            )
+            if sql is not None:
+                self._conn.execute(sql, params)
+        self._pending.clear()
+
+    @staticmethod
+    def _dump(state: Dict[str, Any]) -> str:
+        return json.dumps({key: value for key, value in state.items() if key not in SEPARATE_FIELDS},
+                          ensure_ascii=False)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_job_store(config: configparser.ConfigParser) -> Optional[JobStore]:
+    """获取（或打开）共享的任务存储，job_store_file 为空时返回 None（任务只保存在内存中）"""
+    settings = config['SETTINGS']
+    db_file = settings.get('job_store_file', '.jobs.db').strip()
+    if not db_file:
+        return None
+
+    with _stores_lock:
+        store = _stores.get(db_file)
+        if store is None:
+            store = JobStore(db_file, settings.getint('job_store_batch', fallback=500))
+            _stores[db_file] = store
+        return store
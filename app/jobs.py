@@ -0,0 +1,298 @@
+# app/jobs.py
+"""
+分类任务管理
+每次扫描创建一个任务（job），任务状态各自加锁保存，多个浏览器标签页互不影响；
+分类在有界线程池中执行，不同源文件夹的任务可以同时进行，结束超过保留时间的任务自动清除；
+启用任务存储（job_store_file）时任务在服务重启后仍然存在，中断的分类可从最后完成的批次继续
+"""
+
+import os
+import time
+import uuid
+import threading
+import configparser
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable
+
+from .job_store import get_job_store
+
+
+# 任务状态
+JOB_IDLE = 'idle'              # 已扫描，等待开始分类
+JOB_QUEUED = 'queued'          # 等待线程池空闲
+JOB_PROCESSING = 'processing'
+JOB_COMPLETED = 'completed'
+JOB_ERROR = 'error'
+JOB_INTERRUPTED = 'interrupted'  # 服务重启时分类被中断，重新开始时从已保存的结果继续
+
+ACTIVE_STATUSES = (JOB_QUEUED, JOB_PROCESSING)
+
+
+def new_job_state() -> Dict[str, Any]:
+    """任务的初始状态（与原来的全局分类状态字段相同）"""
+    return {
+        'current_batch': 0,
+        'total_batches': 0,
+        'status': JOB_IDLE,
+        'message': '',
+        'progress': 0,
+        'current_file': '',
+        'results': {},
+        'files': [],
+        'categories': [],
+        'classifications': [],
+        'cache_hits': 0,
+        'cache_misses': 0,
+        'local_hits': {},
+        'rule_hits': {},
+        'clustered_files': 0,
+        'unresolved_files': [],
+        'placement': None,
+        'executing': False,
+        'resume': False,
+        'resumed_files': 0,
+        'ai_files': [],
+        'run_id': None
+    }
+
+
+class Job:
+    """单个分类任务，状态的读写都在 lock 内进行
+
+    job['字段'] 读写单个字段；需要连续修改多个字段或修改其中的列表时使用 with job.lock。
+    从任务存储恢复的任务在第一次读写字段时才加载文件和分类结果
+    """
+
+    def __init__(self, job_id: str, source_folder: str, **state):
+        self.id = job_id
+        self.source_folder = source_folder
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.lock = threading.RLock()
+        self._state = new_job_state()
+        self._state.update(state)
+        self._loader = None
+        self._stored = None
+
+    @classmethod
+    def restored(cls, row: Dict[str, Any], loader: Callable[[str], Dict[str, Any]]) -> 'Job':
+        """由任务存储中的一行创建尚未加载的任务"""
+        job = cls(row['id'], row['source_folder'])
+        job.created_at = row['created_at']
+        job.updated_at = row['updated_at']
+        job._state = None
+        job._loader = loader
+        job._stored = row
+        return job
+
+    @property
+    def loaded(self) -> bool:
+        return self._state is not None
+
+    @property
+    def state(self) -> Dict[str, Any]:
+        """任务状态字典（调用时需持有 lock）"""
+        if self._state is None:
+            state = new_job_state()
+            state.update(self._loader(self.id))
+            if state['status'] == JOB_INTERRUPTED:
+                state['message'] = '服务重启时分类被中断，重新开始分类将从已保存的结果继续'
+            # 中断前已得到的结果重新放入结果列表，结果页面可以查看
+            categories = state['categories']
+            state['results'] = {
+                'files': [
+                    {'id': i + 1, 'filename': filename, 'category_index': category_idx,
+                     'category': categories[category_idx]}
+                    for i, (filename, category_idx) in enumerate(zip(state['files'], state['classifications']))
+                    if category_idx is not None and 0 <= category_idx < len(categories)
+                ],
+                'categories': categories
+            }
+            self._state = state
+            self._loader = None
+        return self._state
+
+    def __getitem__(self, key: str) -> Any:
+        with self.lock:
+            return self.state[key]
+
+    def __setitem__(self, key: str, value: Any):
+        with self.lock:
+            self.state[key] = value
+            self.updated_at = time.time()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self.lock:
+            return self.state.get(key, default)
+
+    def update(self, **fields):
+        with self.lock:
+            self.state.update(fields)
+            self.updated_at = time.time()
+
+    @property
+    def active(self) -> bool:
+        """正在排队、分类或执行放置（尚未加载的任务一定不是活动的）"""
+        with self.lock:
+            if self._state is None:
+                return False
+            return self._state['status'] in ACTIVE_STATUSES or self._state['executing']
+
+    def summary(self) -> Dict[str, Any]:
+        with self.lock:
+            if self._state is None:
+                status, progress = self._stored['status'], self._stored['progress']
+                file_count, run_id = self._stored['file_count'], self._stored['run_id']
+            else:
+                status, progress = self._state['status'], self._state['progress']
+                file_count, run_id = len(self._state['files']), self._state['run_id']
+            return {
+                'job_id': self.id,
+                'status': status,
+                'progress': progress,
+                'source_folder': self.source_folder,
+                'file_count': file_count,
+                'run_id': run_id,
+                'created_at': self.created_at,
+                'updated_at': self.updated_at
+            }
+
+
+class JobManager:
+    """任务注册表和分类线程池
+
+    同一源文件夹同时只能有一个任务在分类或执行；结束（非活动）超过 retention_seconds 的任务
+    在下次访问任务列表时清除（被中断的任务保留已付费得到的分类结果，只能手动删除）。
+    传入 store 时任务保存到任务存储，启动时恢复任务列表
+    """
+
+    def __init__(self, max_jobs: int = 2, retention_seconds: float = 3600, store=None):
+        self.retention_seconds = retention_seconds
+        self.store = store
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_jobs), thread_name_prefix='classify-job')
+        if store:
+            for row in store.load_jobs(JOB_INTERRUPTED, ACTIVE_STATUSES):
+                self._jobs[row['id']] = Job.restored(row, store.load_state)
+
+    def create(self, source_folder: str, **state) -> Job:
+        job = Job(uuid.uuid4().hex[:12], source_folder, **state)
+        if self.store:
+            self.store.create(job.id, source_folder, job.state, job.created_at)
+        with self._lock:
+            self._evict()
+            self._jobs[job.id] = job
+        return job
+
+    def persist(self, job: Job):
+        """保存任务状态和攒批中的分类结果（未启用任务存储时不做任何事）"""
+        if self.store:
+            with job.lock:
+                self.store.save(job.id, job.state, job.updated_at)
+
+    def record_results(self, job: Job, results: Dict[int, Optional[int]]):
+        """记录文件的分类结果（文件下标 -> 分类下标），攒批写入任务存储"""
+        if self.store:
+            self.store.record_results(job.id, results)
+
+    def reset_results(self, job: Job):
+        """清空任务存储中已保存的分类结果（重新分类时调用）"""
+        if self.store:
+            self.store.reset_results(job.id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def latest(self) -> Optional[Job]:
+        """最近创建的任务（未指定任务ID的旧接口使用）"""
+        with self._lock:
+            self._evict()
+            return next(reversed(self._jobs.values()), None)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            self._evict()
+            return list(self._jobs.values())
+
+    def remove(self, job_id: str) -> bool:
+        """删除非活动的任务"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.active:
+                return False
+            del self._jobs[job_id]
+        if self.store:
+            self.store.delete([job_id])
+        return True
+
+    def _evict(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if not job.active and now - job.updated_at > self.retention_seconds
+                   and job.summary()['status'] != JOB_INTERRUPTED]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if self.store and expired:
+            self.store.delete(expired)
+
+    def _conflict(self, job: Job) -> Optional[str]:
+        """同一源文件夹上有其他活动任务时返回错误信息"""
+        if job.active:
+            return '该任务正在进行中'
+        folder = os.path.abspath(job.source_folder)
+        for other in self._jobs.values():
+            if other is not job and other.active and os.path.abspath(other.source_folder) == folder:
+                return f"源文件夹 {job.source_folder} 正在被任务 {other.id} 处理"
+        return None
+
+    def submit(self, job: Job, worker: Callable[[Job], None]) -> Optional[str]:
+        """提交分类，成功返回 None，否则返回错误信息；被中断的任务从已保存的结果继续"""
+        with self._lock:
+            error = self._conflict(job)
+            if error:
+                return error
+            job.update(status=JOB_QUEUED, progress=0, message='', resume=job['status'] == JOB_INTERRUPTED)
+            self.persist(job)
+            self._executor.submit(self._run, job, worker)
+        return None
+
+    def _run(self, job: Job, worker: Callable[[Job], None]):
+        """执行分类，结束（完成或出错）后保存任务的最终状态"""
+        try:
+            worker(job)
+        finally:
+            self.persist(job)
+
+    def begin_execute(self, job: Job) -> Optional[str]:
+        """开始放置文件（执行、继续或撤回），成功返回 None，否则返回错误信息；结束后调用 end_execute"""
+        with self._lock:
+            error = self._conflict(job)
+            if error:
+                return error
+            job['executing'] = True
+        return None
+
+    def end_execute(self, job: Job):
+        job['executing'] = False
+        self.persist(job)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager(config: configparser.ConfigParser) -> JobManager:
+    """共享的任务管理器，第一次调用时按配置创建（并从任务存储恢复任务列表）"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            settings = config['SETTINGS']
+            _manager = JobManager(
+                max_jobs=settings.getint('max_jobs', fallback=2),
+                retention_seconds=settings.getfloat('job_retention_minutes', fallback=60) * 60,
+                store=get_job_store(config)
+            )
+        return _manager
@@ -7,33 +7,41 @@ import os
 import json
 import configparser
 from pathlib import Path
-import threading
 import time
 
 # 导入原有工具函数
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 from utils import (
-    load_config, get_files, call_ai_api, 
-    parse_ai_response, classify_files, parse_category_paths,
-    rollback_classification
+    load_config, iter_files, get_scan_options, classify_batch, run_local_stages,
+    classify_files, parse_category_paths
 )
-
-# 全局变量存储分类状态
-classification_status = {
-    'current_batch': 0,
-    'total_batches': 0,
-    'status': 'idle',
-    'progress': 0,
-    'current_file': '',
-    'results': {},
-    'files': [],
-    'categories': [],
-    'classifications': []
-}
+from classify_cache import load_cache, make_category_key
+from ai_client import AIClient, get_connection_stats
+from batch_planner import BatchPlanner, dispatch_batches
+from rules import RuleClassifier
+from learner import LearnedClassifier, get_data_file, record_samples
+from neighbors import NeighborIndex
+from clustering import group_clusters, find_inconsistent_clusters
+from scan_index import get_scan_index, STATUSES, STATUS_EXECUTED, STATUS_CLASSIFIED
+from placement import get_placement_options, get_cleanup_verify, CLEANUP_VERIFY_MODES
+from placement_plan import UNRESOLVED
+from journal import open_journal, get_journal_dir, list_runs, resume_run, rollback_run, cleanup_run
+from .utils import format_size
+from .jobs import get_job_manager
 
 main_bp = Blueprint('main', __name__)
 
+
+def find_job(config, job_id=None):
+    """按任务ID查找任务；旧的 /api/classify/* 接口未指定 job_id 时使用最近创建的任务"""
+    manager = get_job_manager(config)
+    job_id = job_id or request.args.get('job_id') or (request.get_json(silent=True) or {}).get('job_id')
+    return manager.get(job_id) if job_id else manager.latest()
+
+
+JOB_NOT_FOUND = {'success': False, 'message': '任务不存在或已过期，请重新扫描'}
+
 @main_bp.route('/')
 def index():
     """主页"""
@@ -128,260 +136,544 @@ def get_config():
         return jsonify({'success': False, 'message': str(e)})
 
 @main_bp.route('/api/files/scan')
+@main_bp.route('/api/jobs', methods=['POST'])
 def scan_files():
-    """扫描文件"""
+    """扫描文件并创建分类任务（source_folder 参数可指定其他源文件夹，默认使用配置中的源文件夹）"""
     config = load_config()
     if not config:
         return jsonify({'success': False, 'message': '配置加载失败'})
     
-    source_folder = config['PATHS']['source_folder']
-    files = get_files(source_folder)
+    source_folder = request.args.get('source_folder') or config['PATHS']['source_folder']
+    if not os.path.exists(source_folder):
+        os.makedirs(source_folder, exist_ok=True)
+    
+    # 启用扫描索引时只重新列出有变化的目录，已整理过的文件不再加入待分类列表
+    # （扫描索引只记录配置中的源文件夹）
+    scan_index = get_job_scan_index(config, source_folder)
+    index_summary = None
+    if scan_index:
+        full = request.args.get('full', '').lower() in ('1', 'true')
+        index_summary = scan_index.rescan(source_folder, full=full, **get_scan_options(config))
+        entries = scan_index.queued_files(include_classified=True)
+    else:
+        # 单次遍历同时得到文件名和大小，不再逐个文件单独 stat
+        entries = sorted(iter_files(source_folder, **get_scan_options(config)))
+    files = [entry.name for entry in entries]
+    total_size = sum(entry.size for entry in entries)
     
     # 获取分类标签
     categories = []
     if 'CLASSIFICATION' in config and 'categories' in config['CLASSIFICATION']:
         categories = [c.strip() for c in config['CLASSIFICATION']['categories'].split(',')]
     
-    # 重置状态
-    classification_status.update({
-        'current_batch': 0,
-        'total_batches': (len(files) + 29) // 30,  # 每批30个文件
-        'status': 'idle',
-        'progress': 0,
-        'current_file': '',
-        'results': {},
-        'files': files,
-        'categories': categories,  # 这里设置categories
-        'classifications': []
-    })
+    # 预估批次数（实际批次按token预算动态规划）
+    category_descriptions = config['CLASSIFICATION'].get('category_descriptions', '')
+    planner = BatchPlanner.from_config(config, categories, category_descriptions)
+    
+    # 每次扫描创建一个新任务
+    job = get_job_manager(config).create(
+        source_folder,
+        total_batches=planner.estimate_batches(len(files)),
+        files=files,
+        categories=categories
+    )
     
     return jsonify({
         'success': True,
+        'job_id': job.id,
         'files': files,
         'count': len(files),
-        'batches': classification_status['total_batches'],
+        'total_size': format_size(total_size),
+        'index': index_summary,
+        'batches': job['total_batches'],
         'categories': len(categories)  # 返回分类数量
     })
 
+@main_bp.route('/api/jobs')
+def list_jobs():
+    """任务列表（已清除超过保留时间的任务）"""
+    config = load_config()
+    if not config:
+        return jsonify({'success': False, 'message': '配置加载失败'})
+    return jsonify({'success': True, 'jobs': [job.summary() for job in get_job_manager(config).list()]})
+
+@main_bp.route('/api/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    """删除已结束的任务"""
+    config = load_config()
+    if not config:
+        return jsonify({'success': False, 'message': '配置加载失败'})
+    if not get_job_manager(config).remove(job_id):
+        return jsonify({'success': False, 'message': '任务不存在或正在进行中'})
+    return jsonify({'success': True})
+
 @main_bp.route('/api/classify/start', methods=['POST'])
-def start_classification():
-    """开始分类"""
-    if classification_status['status'] == 'processing':
-        return jsonify({'success': False, 'message': '分类正在进行中'})
+@main_bp.route('/api/jobs/<job_id>/start', methods=['POST'])
+def start_classification(job_id=None):
+    """开始分类（在任务线程池中执行，线程池已满时排队）"""
+    config = load_config()
+    if not config:
+        return jsonify({'success': False, 'message': '配置加载失败'})
+    job = find_job(config, job_id)
+    if not job:
+        return jsonify(JOB_NOT_FOUND)
     
-    # 启动分类线程
-    thread = threading.Thread(target=classification_worker)
-    thread.daemon = True
-    thread.start()
+    error = get_job_manager(config).submit(job, classification_worker)
+    if error:
+        return jsonify({'success': False, 'message': error})
     
-    return jsonify({'success': True, 'message': '分类已开始'})
+    return jsonify({'success': True, 'message': '分类已开始', 'job_id': job.id})
 
-def classification_worker():
+def classification_worker(job):
     """分类工作线程"""
+    cache = None
     try:
-        classification_status['status'] = 'processing'
-        classification_status['progress'] = 0
+        job.update(status='processing', progress=0, current_batch=0)
         
         # 加载配置
         config = load_config()
         if not config:
-            classification_status['status'] = 'error'
-            classification_status['message'] = '配置加载失败'
+            job.update(status='error', message='配置加载失败')
             return
         
         # 获取分类标签
         categories = [c.strip() for c in config['CLASSIFICATION']['categories'].split(',')]
-        classification_status['categories'] = categories  # 确保这里设置了categories
         
-        files = classification_status['files']
+        # 被中断的任务沿用已保存的分类结果（分类标签变化后结果不再有效，需要全部重新分类）
+        manager = get_job_manager(config)
+        resumed = {}
+        if job['resume'] and job['categories'] == categories:
+            resumed = {i: category_idx for i, category_idx in enumerate(job['classifications'])
+                       if category_idx is not None and category_idx != UNRESOLVED}
+        else:
+            manager.reset_results(job)
+        job.update(categories=categories, resumed_files=len(resumed))  # 确保这里设置了categories
+        
+        category_descriptions = config['CLASSIFICATION'].get('category_descriptions', '')
+        model = config['API'].get('model', 'deepseek-chat')
+        
+        files = job['files']
         total_files = len(files)
-        batches = classification_status['total_batches']
+        max_concurrency = max(1, config['SETTINGS'].getint('max_concurrency', fallback=4))
+        
+        # 先查询缓存，只有未命中的文件才需要调用API
+        all_classifications = [None] * total_files
+        cache = load_cache(config)
+        category_key = make_category_key(categories, category_descriptions)
+        if cache:
+            cached, pending = cache.split_cached(files, category_key, model)
+        else:
+            cached, pending = {}, list(range(total_files))
+        
+        job['cache_hits'] = len(cached)
+        job['cache_misses'] = len(pending)
+        
+        # 扫描索引中已分类未整理的文件沿用上次的分类
+        scan_index = get_job_scan_index(config, job.source_folder)
+        stored = scan_index.stored_categories(files, categories) if scan_index else {}
+        if stored:
+            pending = [i for i in pending if i not in stored]
+            cached.update(stored)
+        
+        # 上次中断前已得到结果的文件不再重新分类
+        if resumed:
+            print(f"继续中断的任务 {job.id}：{len(resumed)} 个文件沿用已保存的结果")
+            pending = [i for i in pending if i not in resumed]
+            cached.update(resumed)
+        
+        # 本地规则等阶段能直接分类的文件不再调用API
+        rule_classifier = RuleClassifier.from_config(config, categories)
+        learned_classifier = LearnedClassifier.from_config(config, categories)
+        neighbor_index = NeighborIndex.from_config(config, categories)
+        local_stages = [stage for stage in [rule_classifier, learned_classifier, neighbor_index] if stage]
+        local, pending, local_hits = run_local_stages(local_stages, files, pending)
+        cached.update(local)
+        job['local_hits'] = local_hits
+        job['rule_hits'] = dict(rule_classifier.hits) if rule_classifier else {}
+        
+        # 近似重复的文件名（如“第3章习题”“第4章习题”）只发送一个代表文件，结果分发给整簇
+        if config['SETTINGS'].getboolean('cluster_filenames', fallback=True):
+            pending, cluster_members = group_clusters(files, pending)
+        else:
+            cluster_members = {}
+        job['clustered_files'] = sum(len(m) - 1 for m in cluster_members.values())
+        remaining_to_send = len(pending)
         
-        all_classifications = []
+        planner = BatchPlanner.from_config(config, categories, category_descriptions)
+        job['total_batches'] = planner.estimate_batches(len(pending))
+        job['results'] = {
+            'files': [],
+            'categories': categories
+        }
         
-        # 分批处理
-        for batch_num in range(batches):
-            classification_status['current_batch'] = batch_num + 1
-            
-            # 获取当前批次文件
-            start_idx = batch_num * 30
-            end_idx = min((batch_num + 1) * 30, total_files)
-            batch_files = files[start_idx:end_idx]
+        # 流式回复时多个批次线程会同时写入结果，使用任务的锁
+        state_lock = job.lock
+        done = bytearray(total_files)
+        finished_files = 0
+        
+        def record_result(i, category_idx=None):
+            """记录单个文件的结果（None 表示该文件已处理但没有得到分类），逐个文件推进进度"""
+            nonlocal finished_files
+            with state_lock:
+                if category_idx is not None and all_classifications[i] is None:
+                    all_classifications[i] = category_idx
+                    manager.record_results(job, {i: category_idx})
+                    # 已得到结果的文件立即加入结果列表，结果页面无需等待整批完成
+                    job['results']['files'].append({
+                        'id': i + 1,
+                        'filename': files[i],
+                        'category_index': category_idx,
+                        'category': categories[category_idx]
+                    })
+                if not done[i]:
+                    done[i] = 1
+                    finished_files += 1
+                job.update(current_file=files[i], progress=int((finished_files / total_files) * 100))
+        
+        def record_cluster(i, category_idx=None):
+            """记录代表文件的结果，并分发给同簇的所有文件"""
+            for member in cluster_members.get(i, [i]):
+                record_result(member, category_idx)
+        
+        for i, category_idx in cached.items():
+            record_result(i, category_idx)
+        manager.persist(job)
+        
+        def process_batch(batch_indices):
+            """处理单个批次，返回 (批次内下标 -> 分类结果, 请求耗时, 首次解析失败数)"""
+            batch_files = [files[i] for i in batch_indices]
+            started_at = time.monotonic()
             
-            # 调用AI分类
             try:
-                response = call_ai_api(
+                batch_classifications, failed = classify_batch(
                     batch_files,
                     categories,
-                    config['CLASSIFICATION'].get('category_descriptions', ''),
-                    config['API']
+                    category_descriptions,
+                    config['API'],
+                    config['SETTINGS'],
+                    max_tokens=planner.max_tokens_for(len(batch_files)),
+                    on_result=lambda j, category_idx: record_cluster(batch_indices[j], category_idx)
                 )
-                
-                # 解析响应
-                batch_classifications = parse_ai_response(
-                    response, 
-                    len(batch_files), 
-                    len(categories)
-                )
-                
-                all_classifications.extend(batch_classifications)
-                
-                # 更新进度
-                classification_status['progress'] = int((end_idx / total_files) * 100)
-                
+                return batch_classifications, time.monotonic() - started_at, failed
             except Exception as e:
-                print(f"批次 {batch_num + 1} 处理失败: {e}")
-                # 如果失败，为这批文件添加默认分类（最后一个分类：其他）
-                all_classifications.extend([len(categories) - 1] * len(batch_files))
-        
-        # 保存分类结果
-        classification_status['classifications'] = all_classifications
-        classification_status['status'] = 'completed'
-        classification_status['progress'] = 100
+                print(f"批次处理失败（{len(batch_files)} 个文件，重试已用尽，这些文件标记为未分类）: {e}")
+                return {}, None, len(batch_files)
+        
+        def on_batch_done(batch_indices, batch_classifications):
+            """按文件下标写回结果，保持原始文件顺序，并更新批次进度"""
+            nonlocal remaining_to_send
+            for j, category_idx in batch_classifications.items():
+                record_cluster(batch_indices[j], category_idx)
+                if cache:
+                    for member in cluster_members.get(batch_indices[j], [batch_indices[j]]):
+                        cache.put(files[member], category_key, model, category_idx)
+            for i in batch_indices:
+                record_cluster(i)
+            
+            with state_lock:
+                remaining_to_send -= len(batch_indices)
+                job['current_batch'] += 1
+                job['total_batches'] = job['current_batch'] + planner.estimate_batches(remaining_to_send)
+            
+            # 每完成一个批次保存一次，服务中断后从这里继续
+            manager.persist(job)
+        
+        # 按token预算分批并发处理
+        dispatch_batches(planner, pending, files, process_batch, on_batch_done, max_concurrency)
+        
+        # 重新查询后仍未得到结果的文件（如批次重试耗尽）标记为未分类，执行时跳过，由用户在结果页面指定分类
+        unresolved = [files[i] for i, category_idx in enumerate(all_classifications) if category_idx is None]
+        job['unresolved_files'] = unresolved
+        # 只有AI（含缓存的AI结果）给出的分类可以作为标注数据，本地阶段、扫描索引和中断前的结果除外
+        not_from_ai = set(local) | set(stored) | set(resumed)
+        job['ai_files'] = [files[i] for i, category_idx in enumerate(all_classifications)
+                           if category_idx is not None and i not in not_from_ai]
+        if unresolved:
+            print(f"警告: {len(unresolved)} 个文件未得到AI分类，请在结果页面指定分类，否则执行时跳过")
+        all_classifications = [
+            UNRESOLVED if category_idx is None else category_idx
+            for category_idx in all_classifications
+        ]
+        
+        if scan_index:
+            scan_index.mark_classified({
+                filename: categories[category_idx]
+                for filename, category_idx in zip(files, all_classifications)
+                if category_idx != UNRESOLVED
+            })
         
-        # 确保结果对象被正确初始化
-        classification_status['results'] = {
-            'files': [],
-            'categories': categories
-        }
+        # 保存分类结果（完成后结果列表由 /api/classify/results 按原始顺序重建）
+        manager.record_results(job, dict(enumerate(all_classifications)))
+        job.update(
+            classifications=all_classifications,
+            status='completed',
+            progress=100,
+            current_file='',
+            results={'files': [], 'categories': categories}
+        )
         
     except Exception as e:
-        classification_status['status'] = 'error'
-        classification_status['message'] = str(e)
+        job.update(status='error', message=str(e))
         print(f"分类工作线程错误: {e}")
+    finally:
+        # 缓存写回失败不影响任务状态（API结果已经保存在任务中）
+        if cache:
+            try:
+                cache.save()
+            except OSError as e:
+                print(f"警告: 分类缓存保存失败: {e}")
 
 @main_bp.route('/api/classify/status')
-def get_classification_status():
+@main_bp.route('/api/jobs/<job_id>/status')
+def get_classification_status(job_id=None):
     """获取分类状态"""
-    return jsonify({
-        'status': classification_status['status'],
-        'progress': classification_status['progress'],
-        'current_batch': classification_status['current_batch'],
-        'total_batches': classification_status['total_batches'],
-        'current_file': classification_status['current_file']
-    })
+    config = load_config()
+    if not config:
+        return jsonify({'success': False, 'message': '配置加载失败'})
+    job = find_job(config, job_id)
+    if not job:
+        return jsonify(JOB_NOT_FOUND)
+    
+    with job.lock:
+        return jsonify({
+            'job_id': job.id,
+            'status': job['status'],
+            'message': job['message'],
+            'progress': job['progress'],
+            'current_batch': job['current_batch'],
+            'total_batches': job['total_batches'],
+            'current_file': job['current_file'],
+            'cache_hits': job['cache_hits'],
+            'cache_misses': job['cache_misses'],
+            'local_hits': job['local_hits'],
+            'rule_hits': job['rule_hits'],
+            'clustered_files': job['clustered_files'],
+            'resumed_files': job['resumed_files'],
+            'unresolved_count': len(job['unresolved_files']),
+            'connection_stats': get_connection_stats(),
+            'placement': job['placement'],
+            'run_id': job['run_id']
+        })
 
 @main_bp.route('/api/classify/results')
-def get_classification_results():
+@main_bp.route('/api/jobs/<job_id>/results')
+def get_classification_results(job_id=None):
     """获取分类结果"""
-    # 如果分类未完成，尝试从状态中获取已有的结果
-    if classification_status['status'] != 'completed':
-        # 检查是否已经有部分结果
-        if classification_status['results'] and classification_status['results'].get('files'):
-            files = classification_status['files']
-            categories = classification_status.get('categories', [])
-            results = classification_status['results']['files']
-            
-            return jsonify({
-                'success': True,
-                'results': results,
-                'categories': categories,
-                'total_files': len(files)
-            })
-        return jsonify({'success': False, 'message': '分类未完成或没有结果'})
-    
-    files = classification_status['files']
-    categories = classification_status.get('categories', [])
+    config = load_config()
+    job = find_job(config, job_id) if config else None
+    if not job:
+        return jsonify(JOB_NOT_FOUND)
     
-    # 如果categories为空，尝试从配置中加载
-    if not categories:
-        config = load_config()
-        if config and 'CLASSIFICATION' in config and 'categories' in config['CLASSIFICATION']:
+    with job.lock:
+        # 如果分类未完成，尝试从状态中获取已有的结果
+        if job['status'] != 'completed':
+            # 检查是否已经有部分结果
+            if job['results'] and job['results'].get('files'):
+                return jsonify({
+                    'success': True,
+                    'job_id': job.id,
+                    'results': sorted(job['results']['files'], key=lambda row: row['id']),
+                    'categories': job['categories'],
+                    'total_files': len(job['files']),
+                    'partial': job['status'] == 'processing'
+                })
+            return jsonify({'success': False, 'message': '分类未完成或没有结果'})
+        
+        files = job['files']
+        categories = job['categories']
+        
+        # 如果categories为空，尝试从配置中加载
+        if not categories and 'CLASSIFICATION' in config and 'categories' in config['CLASSIFICATION']:
             categories = [c.strip() for c in config['CLASSIFICATION']['categories'].split(',')]
-    
-    classifications = classification_status.get('classifications', [])
-    
-    # 构建结果列表
-    results = []
-    for i, (filename, cat_idx) in enumerate(zip(files, classifications)):
-        if i < len(classifications):
-            category_name = '其他'
-            if cat_idx < len(categories):
-                category_name = categories[cat_idx]
-            elif categories and len(categories) > 0:
-                # 如果索引超出范围，使用最后一个分类
-                category_name = categories[-1]
-            
-            results.append({
-                'id': i + 1,
-                'filename': filename,
-                'category_index': cat_idx,
-                'category': category_name
-            })
-    
-    # 保存结果到状态
-    classification_status['results'] = {
-        'files': results,
-        'categories': categories
-    }
-    
-    return jsonify({
-        'success': True,
-        'results': results,
-        'categories': categories,
-        'total_files': len(files)
-    })
+        
+        classifications = job['classifications']
+        
+        # 构建结果列表
+        results = []
+        for i, (filename, cat_idx) in enumerate(zip(files, classifications)):
+            if i < len(classifications):
+                category_name = '其他'
+                if cat_idx == UNRESOLVED:
+                    category_name = '未分类'
+                elif cat_idx < len(categories):
+                    category_name = categories[cat_idx]
+                elif categories and len(categories) > 0:
+                    # 如果索引超出范围，使用最后一个分类
+                    category_name = categories[-1]
+                
+                results.append({
+                    'id': i + 1,
+                    'filename': filename,
+                    'category_index': cat_idx,
+                    'category': category_name
+                })
+        
+        # 保存结果到状态
+        job['results'] = {
+            'files': results,
+            'categories': categories
+        }
+        
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'results': results,
+            'categories': categories,
+            'total_files': len(files),
+            'unresolved_count': len(job['unresolved_files']),
+            'flagged_clusters': get_flagged_clusters(config, job)
+        })
+
+def get_flagged_clusters(config, job):
+    """簇内文件分类不一致的簇（文件ID列表），[SETTINGS] flag_inconsistent_clusters 关闭时返回空列表"""
+    if not config or not config['SETTINGS'].getboolean('flag_inconsistent_clusters', fallback=True):
+        return []
+    with job.lock:
+        clusters = find_inconsistent_clusters(job['files'], job['classifications'])
+    return [[i + 1 for i in cluster] for cluster in clusters]
+
+def get_job_scan_index(config, source_folder):
+    """扫描索引只记录配置中的源文件夹，其他源文件夹的任务不更新索引"""
+    if not source_folder or os.path.abspath(source_folder) != os.path.abspath(config['PATHS']['source_folder']):
+        return None
+    return get_scan_index(config)
 
 @main_bp.route('/api/classify/adjust', methods=['POST'])
-def adjust_classification():
+@main_bp.route('/api/jobs/<job_id>/adjust', methods=['POST'])
+def adjust_classification(job_id=None):
     """调整分类结果"""
     try:
         data = request.json
         file_id = data.get('file_id')
         category_index = data.get('category_index')
         
-        # 找到对应的分类结果并更新
-        results = classification_status.get('results', {}).get('files', [])
-        for file_data in results:
-            if file_data['id'] == file_id:
-                file_data['category_index'] = category_index
-                file_data['category'] = classification_status['categories'][category_index]
-                
-                # 更新主分类列表
-                classification_status['classifications'][file_id - 1] = category_index
-                break
+        config = load_config()
+        job = find_job(config, job_id) if config else None
+        if not job:
+            return jsonify(JOB_NOT_FOUND)
+        flagged_cluster = []
+        
+        # 找到对应的分类结果并更新；分类进行中结果还没生成，等分类完成后再调整
+        # category_index 为 UNRESOLVED 时恢复为未分类（执行时跳过）
+        with job.lock:
+            if job['status'] != 'completed':
+                return jsonify({'success': False, 'message': '分类未完成，请等分类完成后再调整'})
+            if category_index != UNRESOLVED and not 0 <= category_index < len(job['categories']):
+                return jsonify({'success': False, 'message': f"分类索引 {category_index} 无效"})
+            results = job['results'].get('files', []) if job['results'] else []
+            for file_data in results:
+                if file_data['id'] == file_id:
+                    file_data['category_index'] = category_index
+                    file_data['category'] = job['categories'][category_index] if category_index != UNRESOLVED else '未分类'
+                    
+                    # 更新主分类列表和未分类文件列表
+                    job['classifications'][file_id - 1] = category_index
+                    unresolved = [f for f in job['unresolved_files'] if f != file_data['filename']]
+                    if category_index == UNRESOLVED:
+                        unresolved.append(file_data['filename'])
+                    job['unresolved_files'] = unresolved
+                    break
+            else:
+                file_data = None
+        
+        if file_data:
+            # 调整立即写入任务存储，服务重启后仍然有效
+            manager = get_job_manager(config)
+            manager.record_results(job, {file_id - 1: category_index})
+            manager.persist(job)
+            
+            # 保存用户的调整作为本地学习模型的标注数据
+            if category_index != UNRESOLVED:
+                record_samples(get_data_file(config), [(file_data['filename'], file_data['category'])],
+                               source='correction')
+            
+            # 同簇的相似文件被调整成了不同分类时提示用户检查
+            for cluster in get_flagged_clusters(config, job):
+                if file_id in cluster:
+                    flagged_cluster = cluster
         
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'flagged_cluster': flagged_cluster})
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
 @main_bp.route('/api/classify/execute', methods=['POST'])
-def execute_classification():
+@main_bp.route('/api/jobs/<job_id>/execute', methods=['POST'])
+def execute_classification(job_id=None):
     """执行分类操作"""
     try:
         config = load_config()
         if not config:
             return jsonify({'success': False, 'message': '配置加载失败'})
-        
-        # 获取分类结果
-        files = classification_status['files']
-        classifications = classification_status['classifications']
-        categories = classification_status['categories']
-        
-        # 解析分类路径
-        category_paths = parse_category_paths(config)
-        
-        # 执行分类
-        result = classify_files(
-            files,
-            classifications,
-            categories,
-            config['PATHS']['source_folder'],
-            config['PATHS']['target_base_folder'],
-            category_paths
-        )
-        
-        # 保存文件目标路径，用于可能的撤回
-        classification_status['file_target_paths'] = result.get('file_target_paths', {})
+        job = find_job(config, job_id)
+        if not job:
+            return jsonify(JOB_NOT_FOUND)
+        if job['status'] != 'completed':
+            return jsonify({'success': False, 'message': '分类未完成'})
+        
+        manager = get_job_manager(config)
+        error = manager.begin_execute(job)
+        if error:
+            return jsonify({'success': False, 'message': error})
+        
+        try:
+            # 获取分类结果
+            with job.lock:
+                files = list(job['files'])
+                classifications = list(job['classifications'])
+                categories = list(job['categories'])
+                ai_files = set(job['ai_files'])
+            
+            # 解析分类路径
+            category_paths = parse_category_paths(config)
+            
+            # 执行分类（复制进度写入任务状态，执行期间可通过 /api/jobs/<任务ID>/status 查询）
+            # 每次执行写入操作日志，服务重启后仍可按运行ID继续或撤回
+            placement_options = get_placement_options(config)
+            journal = open_journal(config, placement_options['placement_mode'],
+                                   job.source_folder, config['PATHS']['target_base_folder'])
+            job.update(placement=None, run_id=journal.run_id)
+            try:
+                result = classify_files(
+                    files,
+                    classifications,
+                    categories,
+                    job.source_folder,
+                    config['PATHS']['target_base_folder'],
+                    category_paths,
+                    on_progress=lambda stats: job.update(placement=stats),
+                    journal=journal,
+                    **placement_options
+                )
+            finally:
+                journal.close()
+            job['placement'] = result['throughput']
+        finally:
+            manager.end_execute(job)
+        
+        scan_index = get_job_scan_index(config, job.source_folder)
+        if scan_index:
+            scan_index.set_status(result['file_target_paths'], STATUS_EXECUTED)
+        
+        # 执行即表示用户接受了AI的分类结果，保存为标注数据（本地分类和未得到AI分类的文件除外）
+        record_samples(get_data_file(config), [
+            (filename, categories[category_idx])
+            for filename, category_idx in zip(files, classifications)
+            if filename in ai_files and 0 <= category_idx < len(categories)
+        ])
         
         return jsonify({
             'success': True,
             'message': '分类执行完成',
+            'run_id': journal.run_id,
             'stats': {
                 'success': result['success_count'],
                 'failed': result['failed_count'],
-                'category_stats': result['category_stats']
+                'skipped': len(result['skipped_files']),
+                'duplicates': result['duplicate_count'],
+                'category_stats': result['category_stats'],
+                'bytes_per_second': format_size(result['throughput']['bytes_per_second']) + '/s',
+                'files_per_second': result['throughput']['files_per_second']
             }
         })
     
@@ -389,80 +681,154 @@ def execute_classification():
         return jsonify({'success': False, 'message': str(e)})
 
 @main_bp.route('/api/classify/cleanup', methods=['POST'])
-def cleanup_files():
-    """清理源文件"""
+@main_bp.route('/api/jobs/<job_id>/cleanup', methods=['POST'])
+def cleanup_files(job_id=None):
+    """清理源文件（只删除操作日志中已复制或已硬链接到目标位置、且校验一致的源文件）"""
     try:
         config = load_config()
         if not config:
             return jsonify({'success': False, 'message': '配置加载失败'})
         
-        # 获取分类结果
-        files = classification_status['files']
-        classifications = classification_status['classifications']
-        categories = classification_status['categories']
+        job = find_job(config, job_id)
+        run_id = job['run_id'] if job else None
+        if not run_id:
+            return jsonify({'success': False, 'message': '没有可清理的运行'})
+        
+        # 校验方式可用 ?verify=fast|strict 临时指定，默认使用 cleanup_verify
+        verify = request.args.get('verify') or get_cleanup_verify(config)
+        if verify not in CLEANUP_VERIFY_MODES:
+            return jsonify({'success': False, 'message': f"未知的校验方式: {verify}"})
+        
+        manager = get_job_manager(config)
+        error = manager.begin_execute(job)
+        if error:
+            return jsonify({'success': False, 'message': error})
+        try:
+            result = cleanup_run(get_journal_dir(config), run_id, verify,
+                                 config['SETTINGS'].getint('placement_workers', fallback=8))
+        finally:
+            manager.end_execute(job)
+        return jsonify({
+            'success': True,
+            'message': '清理完成',
+            'deleted_count': result['deleted_count'],
+            'failed_count': result['failed_to_delete_count'],
+            'failed_files': result['failed_files'],
+            'verdicts': result['verdicts']
+        })
+    
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@main_bp.route('/api/classify/rollback', methods=['POST'])
+@main_bp.route('/api/jobs/<job_id>/rollback', methods=['POST'])
+def rollback_files(job_id=None):
+    """撤回任务最近一次执行的分类"""
+    config = load_config()
+    if not config:
+        return jsonify({'success': False, 'message': '配置加载失败'})
+    job = find_job(config, job_id)
+    run_id = job['run_id'] if job else None
+    if not run_id:
+        return jsonify({'success': False, 'message': '没有可撤回的文件'})
+    
+    manager = get_job_manager(config)
+    error = manager.begin_execute(job)
+    if error:
+        return jsonify({'success': False, 'message': error})
+    try:
+        return rollback_by_id(run_id)
+    finally:
+        manager.end_execute(job)
+
+@main_bp.route('/api/runs')
+def list_run_history():
+    """运行历史"""
+    config = load_config()
+    if not config:
+        return jsonify({'success': False, 'message': '配置加载失败'})
+    return jsonify({'success': True, 'runs': list_runs(get_journal_dir(config))})
+
+@main_bp.route('/api/runs/<run_id>/resume', methods=['POST'])
+def resume_by_id(run_id):
+    """继续中断的运行"""
+    try:
+        config = load_config()
+        if not config:
+            return jsonify({'success': False, 'message': '配置加载失败'})
         
-        # 解析分类路径
-        category_paths = parse_category_paths(config)
+        placement_options = get_placement_options(config)
+        placement_options.pop('placement_mode')
+        result = resume_run(get_journal_dir(config), run_id, **placement_options)
         
-        # 统计删除的文件
-        deleted_count = 0
-        failed_to_delete_count = 0
-        failed_files = []
+        scan_index = get_job_scan_index(config, result['source_folder'])
+        if scan_index:
+            scan_index.set_status(result['file_target_paths'], STATUS_EXECUTED)
+        return jsonify({
+            'success': True,
+            'message': '继续运行完成',
+            'stats': {
+                'recovered': result['recovered'],
+                'placed': result['placed'],
+                'failed': result['failed'],
+                'failed_files': result['failed_files']
+            }
+        })
+    
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@main_bp.route('/api/runs/<run_id>/rollback', methods=['POST'])
+def rollback_by_id(run_id):
+    """按运行ID撤回"""
+    try:
+        config = load_config()
+        if not config:
+            return jsonify({'success': False, 'message': '配置加载失败'})
         
-        for i, (filename, category_idx) in enumerate(zip(files, classifications)):
-            if i >= len(classifications):
-                continue
-                
-            if category_idx < 0 or category_idx >= len(categories):
-                continue
-            
-            category = categories[category_idx]
-            source_path = os.path.join(config['PATHS']['source_folder'], filename)
-            
-            # 确定目标路径
-            if category_paths and category in category_paths:
-                target_folder = category_paths[category]
-                if not os.path.isabs(target_folder):
-                    target_folder = os.path.abspath(target_folder)
-                target_path = os.path.join(target_folder, filename)
-            else:
-                target_path = os.path.join(config['PATHS']['target_base_folder'], category, filename)
-            
-            # 检查目标文件是否存在，然后删除源文件
-            if os.path.exists(target_path) and os.path.exists(source_path):
-                try:
-                    os.remove(source_path)
-                    deleted_count += 1
-                except Exception as e:
-                    failed_to_delete_count += 1
-                    failed_files.append({'file': filename, 'error': str(e)})
+        result = rollback_run(get_journal_dir(config), run_id)
         
+        # 撤回后文件回到已分类未整理的状态，下次扫描仍会出现在待分类列表中
+        scan_index = get_job_scan_index(config, result['source_folder'])
+        if scan_index:
+            scan_index.set_status(result['files'], STATUS_CLASSIFIED)
         return jsonify({
             'success': True,
-            'message': '清理完成',
-            'deleted_count': deleted_count,
-            'failed_count': failed_to_delete_count,
-            'failed_files': failed_files
+            'message': '撤回完成',
+            'stats': {
+                'deleted_count': result['deleted_count'],
+                'failed_to_delete_count': result['failed_to_delete_count'],
+                'failed_files': result['failed_files']
+            }
         })
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
-@main_bp.route('/api/classify/rollback', methods=['POST'])
-def rollback_files():
-    """撤回分类"""
+@main_bp.route('/api/index/files')
+def query_scan_index():
+    """按状态查询扫描索引（status 可用逗号分隔多个状态，省略时返回全部）"""
     try:
-        file_target_paths = classification_status.get('file_target_paths', {})
-        
-        if file_target_paths:
-            result = rollback_classification(file_target_paths)
-            return jsonify({
-                'success': True,
-                'message': '撤回完成',
-                'stats': result
-            })
-        else:
-            return jsonify({'success': False, 'message': '没有可撤回的文件'})
+        config = load_config()
+        if not config:
+            return jsonify({'success': False, 'message': '配置加载失败'})
+        
+        scan_index = get_scan_index(config)
+        if not scan_index:
+            return jsonify({'success': False, 'message': '扫描索引未启用'})
+        
+        statuses = [s.strip() for s in request.args.get('status', '').split(',') if s.strip()]
+        unknown = [s for s in statuses if s not in STATUSES]
+        if unknown:
+            return jsonify({'success': False, 'message': f"未知状态: {', '.join(unknown)}"})
+        
+        limit = request.args.get('limit', type=int)
+        offset = request.args.get('offset', 0, type=int)
+        return jsonify({
+            'success': True,
+            'counts': scan_index.counts(),
+            'files': scan_index.query(statuses, limit, offset)
+        })
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -475,35 +841,14 @@ def check_api():
         if not config:
             return jsonify({'success': False, 'message': '配置加载失败'})
         
-        # 简单的API测试
-        import requests
-        
-        api_key = config['API'].get('api_key', '')
-        base_url = config['API'].get('base_url', 'https://api.deepseek.com')
-        
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        # 发送一个简单的请求测试
-        test_data = {
-            "model": config['API'].get('model', 'deepseek-chat'),
-            "messages": [{"role": "user", "content": "test"}],
-            "max_tokens": 1
-        }
-        
-        response = requests.post(
-            f"{base_url}/chat/completions",
-            headers=headers,
-            json=test_data,
-            timeout=5
-        )
+        # 简单的API测试（与分类请求共用连接池）
+        client = AIClient(config['API'], config['SETTINGS'])
+        status_code = client.check(timeout=5)
         
-        if response.status_code == 200:
+        if status_code == 200:
             return jsonify({'success': True, 'message': 'API连接正常'})
         else:
-            return jsonify({'success': False, 'message': f'API连接失败: {response.status_code}'})
+            return jsonify({'success': False, 'message': f'API连接失败: {status_code}'})
     
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
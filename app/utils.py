@@ -4,26 +4,6 @@ Web应用专用工具函数
 """
 
 import os
-import json
-import tempfile
-from pathlib import Path
-
-def save_temp_data(data, prefix='classification_'):
-    """保存临时数据到文件"""
-    temp_dir = tempfile.gettempdir()
-    temp_file = Path(temp_dir) / f"{prefix}{os.getpid()}.json"
-    
-    with open(temp_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    
-    return temp_file
-
-def load_temp_data(temp_file):
-    """从临时文件加载数据"""
-    if temp_file.exists():
-        with open(temp_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return None
 
 def validate_folder_path(path):
     """验证文件夹路径"""
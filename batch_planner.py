@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+批次规划模块
+按token预算把文件打包成批次，并根据实际延迟和解析失败率动态调整批次大小
+"""
+
+import math
+import configparser
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Tuple, Callable, Optional, Deque, Iterable
+
+from ai_client import estimate_tokens
+from utils import build_ai_messages
+
+
+# 每个文件的回复（如 "12:3\n"）大约消耗的token数
+COMPLETION_TOKENS_PER_FILE = 4
+
+
+def messages_tokens(messages: List[Dict[str, str]]) -> int:
+    """估算消息列表的token数"""
+    return sum(estimate_tokens(m['content']) for m in messages)
+
+
+class BatchPlanner:
+    """基于token预算的自适应批次规划器
+
+    next_batch / record 只应在分发线程中调用，不需要加锁
+    """
+
+    def __init__(self, prompt_overhead: int, per_file_overhead: int,
+                 token_budget: int = 3000, batch_size: int = 30,
+                 min_batch_size: int = 5, max_batch_size: int = 60,
+                 target_latency: float = 20.0, max_failure_rate: float = 0.1):
+        self.prompt_overhead = prompt_overhead
+        self.per_file_overhead = per_file_overhead
+        self.token_budget = token_budget
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max(min_batch_size, max_batch_size)
+        self.batch_size = min(max(batch_size, self.min_batch_size), self.max_batch_size)
+        self.target_latency = target_latency
+        self.max_failure_rate = max_failure_rate
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser, categories: List[str],
+                    category_descriptions: str) -> 'BatchPlanner':
+        """根据 [SETTINGS] 配置和当前提示词模板创建规划器"""
+        settings = config['SETTINGS']
+
+        # 固定开销：不含文件的提示词；单文件开销：提示词中每个文件的序号等修饰部分
+        prompt_mode = settings.get('prompt_mode', 'standard')
+        prompt_overhead = messages_tokens(build_ai_messages([], categories, category_descriptions, prompt_mode))
+        single_file = messages_tokens(build_ai_messages(['x'], categories, category_descriptions, prompt_mode))
+        per_file_overhead = max(0, single_file - prompt_overhead - 1)
+
+        return cls(
+            prompt_overhead,
+            per_file_overhead,
+            token_budget=settings.getint('batch_token_budget', fallback=3000),
+            batch_size=settings.getint('batch_size', fallback=30),
+            min_batch_size=settings.getint('min_batch_size', fallback=5),
+            max_batch_size=settings.getint('max_batch_size', fallback=60),
+            target_latency=settings.getfloat('target_batch_latency', fallback=20.0)
+        )
+
+    def file_tokens(self, filename: str) -> int:
+        """单个文件在提示词和回复中的预计token数"""
+        return estimate_tokens(filename) + self.per_file_overhead + COMPLETION_TOKENS_PER_FILE
+
+    def max_tokens_for(self, batch_size: int) -> int:
+        """根据批次大小设置回复的 max_tokens，留出50%余量"""
+        return int(batch_size * COMPLETION_TOKENS_PER_FILE * 1.5) + 32
+
+    def next_batch(self, remaining: Deque[int], filenames: List[str]) -> List[int]:
+        """从待处理队列中取出下一批文件下标，同时受批次大小和token预算限制"""
+        batch = []
+        tokens = self.prompt_overhead
+        while remaining and len(batch) < self.batch_size:
+            cost = self.file_tokens(filenames[remaining[0]])
+            # 至少放入一个文件，避免超长文件名永远无法发送
+            if batch and tokens + cost > self.token_budget:
+                break
+            batch.append(remaining.popleft())
+            tokens += cost
+        return batch
+
+    def estimate_batches(self, count: int) -> int:
+        """估算剩余文件还需要的批次数"""
+        return math.ceil(count / self.batch_size)
+
+    def record(self, batch_size: int, latency: Optional[float], failed: int):
+        """根据一个批次的结果调整后续批次大小
+
+        解析失败率过高或延迟超过目标时缩小批次；批次完全成功且延迟远低于目标时逐步增大
+        """
+        failure_rate = failed / batch_size if batch_size else 0
+        if failure_rate > self.max_failure_rate or latency is None or latency > self.target_latency:
+            self.batch_size = max(self.min_batch_size, int(self.batch_size * 0.7))
+        elif failed == 0 and latency < self.target_latency / 2 and batch_size >= self.batch_size:
+            self.batch_size = min(self.max_batch_size, int(self.batch_size * 1.25) + 1)
+
+
+def dispatch_batches(planner: BatchPlanner, pending: Iterable[int], filenames: List[str],
+                     process_batch: Callable[[List[int]], Tuple[Dict[int, int], Optional[float], int]],
+                     on_batch_done: Callable[[List[int], Dict[int, int]], None],
+                     max_concurrency: int = 1):
+    """按规划器的节奏并发分发批次
+
+    pending 可以是边扫描边产出文件下标的迭代器（filenames 随之增长），攒够一个批次就开始发送，
+    不需要等整个目录树扫描完；
+    process_batch(批次文件下标) 返回 (批次内下标 -> 分类索引, 请求耗时；失败时为None, 解析失败的文件数)；
+    每个批次完成后在当前线程调用 on_batch_done(批次文件下标, 分类结果)
+    """
+    remaining = deque()
+    feed = iter(pending)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        running = {}
+
+        def submit_next():
+            # 队列中的文件不足一个批次时继续从 pending 中取
+            while len(remaining) < planner.batch_size:
+                i = next(feed, None)
+                if i is None:
+                    break
+                remaining.append(i)
+            batch_indices = planner.next_batch(remaining, filenames)
+            if batch_indices:
+                running[executor.submit(process_batch, batch_indices)] = batch_indices
+
+        for _ in range(max(1, max_concurrency)):
+            submit_next()
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch_indices = running.pop(future)
+                classifications, latency, failed = future.result()
+                planner.record(len(batch_indices), latency, failed)
+                on_batch_done(batch_indices, classifications)
+                submit_next()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+提示词token基准测试
+对比 standard 和 compact 两种提示词模式下每个文件平均消耗的输入token数
+
+用法: python bench_prompt.py [批次大小]
+默认使用 source_folder 中的文件名，文件夹为空时使用内置示例文件名
+"""
+
+import sys
+import configparser
+
+from ai_client import estimate_tokens
+from utils import get_files, get_scan_options, build_ai_messages
+
+
+SAMPLE_FILENAMES = [
+    "高等数学第三章习题答案.pdf",
+    "线性代数期末复习提纲.docx",
+    "第4章 矩阵的特征值与特征向量.pptx",
+    "2023-2024学年第一学期高数A期中试卷.pdf",
+    "lecture_notes_week05_v2 (1).pdf",
+    "资料讲义_大学物理_电磁学.pdf",
+    "行列式计算技巧总结.md",
+    "微积分公式速查表.png",
+]
+
+
+def messages_tokens(messages):
+    return sum(estimate_tokens(m['content']) for m in messages)
+
+
+def bench(filenames, categories, category_descriptions, batch_size):
+    """返回各模式下的 (固定前缀token, 每批总token, 每文件平均token)"""
+    batch = (filenames * (batch_size // len(filenames) + 1))[:batch_size]
+    results = {}
+    for mode in ('standard', 'compact'):
+        messages = build_ai_messages(batch, categories, category_descriptions, mode)
+        prefix = messages_tokens(build_ai_messages([], categories, category_descriptions, mode))
+        total = messages_tokens(messages)
+        results[mode] = (prefix, total, total / len(batch))
+    return results
+
+
+def main():
+    batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+
+    config = configparser.ConfigParser()
+    config.read('config.ini', encoding='utf-8')
+    categories = [c.strip() for c in config.get('CLASSIFICATION', 'categories', fallback='高数1,线代,资料讲义').split(',')]
+    category_descriptions = config.get('CLASSIFICATION', 'category_descriptions', fallback='')
+
+    filenames = SAMPLE_FILENAMES
+    if config.has_section('PATHS'):
+        filenames = get_files(config['PATHS'].get('source_folder', './未整理'), **get_scan_options(config)) or filenames
+
+    results = bench(filenames, categories, category_descriptions, batch_size)
+
+    print(f"批次大小: {batch_size}  样本文件名: {len(filenames)} 个")
+    print(f"{'模式':<10}{'固定前缀':>10}{'每批总计':>10}{'每文件':>10}")
+    for mode, (prefix, total, per_file) in results.items():
+        print(f"{mode:<10}{prefix:>10}{total:>10}{per_file:>10.1f}")
+
+    standard, compact = results['standard'][2], results['compact'][2]
+    print(f"\n每文件token减少: {standard - compact:.1f} ({(1 - compact / standard) * 100:.0f}%)")
+    print("compact 模式的系统提示词在所有批次中保持不变，可命中服务商的前缀缓存")
+
+
+if __name__ == "__main__":
+    main()
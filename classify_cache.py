@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+分类结果缓存模块
+以（规范化文件名, 分类标签及描述的哈希, 模型）为键，将AI分类结果持久化到磁盘，
+相同文件名再次出现时无需重新调用API
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import unicodedata
+import configparser
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional
+
+
+def normalize_filename(filename: str) -> str:
+    """规范化文件名（全角/半角统一、去除首尾空白、忽略大小写）"""
+    return unicodedata.normalize('NFKC', filename).strip().lower()
+
+
+def atomic_write_json(path: str, data) -> None:
+    """原子地写入 JSON 文件：先写同目录下的唯一临时文件再替换，并发写入时不会互相踩到临时文件"""
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, temp_file = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=folder)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_file, path)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+def make_category_key(categories: List[str], category_descriptions: str) -> str:
+    """计算分类标签及其描述的哈希，标签变化后旧缓存自动失效"""
+    payload = json.dumps([categories, category_descriptions.strip()], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class ClassificationCache:
+    """带容量上限（LRU淘汰）和过期时间的分类结果缓存"""
+
+    def __init__(self, cache_file: str, max_entries: int = 20000, ttl_seconds: float = 30 * 86400):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # 键 -> [分类索引, 写入时间]
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._load()
+
+    @staticmethod
+    def _make_key(filename: str, category_key: str, model: str) -> str:
+        return f"{model}|{category_key}|{normalize_filename(filename)}"
+
+    def _read_file(self) -> List[list]:
+        """读取磁盘上的缓存条目，文件不存在或损坏时返回空列表"""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return []
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"警告: 缓存文件 {self.cache_file} 读取失败，将重新建立: {e}")
+            return []
+
+    def _load(self):
+        """从磁盘加载缓存，文件损坏时从空缓存开始"""
+        now = time.time()
+        for key, category_idx, stored_at in self._read_file():
+            if now - stored_at < self.ttl_seconds:
+                self._entries[key] = [category_idx, stored_at]
+        self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._dirty = True
+
+    def get(self, filename: str, category_key: str, model: str) -> Optional[int]:
+        """查询缓存，命中时返回0-based分类索引"""
+        key = self._make_key(filename, category_key, model)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] >= self.ttl_seconds:
+                del self._entries[key]
+                self._dirty = True
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, filename: str, category_key: str, model: str, category_idx: int):
+        """写入一条分类结果"""
+        key = self._make_key(filename, category_key, model)
+        with self._lock:
+            self._entries[key] = [category_idx, time.time()]
+            self._entries.move_to_end(key)
+            self._dirty = True
+            self._evict()
+
+    def split_cached(self, filenames: List[str], category_key: str,
+                     model: str) -> Tuple[Dict[int, int], List[int]]:
+        """将文件分为缓存命中和未命中两部分
+
+        返回 (命中的 文件下标 -> 分类索引, 未命中的文件下标列表)
+        """
+        cached = {}
+        missing = []
+        for i, filename in enumerate(filenames):
+            category_idx = self.get(filename, category_key, model)
+            if category_idx is None:
+                missing.append(i)
+            else:
+                cached[i] = category_idx
+        return cached, missing
+
+    def save(self):
+        """原子地写回磁盘（见 atomic_write_json）
+
+        写回前合并磁盘上其他进程（如同时运行的监视模式）写入的较新条目，不会互相覆盖
+        """
+        with self._save_lock:
+            with self._lock:
+                if not self.cache_file or not self._dirty:
+                    return
+                self._dirty = False
+
+            now = time.time()
+            merged = False
+            disk_items = self._read_file()
+            with self._lock:
+                for key, category_idx, stored_at in disk_items:
+                    entry = self._entries.get(key)
+                    if now - stored_at < self.ttl_seconds and (entry is None or entry[1] < stored_at):
+                        self._entries[key] = [category_idx, stored_at]
+                        merged = True
+                if merged:
+                    # 磁盘上的条目插入在末尾，按写入时间重新排序后再按容量淘汰
+                    self._entries = OrderedDict(sorted(self._entries.items(), key=lambda item: item[1][1]))
+                    self._evict()
+                items = [[key, entry[0], entry[1]] for key, entry in self._entries.items()]
+
+            try:
+                atomic_write_json(self.cache_file, items)
+            except BaseException:
+                with self._lock:
+                    self._dirty = True
+                raise
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def load_cache(config: configparser.ConfigParser) -> Optional[ClassificationCache]:
+    """获取（或加载）共享的缓存，cache_file 为空时不启用缓存
+
+    同一进程中使用同一缓存文件的任务共享一个缓存对象，并发任务的结果不会在写回时互相覆盖
+    """
+    settings = config['SETTINGS']
+    cache_file = settings.get('cache_file', '.classify_cache.json').strip()
+    if not cache_file:
+        return None
+
+    max_entries = settings.getint('cache_max_entries', fallback=20000)
+    ttl_seconds = settings.getfloat('cache_ttl_days', fallback=30) * 86400
+    with _caches_lock:
+        cache = _caches.get(os.path.abspath(cache_file))
+        if cache is None:
+            cache = ClassificationCache(cache_file, max_entries=max_entries, ttl_seconds=ttl_seconds)
+            _caches[os.path.abspath(cache_file)] = cache
+        else:
+            with cache._lock:
+                cache.max_entries, cache.ttl_seconds = max_entries, ttl_seconds
+                cache._evict()
+        return cache
@@ -2,6 +2,9 @@
 """
 整合的文件分类工具
 功能：扫描文件 → AI分析分类 → 自动整理（基于文件名）→ 询问确认 → 清理原文件
+
+用法: python classify_main.py [--full-scan]
+启用扫描索引时默认只重新列出有变化的目录，--full-scan 重新检查所有文件
 """
 
 import os
@@ -16,70 +19,44 @@ try:
     from utils import (
         load_config,
         get_files,
-        call_ai_api,
-        parse_ai_response,
+        iter_files,
+        stream_pending,
+        get_scan_options,
+        classify_batch,
+        run_local_stages,
         classify_files,
-        parse_category_paths,
-        rollback_classification
+        parse_category_paths
     )
 except ImportError:
     print("错误: 请确保 utils.py 文件存在")
     sys.exit(1)
 
+from classify_cache import load_cache, make_category_key
+from ai_client import get_connection_stats
+from batch_planner import BatchPlanner, dispatch_batches
+from rules import RuleClassifier
+from learner import LearnedClassifier, get_data_file, record_samples
+from neighbors import NeighborIndex
+from clustering import group_clusters
+from scan_index import get_scan_index, STATUS_EXECUTED
+from placement import get_placement_mode, get_placement_options, get_cleanup_verify
+from placement_plan import UNRESOLVED
+from journal import open_journal, get_journal_dir, rollback_run, cleanup_run
 
-def cleanup_source_files(files: List[str], classifications: List[int], 
-                        categories: List[str], source_folder: str, 
-                        target_base_folder: str, 
-                        category_stats: Dict[str, int],
-                        category_paths: Dict[str, str] = None) -> Dict[str, any]:
-    """清理源文件夹中已成功分类的文件"""
-    
-    deleted_count = 0
-    failed_to_delete_count = 0
-    failed_files = []
-    
-    print("\n[清理阶段] 正在清理源文件夹中的已分类文件...")
-    
-    for i, (filename, category_idx) in enumerate(zip(files, classifications)):
-        if i >= len(classifications):
-            continue
-            
-        if category_idx < 0 or category_idx >= len(categories):
-            continue
-        
-        category = categories[category_idx]
-        source_path = os.path.join(source_folder, filename)
-        
-        # 确定目标路径：优先使用自定义路径，否则使用默认路径
-        if category_paths and category in category_paths:
-            target_folder = category_paths[category]
-            # 确保路径是相对于当前目录的绝对路径
-            if not os.path.isabs(target_folder):
-                target_folder = os.path.abspath(target_folder)
-            target_path = os.path.join(target_folder, filename)
-        else:
-            target_path = os.path.join(target_base_folder, category, filename)
-        
-        # 检查目标文件是否已成功创建
-        if os.path.exists(target_path):
-            try:
-                # 删除源文件
-                os.remove(source_path)
-                deleted_count += 1
-                print(f"  ✓ 已删除: {filename}")
-                
-            except Exception as e:
-                print(f"  ✗ 删除失败 {filename}: {e}")
-                failed_to_delete_count += 1
-                failed_files.append(filename)
-        else:
-            print(f"  ⚠ 跳过 {filename}: 目标文件不存在，可能分类失败")
-    
-    return {
-        'deleted_count': deleted_count,
-        'failed_to_delete_count': failed_to_delete_count,
-        'failed_files': failed_files
-    }
+
+_last_progress_print = 0.0
+
+
+def print_placement_progress(stats: Dict[str, float]):
+    """在同一行显示复制进度，每0.5秒最多刷新一次"""
+    global _last_progress_print
+    now = time.monotonic()
+    if now - _last_progress_print < 0.5 and stats['bytes'] < stats['bytes_total']:
+        return
+    _last_progress_print = now
+    print(f"\r  进度: {stats['bytes'] / 1048576:.1f} / {stats['bytes_total'] / 1048576:.1f} MB，"
+          f"{stats['files']} / {stats['files_total']} 个文件，{stats['bytes_per_second'] / 1048576:.1f} MB/s",
+          end='', flush=True)
 
 
 def main():
@@ -97,6 +74,7 @@ def main():
     
     # 解析分类路径映射
     category_paths = parse_category_paths(config)
+    placement_mode = get_placement_mode(config)
     if category_paths:
         print("检测到自定义分类路径:")
         for category, path in category_paths.items():
@@ -105,15 +83,20 @@ def main():
     # 2. 获取文件列表
     print("\n[2/4] 扫描文件...")
     source_folder = config['PATHS']['source_folder']
-    files = get_files(source_folder)
-    
-    if not files:
-        print(f"警告: 在 {source_folder} 中没有找到文件")
-        sys.exit(0)
-    
-    print(f"找到 {len(files)} 个文件:")
-    for i, file in enumerate(files, 1):
-        print(f"  {i:2d}. {file}")
+    scan_options = get_scan_options(config)
+    scan_index = get_scan_index(config)
+    os.makedirs(source_folder, exist_ok=True)
+    if scan_index:
+        # 只重新列出有变化的目录，已整理过的文件不再重新分类
+        summary = scan_index.rescan(source_folder, full='--full-scan' in sys.argv, **scan_options)
+        print(f"扫描索引: 新增 {summary['new']} 个，修改 {summary['modified']} 个，消失 {summary['removed']} 个，"
+              f"跳过未变化的目录 {summary['skipped_dirs']} 个")
+        entries = scan_index.queued_files(include_classified=True)
+        chunk_size = None
+    else:
+        # 不使用扫描索引时边扫描边分类：每扫描到一块文件就查询缓存、本地分类，攒够一个批次立即发送
+        entries = iter_files(source_folder, **scan_options)
+        chunk_size = max(1, config['SETTINGS'].getint('scan_chunk_files', fallback=256))
     
     # 3. 调用AI进行分类
     print("\n[3/4] AI智能分类中...")
@@ -121,33 +104,152 @@ def main():
         # 构建分类标签
         categories = [cat.strip() for cat in config['CLASSIFICATION']['categories'].split(',')]
         
-        # 调用AI API（仅基于文件名）
-        response = call_ai_api(
-            files,
-            categories,
-            config['CLASSIFICATION'].get('category_descriptions', ''),
-            config['API']
-        )
+        category_descriptions = config['CLASSIFICATION'].get('category_descriptions', '')
+        model = config['API'].get('model', 'deepseek-chat')
         
-        # 解析AI响应
-        classifications = parse_ai_response(response, len(files), len(categories))
+        # 先查询缓存，再运行本地规则等阶段，都没有结果的文件才需要调用AI
+        cache = load_cache(config)
+        category_key = make_category_key(categories, category_descriptions)
+        rule_classifier = RuleClassifier.from_config(config, categories)
+        learned_classifier = LearnedClassifier.from_config(config, categories)
+        neighbor_index = NeighborIndex.from_config(config, categories)
+        local_stages = [stage for stage in [rule_classifier, learned_classifier, neighbor_index] if stage]
+        cluster_filenames = config['SETTINGS'].getboolean('cluster_filenames', fallback=True)
         
-        if not classifications:
-            print("错误: AI返回的分类结果为空")
-            sys.exit(1)
+        files = []
+        classifications = []
+        cached, local, stored = {}, {}, {}
+        local_hits = {}
+        cluster_members = {}
+        pending = []
         
-        print(f"AI分类完成，收到 {len(classifications)} 个分类结果")
+        def prepare(chunk):
+            """处理一块刚扫描到的文件，返回需要发送给AI的代表文件下标"""
+            classifications.extend([None] * len(chunk))
+            chunk_files = [files[i] for i in chunk]
+            if cache:
+                hits, missing = cache.split_cached(chunk_files, category_key, model)
+                chunk_cached = {chunk[j]: category_idx for j, category_idx in hits.items()}
+                chunk_pending = [chunk[j] for j in missing]
+            else:
+                chunk_cached, chunk_pending = {}, list(chunk)
+            cached.update(chunk_cached)
+            
+            # 扫描索引中已分类未整理的文件沿用上次的分类
+            chunk_stored = {}
+            if scan_index:
+                chunk_stored = {chunk[j]: category_idx
+                                for j, category_idx in scan_index.stored_categories(chunk_files, categories).items()}
+                chunk_pending = [i for i in chunk_pending if i not in chunk_stored]
+                stored.update(chunk_stored)
+            
+            chunk_local, chunk_pending, chunk_hits = run_local_stages(local_stages, files, chunk_pending)
+            local.update(chunk_local)
+            for stage_name, count in chunk_hits.items():
+                local_hits[stage_name] = local_hits.get(stage_name, 0) + count
+            for i, category_idx in list(chunk_cached.items()) + list(chunk_stored.items()) + list(chunk_local.items()):
+                classifications[i] = category_idx
+            
+            # 近似重复的文件名只发送一个代表文件，结果分发给整簇（在每块文件内聚类）
+            if cluster_filenames:
+                chunk_pending, members = group_clusters(files, chunk_pending)
+                cluster_members.update(members)
+            pending.extend(chunk_pending)
+            return chunk_pending
+        
+        planner = BatchPlanner.from_config(config, categories, category_descriptions)
+        
+        def process_batch(batch_indices):
+            batch_files = [files[i] for i in batch_indices]
+            started_at = time.monotonic()
+            try:
+                # 调用AI API（仅基于文件名），缺失的文件会单独重新查询
+                batch_classifications, failed = classify_batch(
+                    batch_files,
+                    categories,
+                    category_descriptions,
+                    config['API'],
+                    config['SETTINGS'],
+                    max_tokens=planner.max_tokens_for(len(batch_files))
+                )
+            except Exception as e:
+                print(f"批次处理失败（{len(batch_files)} 个文件）: {e}")
+                return {}, None, len(batch_files)
+            
+            return batch_classifications, time.monotonic() - started_at, failed
+        
+        def on_batch_done(batch_indices, batch_classifications):
+            for j, category_idx in batch_classifications.items():
+                for i in cluster_members.get(batch_indices[j], [batch_indices[j]]):
+                    classifications[i] = category_idx
+                    if cache:
+                        cache.put(files[i], category_key, model, category_idx)
+            print(f"  批次完成: {len(batch_indices)} 个文件，得到 {len(batch_classifications)} 个结果")
+        
+        max_concurrency = config['SETTINGS'].getint('max_concurrency', fallback=4)
+        dispatch_batches(planner, stream_pending(entries, files, prepare, chunk_size), files,
+                         process_batch, on_batch_done, max_concurrency)
+        
+        if not files:
+            print(f"警告: 在 {source_folder} 中没有找到文件")
+            sys.exit(0)
+        
+        print(f"找到 {len(files)} 个文件:")
+        for i, file in enumerate(files, 1):
+            print(f"  {i:2d}. {file}")
+        if cache:
+            print(f"缓存命中 {len(cached)} 个文件")
+        if stored:
+            print(f"沿用扫描索引中的分类 {len(stored)} 个文件")
+        for stage_name, count in local_hits.items():
+            print(f"本地分类（{stage_name}）: {count} 个文件")
+        clustered = sum(len(m) - 1 for m in cluster_members.values())
+        if clustered:
+            print(f"文件名聚类: {len(pending)} 个代表文件，省去 {clustered} 个相似文件的AI调用")
+        
+        if pending:
+            if cache:
+                cache.save()
+            
+            if all(category_idx is None for category_idx in classifications):
+                print("错误: AI返回的分类结果为空")
+                sys.exit(1)
+        
+        # 没有得到结果的文件不参与整理
+        classifications = [UNRESOLVED if category_idx is None else category_idx for category_idx in classifications]
+        unresolved_count = classifications.count(UNRESOLVED)
+        if unresolved_count:
+            print(f"警告: {unresolved_count} 个文件未得到分类，不参与整理")
+        if scan_index:
+            scan_index.mark_classified({
+                filename: categories[category_idx]
+                for filename, category_idx in zip(files, classifications)
+                if category_idx >= 0
+            })
+        
+        print(f"AI分类完成，共 {len(files)} 个文件（缓存 {len(cached)} 个，沿用 {len(stored)} 个，本地 {len(local)} 个，AI {len(pending)} 个）")
         
         # 4. 执行分类操作
         print("\n[4/4] 正在分类文件...")
-        result = classify_files(
-            files,
-            classifications,
-            categories,
-            config['PATHS']['source_folder'],
-            config['PATHS']['target_base_folder'],
-            category_paths
-        )
+        # 操作写入日志，中断后可用 python journal.py resume/rollback <运行ID> 继续或撤回
+        journal = open_journal(config, placement_mode, config['PATHS']['source_folder'],
+                               config['PATHS']['target_base_folder'])
+        try:
+            result = classify_files(
+                files,
+                classifications,
+                categories,
+                config['PATHS']['source_folder'],
+                config['PATHS']['target_base_folder'],
+                category_paths,
+                on_progress=print_placement_progress,
+                journal=journal,
+                **get_placement_options(config)
+            )
+        finally:
+            journal.close()
+        print()
+        print(f"运行ID: {journal.run_id}")
         
         # 显示结果统计
         print(f"\n{'='*60}")
@@ -156,6 +258,16 @@ def main():
         print(f"总文件数: {len(files)}")
         print(f"成功分类: {result['success_count']}")
         print(f"失败/跳过: {result['failed_count']}")
+        if cache:
+            print(f"缓存命中: {len(cached)}  未命中: {len(pending)}")
+        if rule_classifier and rule_classifier.hits:
+            print("规则命中:")
+            for rule, count in rule_classifier.hits.most_common():
+                print(f"  {rule}: {count}")
+        stats = get_connection_stats()
+        if stats['requests']:
+            print(f"API请求: {stats['requests']} 次，新建连接 {stats['connections_opened']} 个，"
+                  f"平均延迟 {stats['avg_latency_ms']} ms")
         
         if result['failed_files']:
             print("\n以下文件处理失败:")
@@ -192,19 +304,27 @@ def main():
                 
                 if response in ['y', 'yes', '是']:
                     print("已确认分类结果，继续处理...")
+                    # 保存确认的AI分类结果作为本地学习模型的标注数据（本地分类和沿用扫描索引的文件除外）
+                    record_samples(get_data_file(config), [
+                        (filename, categories[category_idx])
+                        for i, (filename, category_idx) in enumerate(zip(files, classifications))
+                        if category_idx >= 0 and i not in local and i not in stored
+                    ])
+                    if scan_index:
+                        scan_index.set_status(result['file_target_paths'], STATUS_EXECUTED)
                     break
                     
                 elif response in ['n', 'no', '否']:
                     # 执行撤回操作
                     print("\n执行撤回操作...")
-                    rollback_result = rollback_classification(result['file_target_paths'])
+                    rollback_result = rollback_run(get_journal_dir(config), journal.run_id)
                     
                     print(f"\n撤回完成:")
-                    print(f"  已删除文件: {rollback_result['deleted_count']}")
-                    print(f"  删除失败: {rollback_result['failed_to_delete_count']}")
+                    print(f"  已撤回文件: {rollback_result['deleted_count']}")
+                    print(f"  撤回失败: {rollback_result['failed_to_delete_count']}")
                     
                     if rollback_result['failed_files']:
-                        print("\n以下文件删除失败:")
+                        print("\n以下文件撤回失败:")
                         for file in rollback_result['failed_files']:
                             print(f"  - {file}")
                     
@@ -215,7 +335,7 @@ def main():
                     print("\n详细分类结果:")
                     print("-" * 40)
                     for i, (filename, category_idx) in enumerate(zip(files, classifications)):
-                        if i < len(classifications):
+                        if i < len(classifications) and category_idx >= 0:
                             category = categories[category_idx]
                             target_path = result['file_target_paths'].get(filename, "未知路径")
                             print(f"  {filename} → {category} ({os.path.dirname(target_path)})")
@@ -230,7 +350,11 @@ def main():
         print("文件清理选项:")
         print("=" * 60)
         
-        if result['success_count'] > 0:
+        if placement_mode == 'move':
+            print("移动模式下已分类的文件已移出源文件夹，无需清理")
+        elif placement_mode == 'symlink':
+            print("符号链接模式下源文件必须保留，跳过清理")
+        elif result['success_count'] > 0:
             print(f"检测到 {result['success_count']} 个文件已成功分类")
             
             # 获取用户确认
@@ -238,24 +362,18 @@ def main():
                 response = input("\n是否要删除源文件夹中已分类的文件？(y/n): ").strip().lower()
                 if response in ['y', 'yes', '是']:
                     # 清理源文件
-                    cleanup_result = cleanup_source_files(
-                        files,
-                        classifications,
-                        categories,
-                        config['PATHS']['source_folder'],
-                        config['PATHS']['target_base_folder'],
-                        result['category_stats'],
-                        category_paths
-                    )
+                    cleanup_result = cleanup_run(get_journal_dir(config), journal.run_id,
+                                                 get_cleanup_verify(config),
+                                                 config['SETTINGS'].getint('placement_workers', fallback=8))
                     
                     print(f"\n清理完成:")
                     print(f"  已删除文件: {cleanup_result['deleted_count']}")
                     print(f"  删除失败: {cleanup_result['failed_to_delete_count']}")
                     
                     if cleanup_result['failed_files']:
-                        print("\n以下文件删除失败:")
+                        print("\n以下文件校验未通过或删除失败，源文件已保留:")
                         for file in cleanup_result['failed_files']:
-                            print(f"  - {file}")
+                            print(f"  - {file['file']}: {file['error']}")
                     break
                     
                 elif response in ['n', 'no', '否']:
@@ -270,7 +388,7 @@ def main():
         print(f"\n{'='*60}")
         print("最终统计:")
         print("=" * 60)
-        remaining_files = get_files(source_folder)
+        remaining_files = get_files(source_folder, **scan_options)
         print(f"源文件夹剩余文件数: {len(remaining_files)}")
         
         if len(remaining_files) > 0:
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+文件名聚类模块
+去掉数字、版本后缀和副本标记后文件名相同的文件归为一簇，
+每簇只把一个代表文件发给AI，结果再分发给簇内所有文件
+"""
+
+import os
+import re
+from typing import List, Dict, Tuple
+
+from classify_cache import normalize_filename
+
+
+# 文件名末尾的副本标记，如 " (1)"、" - 副本"、"_copy2"
+COPY_MARKER = re.compile(r'(\s*[(（]\d+[)）]|\s*-?\s*副本\s*\d*|[\s_-]*copy\s*\d*)$')
+# 文件名末尾的版本后缀，如 "_v2"、" v1.3"、"-final"、"最终版"
+VERSION_SUFFIX = re.compile(r'([\s_-]*(v|ver|version)\s*\d+(\.\d+)*|[\s_-]*(final|最终版|修订版|定稿))$')
+DIGITS = re.compile(r'\d+')
+SEPARATORS = re.compile(r'[\s_\-.]+')
+
+# 去掉数字和分隔符后至少要剩下这么多字符才参与聚类，避免 "1.pdf"、"2.pdf" 这类名字被归为一簇
+MIN_KEY_CHARS = 2
+
+
+def cluster_key(filename: str) -> str:
+    """计算文件名的聚类键：去掉副本标记和版本后缀，数字统一替换为 #"""
+    stem, ext = os.path.splitext(normalize_filename(filename))
+
+    previous = None
+    while stem != previous:
+        previous = stem
+        stem = COPY_MARKER.sub('', stem)
+        stem = VERSION_SUFFIX.sub('', stem)
+
+    stem = SEPARATORS.sub(' ', DIGITS.sub('#', stem)).strip()
+    return f"{stem}{ext}"
+
+
+def group_clusters(filenames: List[str], indices: List[int]) -> Tuple[List[int], Dict[int, List[int]]]:
+    """把指定下标的文件聚类
+
+    返回 (每簇的代表文件下标, 代表文件下标 -> 簇内所有文件下标)；
+    特征太少的文件名各自单独成簇
+    """
+    clusters = {}
+    for i in indices:
+        key = cluster_key(filenames[i])
+        if len(key.replace('#', '').replace(' ', '')) - len(os.path.splitext(key)[1]) < MIN_KEY_CHARS:
+            key = f"\0{i}"
+        clusters.setdefault(key, []).append(i)
+
+    members = {cluster[0]: cluster for cluster in clusters.values()}
+    return list(members), members
+
+
+def find_inconsistent_clusters(filenames: List[str],
+                               classifications: List[int]) -> List[List[int]]:
+    """找出簇内文件分类不一致的簇（通常说明用户调整过其中的部分文件）"""
+    _, members = group_clusters(filenames, list(range(len(filenames))))
+    return [
+        cluster for cluster in members.values()
+        if len(cluster) > 1 and len({classifications[i] for i in cluster}) > 1
+    ]
@@ -0,0 +1,601 @@
+#!/usr/bin/env python3
+"""
+操作日志模块
+每次整理（复制/移动/链接）对应一次运行，运行中的计划、开始、完成、清理和撤回都追加写入
+journal_dir/运行ID.jsonl。计划在放置开始前同步到磁盘（预写日志），之后的记录按批同步；
+服务重启或程序崩溃后可以根据日志继续未完成的运行，或按运行ID撤回。
+执行、继续、撤回和清理期间独占锁定日志文件，同一运行同时只能有一个操作
+
+用法: python journal.py list | show <运行ID> | resume <运行ID> | rollback <运行ID>
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import configparser
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # 没有 flock 的系统（Windows）只在本进程内防止同一运行被同时操作
+    fcntl = None
+
+from placement import (
+    PlacementExecutor, PlacementTask, files_match, discard_replaced, get_placement_options, verify_placement,
+    VERDICT_OK, VERDICT_SOURCE_MISSING, VERDICT_DELETED, VERDICT_ERROR,
+    find_replaced, OP_COPY, OP_MOVE, OP_HARDLINK, OP_SYMLINK, OP_DUPLICATE, OP_DEDUPED
+)
+from placement_plan import (
+    PlacementPlan, REMOVABLE_OPERATIONS, ROW_STATUS_NAMES,
+    ROW_PENDING, ROW_PLACED, ROW_FAILED, ROW_CLEANED, ROW_UNDONE
+)
+
+
+# 运行状态
+RUN_INCOMPLETE = 'incomplete'      # 没有结束记录，也没有正在进行的操作：执行中途被中断
+RUN_RUNNING = 'running'            # 日志正被锁定：正在执行、继续、撤回或清理（只在运行历史中显示）
+RUN_COMPLETED = 'completed'
+RUN_ROLLED_BACK = 'rolled_back'
+
+# 没有 flock 时本进程中已锁定的日志文件
+_held_runs = set()
+_held_runs_lock = threading.Lock()
+
+
+class RunLockedError(RuntimeError):
+    """运行正在被其他操作使用"""
+
+def get_journal_dir(config: configparser.ConfigParser) -> str:
+    return config['SETTINGS'].get('journal_dir', '.journal').strip() or '.journal'
+
+
+def open_journal(config: configparser.ConfigParser, mode: str, source_folder: str,
+                 target_base_folder: str) -> 'OperationJournal':
+    """按配置开始一次新的运行"""
+    settings = config['SETTINGS']
+    return OperationJournal.create(
+        get_journal_dir(config), mode, source_folder, target_base_folder,
+        fsync_batch=settings.getint('journal_fsync_batch', fallback=64),
+        fsync_interval=settings.getfloat('journal_fsync_interval', fallback=1.0)
+    )
+
+
+def new_run_id() -> str:
+    """按时间排序的运行ID，如 20240301-153012-1a2b"""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:4]}"
+
+
+class OperationJournal:
+    """单次运行的追加写日志
+
+    每条记录一行 JSON；sync=True 的记录立即同步到磁盘，其余记录每 fsync_batch 条或
+    每 fsync_interval 秒同步一次。丢失的完成记录在继续或撤回时根据文件系统的实际状态补齐。
+    打开期间独占锁定日志文件（flock），运行已被锁定时抛出 RunLockedError
+    """
+
+    def __init__(self, path: str, fsync_batch: int = 64, fsync_interval: float = 1.0):
+        self.path = path
+        self.run_id = os.path.splitext(os.path.basename(path))[0]
+        self.fsync_batch = max(1, fsync_batch)
+        self.fsync_interval = fsync_interval
+        self._file = open(path, 'a', encoding='utf-8')
+        self._pending = 0
+        self._last_sync = time.time()
+        self._lock = threading.Lock()
+        self._targets = set()   # 本次打开后开始放置的目标路径，提交时删除遗留的 .part 文件
+        try:
+            self._acquire()
+        except RunLockedError:
+            self._file.close()
+            raise
+
+    def _acquire(self):
+        # flock 跟随打开的文件，同一进程中另一次打开同样会冲突；文件关闭（或进程退出）时自动释放
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                raise RunLockedError(f"运行 {self.run_id} 正在执行、继续、撤回或清理中，请稍后再试")
+            return
+        key = os.path.abspath(self.path)
+        with _held_runs_lock:
+            if key in _held_runs:
+                raise RunLockedError(f"运行 {self.run_id} 正在执行、继续、撤回或清理中，请稍后再试")
+            _held_runs.add(key)
+
+    @classmethod
+    def create(cls, journal_dir: str, mode: str, source_folder: str, target_base_folder: str,
+               **options) -> 'OperationJournal':
+        """开始一次新的运行"""
+        os.makedirs(journal_dir, exist_ok=True)
+        journal = cls(os.path.join(journal_dir, f"{new_run_id()}.jsonl"), **options)
+        journal.append({
+            'type': 'begin',
+            'mode': mode,
+            'source_folder': os.path.abspath(source_folder),
+            'target_base_folder': os.path.abspath(target_base_folder)
+        }, sync=True)
+        return journal
+
+    @classmethod
+    def open(cls, journal_dir: str, run_id: str, **options) -> 'OperationJournal':
+        """继续写入已有运行的日志"""
+        path = run_path(journal_dir, run_id)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"运行 {run_id} 不存在")
+        return cls(path, **options)
+
+    def append(self, record: Dict[str, Any], sync: bool = False):
+        record.setdefault('time', time.time())
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._pending += 1
+            if sync or self._pending >= self.fsync_batch or time.time() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.time()
+
+    def sync(self):
+        with self._lock:
+            if self._pending:
+                self._sync()
+
+    def close(self):
+        """同步并关闭日志，释放锁"""
+        with self._lock:
+            if not self._file.closed:
+                try:
+                    self._sync()
+                finally:
+                    self._file.close()
+                    with _held_runs_lock:
+                        _held_runs.discard(os.path.abspath(self.path))
+
+    # 以下为 PlacementExecutor 的回调
+
+    def plan(self, plan: PlacementPlan):
+        """记录计划中所有等待放置的文件，并在放置开始前同步到磁盘"""
+        with self._lock:
+            for row in plan.select(ROW_PENDING):
+                self._file.write(json.dumps({
+                    'type': 'plan',
+                    'file': plan.filenames[row],
+                    'source': plan.sources[row],
+                    'target': plan.targets[row],
+                    'size': plan.sizes[row],
+                    'category': plan.category(row),
+                    'source_dev': plan.source_devs[row],
+                    'target_dev': plan.target_devs[row]
+                }, ensure_ascii=False) + '\n')
+            self._sync()
+
+    def started(self, task: PlacementTask, target_path: str, operation: Optional[str]):
+        with self._lock:
+            self._targets.add(os.path.abspath(target_path))
+        self.append({'type': 'start', 'file': task.filename, 'target': os.path.abspath(target_path),
+                     'op': operation})
+
+    def finished(self, task: PlacementTask, result: Optional[Tuple[str, Optional[str]]],
+                 error: Optional[Exception]):
+        if error is not None:
+            self.append({'type': 'failed', 'file': task.filename, 'error': str(error)})
+            return
+        operation, target_path = result
+        self.append({'type': 'done', 'file': task.filename, 'op': operation,
+                     'target': os.path.abspath(target_path) if target_path else None})
+
+    def commit(self, summary: Dict[str, Any] = None, target_paths: List[str] = ()):
+        """运行正常结束；结束后不会再续传，删除放置失败的文件留下的 .part 文件
+
+        target_paths 为本次打开之前（如上次中断时）开始放置的目标路径
+        """
+        self.append({'type': 'commit', 'summary': summary or {}}, sync=True)
+        with self._lock:
+            targets = self._targets | set(target_paths)
+        remove_part_files(targets)
+
+
+def remove_part_files(target_paths) -> int:
+    """删除目标路径对应的 .part 文件（大文件分块复制中断时留下），返回删除的数量"""
+    removed = 0
+    for target_path in target_paths:
+        part_path = f"{target_path}.part"
+        try:
+            if os.path.isfile(part_path):
+                os.remove(part_path)
+                removed += 1
+        except OSError as e:
+            print(f"警告: 无法删除 {part_path}: {e}")
+    return removed
+
+
+def run_path(journal_dir: str, run_id: str) -> str:
+    if os.path.basename(run_id) != run_id or not run_id:
+        raise ValueError(f"无效的运行ID: {run_id}")
+    return os.path.join(journal_dir, f"{run_id}.jsonl")
+
+
+def run_in_use(journal_dir: str, run_id: str) -> bool:
+    """运行的日志是否正被锁定（本进程或其他进程正在操作这个运行）"""
+    path = run_path(journal_dir, run_id)
+    if fcntl is None:
+        with _held_runs_lock:
+            return os.path.abspath(path) in _held_runs
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    return False
+
+
+def load_run(journal_dir: str, run_id: str) -> Dict[str, Any]:
+    """重放日志，返回运行的当前状态
+
+    plan 为按日志重建的 PlacementPlan（行状态、实际操作和目标路径）；
+    started 为 文件名 -> 开始时确定的目标路径和操作，只在补齐丢失的完成记录时使用
+    """
+    state = {
+        'run_id': run_id, 'status': RUN_INCOMPLETE, 'mode': 'copy',
+        'source_folder': None, 'target_base_folder': None, 'started_at': None, 'finished_at': None,
+        'plan': PlacementPlan(), 'started': {}, 'summary': {}
+    }
+    plan = state['plan']
+    path = run_path(journal_dir, run_id)
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 崩溃时可能只写了半行
+                continue
+            kind = record.get('type')
+            row = plan.row(record['file']) if 'file' in record else None
+            if kind == 'begin':
+                state.update(mode=record['mode'], source_folder=record['source_folder'],
+                             target_base_folder=record['target_base_folder'], started_at=record['time'])
+            elif kind == 'plan':
+                plan.add(record['file'], record['source'], record['target'], record['size'], record['category'],
+                         record.get('source_dev', 0), record.get('target_dev', 0))
+            elif row is None:
+                if kind == 'commit':
+                    state.update(status=RUN_COMPLETED, finished_at=record['time'],
+                                 summary=record.get('summary', {}))
+                elif kind == 'rolled_back':
+                    state.update(status=RUN_ROLLED_BACK, finished_at=record['time'])
+            elif kind == 'start':
+                state['started'][record['file']] = record
+            elif kind == 'done':
+                plan.record(record['file'], record['op'], record['target'])
+            elif kind == 'failed':
+                plan.fail(record['file'], record['error'])
+            elif kind == 'delete':
+                plan.mark([row], ROW_CLEANED)
+            elif kind == 'undo':
+                plan.mark([row], ROW_UNDONE)
+    return state
+
+
+def list_runs(journal_dir: str) -> List[Dict[str, Any]]:
+    """运行历史，最新的在前"""
+    if not os.path.isdir(journal_dir):
+        return []
+    runs = []
+    for name in sorted(os.listdir(journal_dir), reverse=True):
+        if not name.endswith('.jsonl'):
+            continue
+        state = load_run(journal_dir, name[:-len('.jsonl')])
+        status = state['status']
+        if status == RUN_INCOMPLETE and run_in_use(journal_dir, state['run_id']):
+            status = RUN_RUNNING
+        runs.append({
+            'run_id': state['run_id'],
+            'status': status,
+            'mode': state['mode'],
+            'source_folder': state['source_folder'],
+            'started_at': state['started_at'],
+            'finished_at': state['finished_at'],
+            'files': len(state['plan']),
+            'counts': state['plan'].counts()
+        })
+    return runs
+
+
+def _recover(state: Dict[str, Any], row: int) -> Optional[Tuple[str, str]]:
+    """完成记录丢失时根据文件系统判断文件是否已经放置，返回 (操作, 目标路径)，未放置返回 None
+
+    没有开始记录时无法确定目标是本次放置的，内容相同的目标按 duplicate 处理（撤回时保留）
+    """
+    plan = state['plan']
+    start = state['started'].get(plan.filenames[row])
+    source_path = plan.sources[row]
+    target_path = start['target'] if start else plan.targets[row]
+
+    if start and start.get('op') == OP_DEDUPED:
+        return (OP_DEDUPED, target_path) if not os.path.exists(source_path) else None
+    if not os.path.lexists(target_path):
+        return None
+
+    source_exists = os.path.exists(source_path)
+    if os.path.islink(target_path):
+        if source_exists and os.path.exists(target_path) and os.path.samefile(target_path, source_path):
+            return OP_SYMLINK, target_path
+        return None
+    if not source_exists:
+        if state['mode'] == 'move' and os.path.getsize(target_path) == plan.sizes[row]:
+            return OP_MOVE, target_path
+        return None
+    if os.path.samefile(target_path, source_path):
+        return OP_HARDLINK, target_path
+    if files_match(source_path, target_path):
+        return (OP_COPY if start else OP_DUPLICATE), target_path
+    return None
+
+
+def _discard_partial(state: Dict[str, Any], row: int, keep_part: bool = False):
+    """删除中断时写了一半的目标文件，恢复被替换的旧文件；keep_part 为假时同时删除 .part 文件"""
+    start = state['started'].get(state['plan'].filenames[row])
+    if not start:
+        return
+    target_path = start['target']
+    if not keep_part and os.path.exists(f"{target_path}.part"):
+        os.remove(f"{target_path}.part")
+    if os.path.lexists(target_path) and not os.path.islink(target_path):
+        os.remove(target_path)
+    backup = find_replaced(target_path, state['run_id'])
+    if backup and not os.path.lexists(target_path):
+        os.replace(backup, target_path)
+
+
+def _reconcile(state: Dict[str, Any], journal: OperationJournal) -> List[int]:
+    """补齐丢失的完成记录，返回仍未放置的行"""
+    plan = state['plan']
+    remaining = []
+    for row in plan.select(ROW_PENDING, ROW_FAILED):
+        recovered = _recover(state, row)
+        if recovered is None:
+            remaining.append(row)
+            continue
+        operation, target_path = recovered
+        if state['mode'] == 'move' and operation == OP_COPY:
+            # 跨设备移动已复制完成但源文件还没删除
+            os.remove(plan.sources[row])
+            operation = OP_MOVE
+        plan.record(plan.filenames[row], operation, target_path)
+        journal.append({'type': 'done', 'file': plan.filenames[row], 'op': operation, 'target': target_path,
+                        'recovered': True})
+    journal.sync()
+    return remaining
+
+
+def resume_run(journal_dir: str, run_id: str, on_progress=None, **executor_options) -> Dict[str, Any]:
+    """继续中断的运行：补齐已完成的文件，重新放置其余文件（大文件从 .part 断点续传）
+
+    executor_options 见 PlacementExecutor，放置方式沿用运行开始时的设置；
+    运行正在被其他操作使用时抛出 RunLockedError
+    """
+    # 先锁定日志再读取，读取到的状态在整个操作期间不会被其他操作改变
+    journal = OperationJournal.open(journal_dir, run_id)
+    try:
+        state = load_run(journal_dir, run_id)
+        if state['status'] != RUN_INCOMPLETE:
+            raise ValueError(f"运行 {run_id} 已{'完成' if state['status'] == RUN_COMPLETED else '撤回'}，无需继续")
+        plan = state['plan']
+        unfinished = len(plan.select(ROW_PENDING, ROW_FAILED))
+        remaining = _reconcile(state, journal)
+        rows = []
+        for row in remaining:
+            filename = plan.filenames[row]
+            try:
+                stat = os.stat(plan.sources[row])
+            except OSError:
+                plan.fail(filename, '源文件不存在')
+                journal.append({'type': 'failed', 'file': filename, 'error': '源文件不存在'})
+                continue
+            # 上次写了一半的目标文件删除后在原位置重新放置，.part 文件保留用于续传
+            _discard_partial(state, row, keep_part=True)
+            start = state['started'].get(filename)
+            if start:
+                plan.targets[row] = start['target']
+            os.makedirs(os.path.dirname(plan.targets[row]), exist_ok=True)
+            plan.sizes[row] = stat.st_size
+            plan.source_devs[row] = stat.st_dev
+            plan.target_devs[row] = os.stat(os.path.dirname(plan.targets[row])).st_dev
+            rows.append(row)
+
+        executor_options['mode'] = state['mode']
+        operations, errors, throughput = PlacementExecutor(run_id=run_id, **executor_options).run(
+            plan.tasks(rows), on_done=journal.finished, on_progress=on_progress, on_start=journal.started)
+        for filename, (operation, target_path) in operations.items():
+            plan.record(filename, operation, target_path)
+        for filename, error in errors.items():
+            plan.fail(filename, error)
+        failed_rows = plan.select(ROW_FAILED)
+        journal.commit({'resumed': True, 'placed': len(operations), 'failed': len(failed_rows)},
+                       target_paths=[start['target'] for start in state['started'].values()])
+    finally:
+        journal.close()
+
+    return {
+        'run_id': run_id,
+        'source_folder': state['source_folder'],
+        'recovered': unfinished - len(remaining),
+        'placed': len(operations),
+        'failed': len(failed_rows),
+        'failed_files': [plan.filenames[row] for row in failed_rows],
+        'file_target_paths': plan.target_paths(),
+        'throughput': throughput
+    }
+
+
+def rollback_run(journal_dir: str, run_id: str) -> Dict[str, Any]:
+    """按运行ID撤回：已放置的文件按记录的操作撤回，中断时写了一半的文件直接删除
+
+    运行正在被其他操作使用（如仍在执行）时抛出 RunLockedError
+    """
+    from utils import rollback_classification
+
+    journal = OperationJournal.open(journal_dir, run_id)
+    try:
+        state = load_run(journal_dir, run_id)
+        if state['status'] == RUN_ROLLED_BACK:
+            raise ValueError(f"运行 {run_id} 已经撤回")
+        plan = state['plan']
+        for row in _reconcile(state, journal):
+            _discard_partial(state, row)
+        rows = plan.select(ROW_PLACED, ROW_CLEANED)
+        result = rollback_classification(plan, rows, journal=journal)
+        # 撤回后不会再续传，删除计划中所有目标位置遗留的 .part 文件
+        remove_part_files({start['target'] for start in state['started'].values()}
+                          | {os.path.abspath(target) for target in plan.targets if target})
+        if not result['failed_files']:
+            journal.append({'type': 'rolled_back'}, sync=True)
+    finally:
+        journal.close()
+
+    result['run_id'] = run_id
+    result['source_folder'] = state['source_folder']
+    result['files'] = [plan.filenames[row] for row in rows]
+    return result
+
+
+def cleanup_run(journal_dir: str, run_id: str, verify: str = 'fast', max_workers: int = 8) -> Dict[str, Any]:
+    """删除运行中已复制或已硬链接到目标位置的源文件
+
+    只处理计划中已放置的行，移动和符号链接的源文件不删除。先在线程池中逐个校验目标与源文件
+    （verify 见 verify_placement），全部校验完成后统一删除通过校验的源文件；
+    返回的 verdicts 为每个文件的结果：deleted / source_missing / mismatch / target_missing / error；
+    运行正在被其他操作使用时抛出 RunLockedError
+    """
+    verdicts = []
+    deleted_count = 0
+    failed_files = []
+    journal = OperationJournal.open(journal_dir, run_id)
+    try:
+        state = load_run(journal_dir, run_id)
+        if state['status'] == RUN_ROLLED_BACK:
+            raise ValueError(f"运行 {run_id} 已经撤回")
+        plan = state['plan']
+
+        print(f"\n[清理阶段] 正在校验（{verify}）并清理源文件夹中的已分类文件...")
+
+        def check(row):
+            try:
+                return row, verify_placement(plan.sources[row], plan.targets[row], plan.operations[row], verify)
+            except OSError as e:
+                return row, (VERDICT_ERROR, str(e))
+
+        rows = plan.select(ROW_PLACED, operations=REMOVABLE_OPERATIONS)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            checked = list(executor.map(check, rows))
+
+        for row, (verdict, detail) in checked:
+            filename = plan.filenames[row]
+            if verdict == VERDICT_OK:
+                try:
+                    os.remove(plan.sources[row])
+                    discard_replaced(plan.targets[row], run_id)
+                    verdict = VERDICT_DELETED
+                    deleted_count += 1
+                except OSError as e:
+                    verdict, detail = VERDICT_ERROR, str(e)
+            if verdict in (VERDICT_DELETED, VERDICT_SOURCE_MISSING):
+                plan.mark([row], ROW_CLEANED)
+                journal.append({'type': 'delete', 'file': filename, 'verdict': verdict})
+            else:
+                print(f"  ⚠ 保留 {filename}: {detail}")
+                failed_files.append({'file': filename, 'error': detail})
+            verdicts.append({'file': filename, 'verdict': verdict, 'detail': detail})
+    finally:
+        journal.close()
+
+    print(f"  ✓ 已删除 {deleted_count} 个源文件，校验未通过 {len(failed_files)} 个")
+    return {
+        'deleted_count': deleted_count,
+        'failed_to_delete_count': len(failed_files),
+        'failed_files': failed_files,
+        'verdicts': verdicts
+    }
+
+
+def format_time(timestamp: Optional[float]) -> str:
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)) if timestamp else '-'
+
+
+def main():
+    from utils import load_config
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ('list', 'show', 'resume', 'rollback') or (
+            sys.argv[1] != 'list' and len(sys.argv) < 3):
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+
+    config = load_config()
+    if not config:
+        sys.exit(1)
+    journal_dir = get_journal_dir(config)
+    command = sys.argv[1]
+
+    if command == 'list':
+        runs = list_runs(journal_dir)
+        if not runs:
+            print("没有运行记录")
+        for run in runs:
+            counts = run['counts']
+            print(f"{run['run_id']}  {format_time(run['started_at'])}  {run['mode']:<8}{run['status']:<12}"
+                  f"已放置 {counts['placed'] + counts['cleaned']}/{run['files']}，失败 {counts['failed']}，"
+                  f"未完成 {counts['pending']}，已清理 {counts['cleaned']}，已撤回 {counts['undone']}")
+        return
+
+    run_id = sys.argv[2]
+    if command == 'show':
+        state = load_run(journal_dir, run_id)
+        print(f"运行 {run_id}: {state['status']}，{state['mode']}，"
+              f"开始 {format_time(state['started_at'])}，结束 {format_time(state['finished_at'])}")
+        plan = state['plan']
+        for row in range(len(plan)):
+            print(f"  {ROW_STATUS_NAMES[plan.status[row]]:<8}{plan.operations[row] or '-':<14}"
+                  f"{plan.filenames[row]} → {plan.targets[row]}")
+        return
+
+    # 放置和撤回后同步扫描索引中的文件状态
+    from scan_index import get_scan_index, STATUS_EXECUTED, STATUS_CLASSIFIED
+    scan_index = get_scan_index(config)
+
+    try:
+        if command == 'resume':
+            options = get_placement_options(config)
+            options.pop('placement_mode')
+            result = resume_run(journal_dir, run_id, **options)
+        else:
+            result = rollback_run(journal_dir, run_id)
+    except (RunLockedError, ValueError, FileNotFoundError) as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+    if command == 'resume':
+        print(f"继续运行完成：补记 {result['recovered']} 个已放置的文件，新放置 {result['placed']} 个，"
+              f"失败 {result['failed']} 个")
+        for filename in result['failed_files']:
+            print(f"  - {filename}")
+        if scan_index:
+            scan_index.set_status(result['file_target_paths'], STATUS_EXECUTED)
+    else:
+        print(f"\n撤回完成：已撤回 {result['deleted_count']} 个文件，失败 {result['failed_to_delete_count']} 个")
+        if scan_index:
+            scan_index.set_status(result['files'], STATUS_CLASSIFIED)
+
+
+if __name__ == "__main__":
+    main()
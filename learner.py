@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+本地学习分类器模块
+把用户的调整和确认过的分类结果保存为标注数据，训练字符n-gram朴素贝叶斯模型；
+置信度足够高的文件直接本地分类，其余文件再交给AI
+
+离线评估: python learner.py --eval [--threshold 0.9]
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import threading
+import configparser
+from collections import Counter, defaultdict
+from typing import List, Dict, Tuple, Optional
+
+from classify_cache import normalize_filename
+
+
+# 用户手动调整的样本比确认的样本更可信
+CORRECTION_WEIGHT = 2.0
+ACCEPTED_WEIGHT = 1.0
+
+_append_lock = threading.Lock()
+
+
+def get_data_file(config: configparser.ConfigParser) -> str:
+    """标注数据文件路径，留空表示不保存标注数据"""
+    return config['SETTINGS'].get('learner_data_file', '.training_data.jsonl').strip()
+
+
+def record_samples(data_file: str, samples: List[Tuple[str, str]], source: str = 'accepted'):
+    """追加标注样本，samples 为 (文件名, 分类标签) 列表，source 为 correction 或 accepted
+
+    accepted 样本只应来自AI的分类结果（本地规则、学习模型和近邻索引的结果不能作为标注，否则模型会强化自己的判断）；
+    已有相同文件名、分类和来源的样本不再重复追加
+    """
+    if not data_file or not samples:
+        return
+    now = time.time()
+    with _append_lock:
+        existing = {(sample.get('filename'), sample.get('category'), sample.get('source'))
+                    for sample in load_samples(data_file)}
+        lines = []
+        for filename, category in dict(samples).items():
+            if (filename, category, source) in existing:
+                continue
+            lines.append(json.dumps({'filename': filename, 'category': category, 'source': source, 'time': now},
+                                    ensure_ascii=False))
+        if lines:
+            with open(data_file, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+
+
+def load_samples(data_file: str) -> List[Dict[str, str]]:
+    """读取全部标注样本，跳过损坏的行"""
+    samples = []
+    if not data_file or not os.path.exists(data_file):
+        return samples
+    with open(data_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                samples.append(json.loads(line))
+            except ValueError:
+                continue
+    return samples
+
+
+def extract_features(filename: str, n_max: int = 3) -> Counter:
+    """提取文件名特征：文件名主体的1~n_max字符n-gram，加上扩展名"""
+    stem, ext = os.path.splitext(normalize_filename(filename))
+    features = Counter()
+    for n in range(1, n_max + 1):
+        for i in range(len(stem) - n + 1):
+            features[stem[i:i + n]] += 1
+    if ext:
+        features[f"ext:{ext}"] += 1
+    return features
+
+
+class NaiveBayesClassifier:
+    """多项式朴素贝叶斯（拉普拉斯平滑）"""
+
+    def __init__(self, category_count: int):
+        self.category_count = category_count
+        self.feature_counts = [defaultdict(float) for _ in range(category_count)]
+        self.feature_totals = [0.0] * category_count
+        self.class_weights = [0.0] * category_count
+        self.vocabulary = set()
+
+    def fit(self, samples: List[Tuple[str, int, float]]):
+        """samples 为 (文件名, 分类索引, 权重) 列表"""
+        for filename, category_idx, weight in samples:
+            self.class_weights[category_idx] += weight
+            for feature, count in extract_features(filename).items():
+                self.feature_counts[category_idx][feature] += count * weight
+                self.feature_totals[category_idx] += count * weight
+                self.vocabulary.add(feature)
+        return self
+
+    def predict(self, filename: str) -> Tuple[int, float]:
+        """返回 (最可能的分类索引, 后验概率)"""
+        total_weight = sum(self.class_weights)
+        features = [(f, c) for f, c in extract_features(filename).items() if f in self.vocabulary]
+        vocabulary_size = len(self.vocabulary)
+        if not features:
+            # 没有任何已知特征时只能依靠先验，不能作为可信结果
+            return max(range(self.category_count), key=lambda k: self.class_weights[k]), 0.0
+
+        scores = []
+        for category_idx in range(self.category_count):
+            if not self.class_weights[category_idx]:
+                scores.append(float('-inf'))
+                continue
+            counts = self.feature_counts[category_idx]
+            denominator = self.feature_totals[category_idx] + vocabulary_size
+            score = math.log(self.class_weights[category_idx] / total_weight)
+            for feature, count in features:
+                score += count * math.log((counts.get(feature, 0.0) + 1) / denominator)
+            scores.append(score)
+
+        best = max(range(self.category_count), key=lambda k: scores[k])
+        # softmax 得到后验概率
+        normalizer = sum(math.exp(score - scores[best]) for score in scores if score != float('-inf'))
+        return best, 1.0 / normalizer
+
+
+def build_training_set(samples: List[Dict[str, str]],
+                       categories: List[str]) -> List[Tuple[str, int, float]]:
+    """把样本转换为训练数据，忽略已不存在的分类
+
+    每个文件名只保留最新的一条样本；用户调整过的文件之后又以相同分类被确认时仍按调整样本计权
+    """
+    category_index = {category: i for i, category in enumerate(categories)}
+    latest = {}
+    for sample in samples:
+        category_idx = category_index.get(sample.get('category'))
+        filename = sample.get('filename')
+        if category_idx is None or not filename:
+            continue
+        weight = CORRECTION_WEIGHT if sample.get('source') == 'correction' else ACCEPTED_WEIGHT
+        previous = latest.get(filename)
+        if previous and previous[0] == category_idx:
+            weight = max(weight, previous[1])
+        latest[filename] = (category_idx, weight)
+    return [(filename, category_idx, weight) for filename, (category_idx, weight) in latest.items()]
+
+
+class LearnedClassifier:
+    """作为本地分类阶段使用的学习模型：置信度达到阈值的文件直接分类"""
+
+    name = 'learner'
+
+    def __init__(self, model: NaiveBayesClassifier, threshold: float = 0.9):
+        self.model = model
+        self.threshold = threshold
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser,
+                    categories: List[str]) -> Optional['LearnedClassifier']:
+        """根据配置训练模型；未启用或样本不足时返回 None"""
+        settings = config['SETTINGS']
+        data_file = get_data_file(config)
+        if not data_file or not settings.getboolean('local_learner', fallback=True):
+            return None
+
+        training = build_training_set(load_samples(data_file), categories)
+        if len(training) < settings.getint('learner_min_samples', fallback=30):
+            return None
+
+        model = NaiveBayesClassifier(len(categories)).fit(training)
+        return cls(model, settings.getfloat('learner_threshold', fallback=0.9))
+
+    def split(self, filenames: List[str], indices: List[int]) -> Tuple[Dict[int, int], List[int]]:
+        """把指定下标的文件分为高置信度（本地分类）和低置信度（交给AI）两部分"""
+        matched = {}
+        remaining = []
+        for i in indices:
+            category_idx, confidence = self.model.predict(filenames[i])
+            if confidence >= self.threshold:
+                matched[i] = category_idx
+            else:
+                remaining.append(i)
+        return matched, remaining
+
+
+def evaluate(training: List[Tuple[str, int, float]], category_count: int,
+             threshold: float, test_ratio: float = 0.2, seed: int = 0) -> Dict[str, float]:
+    """按文件名随机留出一部分样本作为测试集，评估准确率和可节省的API调用比例
+
+    同一文件名的样本只会出现在训练集或测试集其中之一，避免测试文件名在训练时已经见过
+    """
+    filenames = sorted({filename for filename, _, _ in training})
+    random.Random(seed).shuffle(filenames)
+    test_names = set(filenames[:max(1, int(len(filenames) * test_ratio))])
+    test = [sample for sample in training if sample[0] in test_names]
+    train = [sample for sample in training if sample[0] not in test_names]
+
+    model = NaiveBayesClassifier(category_count).fit(train)
+    correct = confident = confident_correct = 0
+    started_at = time.perf_counter()
+    for filename, category_idx, _ in test:
+        predicted, confidence = model.predict(filename)
+        correct += predicted == category_idx
+        if confidence >= threshold:
+            confident += 1
+            confident_correct += predicted == category_idx
+    elapsed = time.perf_counter() - started_at
+
+    return {
+        'train_size': len(train),
+        'test_size': len(test),
+        'accuracy': correct / len(test),
+        'confident_accuracy': confident_correct / confident if confident else 0.0,
+        'api_calls_saved': confident / len(test),
+        'us_per_file': elapsed / len(test) * 1e6
+    }
+
+
+def main():
+    if '--eval' not in sys.argv:
+        print(__doc__)
+        return
+
+    config = configparser.ConfigParser()
+    config.read('config.ini', encoding='utf-8')
+    categories = [c.strip() for c in config['CLASSIFICATION']['categories'].split(',')]
+    settings = config['SETTINGS']
+    threshold = settings.getfloat('learner_threshold', fallback=0.9)
+    if '--threshold' in sys.argv:
+        threshold = float(sys.argv[sys.argv.index('--threshold') + 1])
+
+    training = build_training_set(load_samples(get_data_file(config)), categories)
+    if len(training) < 10:
+        print(f"标注样本不足（{len(training)} 条），至少需要10条才能评估")
+        return
+
+    result = evaluate(training, len(categories), threshold)
+    print(f"训练样本: {result['train_size']}  测试样本: {result['test_size']}  置信度阈值: {threshold}")
+    print(f"整体准确率: {result['accuracy']:.1%}")
+    print(f"高置信度准确率: {result['confident_accuracy']:.1%}")
+    print(f"可节省的API调用: {result['api_calls_saved']:.1%}")
+    print(f"平均分类耗时: {result['us_per_file']:.0f} 微秒/文件")
+
+
+if __name__ == "__main__":
+    main()
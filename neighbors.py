@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+近邻分类模块
+遍历已整理好的目标文件夹，为其中的文件名建立哈希n-gram向量索引；
+新文件的近邻足够相似且意见一致时直接采用近邻的分类，否则交给AI
+"""
+
+import os
+import json
+import zlib
+import math
+import heapq
+import configparser
+from array import array
+from collections import defaultdict
+from typing import List, Dict, Tuple, Optional
+
+from classify_cache import normalize_filename, atomic_write_json
+from utils import parse_category_paths, resolve_target_folder
+
+
+# 哈希向量的维度（桶数）
+HASH_DIMENSIONS = 1 << 18
+
+
+def hashed_vector(filename: str) -> Dict[int, float]:
+    """把文件名转换为L2归一化的哈希n-gram稀疏向量（字符2-gram、3-gram和扩展名）"""
+    stem, ext = os.path.splitext(normalize_filename(filename))
+    grams = [stem[i:i + n] for n in (2, 3) for i in range(len(stem) - n + 1)] or [stem]
+    if ext:
+        grams.append(f"ext:{ext}")
+
+    vector = defaultdict(float)
+    for gram in grams:
+        vector[zlib.crc32(gram.encode('utf-8')) % HASH_DIMENSIONS] += 1.0
+
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    return {bucket: w / norm for bucket, w in vector.items()}
+
+
+def scan_folder(root: str, previous: Dict[str, Dict], exclude: set) -> Dict[str, Dict]:
+    """递归扫描文件夹，修改时间没变的目录直接复用上次的结果
+
+    返回 目录 -> {'mtime', 'files', 'dirs'}
+    """
+    scanned = {}
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        if folder in exclude:
+            continue
+        try:
+            mtime = os.stat(folder).st_mtime
+        except OSError:
+            continue
+
+        entry = previous.get(folder)
+        if entry is None or entry['mtime'] != mtime:
+            files, dirs = [], []
+            try:
+                with os.scandir(folder) as it:
+                    for item in it:
+                        if item.is_dir(follow_symlinks=False):
+                            dirs.append(item.path)
+                        elif item.is_file():
+                            files.append(item.name)
+            except OSError:
+                continue
+            entry = {'mtime': mtime, 'files': files, 'dirs': dirs}
+
+        scanned[folder] = entry
+        stack.extend(entry['dirs'])
+    return scanned
+
+
+class NeighborIndex:
+    """基于倒排表的余弦相似度近邻索引"""
+
+    name = 'neighbors'
+
+    def __init__(self, k: int = 5, min_similarity: float = 0.6, min_agreement: float = 0.8):
+        self.k = k
+        self.min_similarity = min_similarity
+        self.min_agreement = min_agreement
+        self.labels = array('H')
+        # 桶 -> (文档编号数组, 权重数组)，查询时只需遍历查询向量涉及的桶
+        self.postings = defaultdict(lambda: (array('I'), array('f')))
+
+    def __len__(self):
+        return len(self.labels)
+
+    def add(self, filename: str, category_idx: int):
+        doc_id = len(self.labels)
+        self.labels.append(category_idx)
+        for bucket, weight in hashed_vector(filename).items():
+            doc_ids, weights = self.postings[bucket]
+            doc_ids.append(doc_id)
+            weights.append(weight)
+
+    def query(self, filename: str) -> List[Tuple[float, int]]:
+        """返回最相似的k个近邻 [(相似度, 分类索引)]"""
+        scores = defaultdict(float)
+        for bucket, weight in hashed_vector(filename).items():
+            posting = self.postings.get(bucket)
+            if posting is None:
+                continue
+            for doc_id, doc_weight in zip(*posting):
+                scores[doc_id] += weight * doc_weight
+        top = heapq.nlargest(self.k, scores.items(), key=lambda item: item[1])
+        return [(score, self.labels[doc_id]) for doc_id, score in top]
+
+    def predict(self, filename: str) -> Optional[int]:
+        """近邻足够相似且按相似度加权投票的一致度足够高时返回分类，否则返回 None"""
+        neighbors = [(score, label) for score, label in self.query(filename) if score >= self.min_similarity]
+        if not neighbors:
+            return None
+
+        votes = defaultdict(float)
+        for score, label in neighbors:
+            votes[label] += score
+        label, weight = max(votes.items(), key=lambda item: item[1])
+        if weight / sum(votes.values()) < self.min_agreement:
+            return None
+        return label
+
+    def split(self, filenames: List[str], indices: List[int]) -> Tuple[Dict[int, int], List[int]]:
+        """把指定下标的文件分为近邻可以确定分类和需要交给AI两部分"""
+        matched = {}
+        remaining = []
+        for i in indices:
+            category_idx = self.predict(filenames[i])
+            if category_idx is None:
+                remaining.append(i)
+            else:
+                matched[i] = category_idx
+        return matched, remaining
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser,
+                    categories: List[str]) -> Optional['NeighborIndex']:
+        """扫描各分类的目标文件夹建立索引；未启用或目标文件夹为空时返回 None
+
+        扫描结果缓存在 neighbor_index_file 中，下次只重新列出修改时间变化的目录
+        """
+        settings = config['SETTINGS']
+        if not settings.getboolean('neighbor_index', fallback=True):
+            return None
+
+        index_file = settings.get('neighbor_index_file', '.neighbor_index.json').strip()
+        previous = {}
+        if index_file and os.path.exists(index_file):
+            try:
+                with open(index_file, 'r', encoding='utf-8') as f:
+                    previous = json.load(f)
+            except (OSError, ValueError):
+                previous = {}
+
+        category_paths = parse_category_paths(config)
+        roots = [
+            os.path.abspath(resolve_target_folder(category, config['PATHS']['target_base_folder'], category_paths))
+            for category in categories
+        ]
+
+        index = cls(
+            k=settings.getint('neighbor_k', fallback=5),
+            min_similarity=settings.getfloat('neighbor_min_similarity', fallback=0.6),
+            min_agreement=settings.getfloat('neighbor_min_agreement', fallback=0.8)
+        )
+        snapshot = {}
+        for category_idx, root in enumerate(roots):
+            # 源文件夹和其他分类的目标文件夹可能嵌套在当前目标文件夹之内，不能计入当前分类
+            exclude = {os.path.abspath(config['PATHS']['source_folder'])}
+            exclude.update(other for other in roots if other != root)
+            scanned = scan_folder(root, previous.get(root, {}), exclude)
+            snapshot[root] = scanned
+            for entry in scanned.values():
+                for filename in entry['files']:
+                    index.add(filename, category_idx)
+
+        if index_file:
+            # 多个任务可能同时建立索引，各自写入唯一的临时文件后替换；写入失败只影响下次扫描的速度
+            try:
+                atomic_write_json(index_file, snapshot)
+            except OSError as e:
+                print(f"警告: 近邻索引 {index_file} 保存失败: {e}")
+
+        return index if len(index) else None
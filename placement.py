@@ -0,0 +1,687 @@
+#!/usr/bin/env python3
+"""
+文件放置模块
+把源文件放到目标位置：copy 模式复制文件（源文件保留，之后可清理）；
+move 模式在同一文件系统内直接原子重命名，跨文件系统时复制、校验后再删除源文件；
+link / symlink 模式只在目标位置创建硬链接或符号链接，不复制数据；
+大文件使用 reflink / copy_file_range / sendfile 分块复制，可报告进度并断点续传；
+批量放置时按设备限制并发数并行执行；目标文件夹中已有内容相同的文件时不再重复放置，
+同名文件内容不同时按冲突策略处理
+"""
+
+import os
+import time
+import uuid
+import errno
+import shutil
+import hashlib
+import filecmp
+import threading
+import configparser
+from stat import S_ISLNK
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, NamedTuple, Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+PLACEMENT_MODES = ('copy', 'move', 'link', 'symlink')
+# 只创建链接、不复制数据的模式
+LINK_MODES = ('link', 'symlink')
+
+# 实际执行的操作，撤回时据此决定删除目标文件还是把文件移回源位置
+OP_COPY = 'copy'        # 复制，源文件仍在
+OP_RENAME = 'rename'    # 同一文件系统内重命名
+OP_MOVE = 'move'        # 跨文件系统复制校验后删除源文件
+OP_HARDLINK = 'hardlink'  # 硬链接，与源文件共享数据
+OP_SYMLINK = 'symlink'    # 指向源文件的符号链接，源文件必须保留
+OP_DUPLICATE = 'duplicate'      # 目标文件夹中已有内容相同的文件，没有放置（源文件不变）
+OP_DEDUPED = 'deduplicated'     # 移动模式下目标文件夹中已有内容相同的文件，直接删除了源文件
+OP_SKIPPED = 'skipped'          # 同名文件内容不同，按冲突策略跳过
+
+# 同名文件内容不同时的处理策略：suffix 另存为“文件名 (1).扩展名”；newest 保留修改时间较新的一个；
+# skip 跳过；overwrite 直接覆盖
+COLLISION_POLICIES = ('suffix', 'newest', 'skip', 'overwrite')
+# newest 策略替换掉的旧文件改名为 目标文件.运行ID + 该后缀（见 replaced_path），撤回时恢复，清理源文件时删除
+REPLACED_SUFFIX = '.replaced'
+# 计算内容哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# 清理源文件前的校验方式：fast 比较大小和修改时间；strict 比较完整内容的哈希
+CLEANUP_VERIFY_MODES = ('fast', 'strict')
+# fast 校验允许的修改时间误差（秒），FAT 等文件系统的修改时间只精确到2秒
+MTIME_TOLERANCE = 2.0
+
+# 校验结果
+VERDICT_OK = 'ok'
+VERDICT_MISMATCH = 'mismatch'              # 目标与源文件不一致，保留源文件
+VERDICT_TARGET_MISSING = 'target_missing'  # 目标文件不存在，保留源文件
+VERDICT_SOURCE_MISSING = 'source_missing'  # 源文件已经不在，无需删除
+VERDICT_DELETED = 'deleted'                # 校验通过，源文件已删除
+VERDICT_ERROR = 'error'                    # 校验或删除时出错
+
+# 大文件分块复制：每次系统调用复制的字节数、超过多大的文件使用分块复制
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+DEFAULT_LARGE_FILE_THRESHOLD = 64 * 1024 * 1024
+# 普通读写方式每次读取的字节数
+READ_WRITE_CHUNK_SIZE = 4 * 1024 * 1024
+# 续传前比较 .part 文件末尾的字节数
+RESUME_CHECK_BYTES = 64 * 1024
+# 按顺序尝试的复制方式，系统或文件系统不支持时换下一种
+COPY_METHODS = ['copy_file_range', 'sendfile', 'read_write']
+FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF}
+# <linux/fs.h> 中的 FICLONE ioctl
+FICLONE = 0x40049409
+
+
+def get_placement_mode(config: configparser.ConfigParser) -> str:
+    """读取 [SETTINGS] placement_mode，无效值按 copy 处理"""
+    mode = config['SETTINGS'].get('placement_mode', 'copy').strip().lower()
+    if mode not in PLACEMENT_MODES:
+        print(f"警告: 未知的 placement_mode {mode}，使用 copy")
+        return 'copy'
+    return mode
+
+
+def get_placement_options(config: configparser.ConfigParser) -> Dict[str, object]:
+    """读取 classify_files 的放置选项（放置模式、线程数、每个设备的并发数、大文件分块复制参数）"""
+    settings = config['SETTINGS']
+    return {
+        'placement_mode': get_placement_mode(config),
+        'max_workers': settings.getint('placement_workers', fallback=8),
+        'per_device_limit': settings.getint('placement_per_device', fallback=4),
+        'chunk_size': int(settings.getfloat('copy_chunk_mb', fallback=64) * 1024 * 1024),
+        'large_file_threshold': int(settings.getfloat('large_file_threshold_mb', fallback=64) * 1024 * 1024),
+        'dedupe': settings.getboolean('dedupe_identical', fallback=True),
+        'collision_policy': get_collision_policy(config)
+    }
+
+
+def get_cleanup_verify(config: configparser.ConfigParser) -> str:
+    """读取 [SETTINGS] cleanup_verify，无效值按 fast 处理"""
+    mode = config['SETTINGS'].get('cleanup_verify', 'fast').strip().lower()
+    if mode not in CLEANUP_VERIFY_MODES:
+        print(f"警告: 未知的 cleanup_verify {mode}，使用 fast")
+        return 'fast'
+    return mode
+
+
+def get_collision_policy(config: configparser.ConfigParser) -> str:
+    """读取 [SETTINGS] collision_policy，无效值按 suffix 处理"""
+    policy = config['SETTINGS'].get('collision_policy', 'suffix').strip().lower()
+    if policy not in COLLISION_POLICIES:
+        print(f"警告: 未知的 collision_policy {policy}，使用 suffix")
+        return 'suffix'
+    return policy
+
+
+def file_digest(path: str, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """分块流式计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def suffixed_path(path: str, n: int) -> str:
+    """文件名加序号：报告.pdf -> 报告 (1).pdf"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem} ({n}){ext}"
+
+
+def files_match(path_a: str, path_b: str) -> bool:
+    """逐字节比较两个文件是否相同"""
+    return os.path.getsize(path_a) == os.path.getsize(path_b) and filecmp.cmp(path_a, path_b, shallow=False)
+
+
+def _try_reflink(src_fd: int, dst_fd: int) -> bool:
+    """尝试写时复制克隆（btrfs、XFS 等支持 FICLONE 的文件系统上不复制数据块）"""
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except OSError:
+        return False
+
+
+def _copy_chunk(method: str, src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    """从 offset 处复制最多 count 字节，返回实际复制的字节数"""
+    if method == 'copy_file_range':
+        return os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    if method == 'sendfile':
+        return os.sendfile(dst_fd, src_fd, offset, count)
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    return os.write(dst_fd, os.read(src_fd, min(count, READ_WRITE_CHUNK_SIZE)))
+
+
+def _resume_offset(source_path: str, temp_path: str, size: int) -> int:
+    """上次中断留下的 .part 文件比源文件新、且末尾数据与源文件对应位置一致时返回续传位置，否则返回0"""
+    try:
+        stat = os.stat(temp_path)
+    except OSError:
+        return 0
+    if not 0 < stat.st_size <= size or stat.st_mtime < os.path.getmtime(source_path):
+        return 0
+
+    tail = min(RESUME_CHECK_BYTES, stat.st_size)
+    with open(source_path, 'rb') as src, open(temp_path, 'rb') as part:
+        src.seek(stat.st_size - tail)
+        part.seek(stat.st_size - tail)
+        if src.read(tail) != part.read(tail):
+            return 0
+    return stat.st_size
+
+
+def chunked_copy(source_path: str, target_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 progress: Callable[[int], None] = None, verify: bool = False) -> str:
+    """大文件复制：先写入 目标文件.part，完成后再替换为目标文件，返回实际使用的复制方式
+
+    依次尝试 reflink 克隆、copy_file_range、sendfile，都不可用时退回普通读写；
+    每复制一块调用 progress(新增字节数)。中断后 .part 文件会保留，下次复制同一文件时从断点继续
+    （所属运行提交或撤回后删除）；
+    verify 为真时替换前逐字节校验，校验失败删除 .part 并抛出异常
+    """
+    temp_path = f"{target_path}.part"
+    size = os.path.getsize(source_path)
+    offset = _resume_offset(source_path, temp_path, size)
+    binary = getattr(os, 'O_BINARY', 0)
+    methods = [m for m in COPY_METHODS if m == 'read_write' or hasattr(os, m)]
+    used = 'resume' if offset == size and size else None
+
+    src_fd = os.open(source_path, os.O_RDONLY | binary)
+    try:
+        dst_fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | binary | (0 if offset else os.O_TRUNC), 0o644)
+        try:
+            if offset and progress:
+                progress(offset)
+            if offset == 0 and size and _try_reflink(src_fd, dst_fd):
+                offset = size
+                used = 'reflink'
+                if progress:
+                    progress(size)
+
+            while offset < size:
+                method = methods[0]
+                try:
+                    copied = _copy_chunk(method, src_fd, dst_fd, offset, min(chunk_size, size - offset))
+                except OSError as e:
+                    if e.errno not in FALLBACK_ERRNOS or len(methods) == 1:
+                        raise
+                    methods.pop(0)
+                    continue
+                if copied <= 0:
+                    # 部分文件系统上 copy_file_range / sendfile 可能提前返回0，换下一种方式继续
+                    if len(methods) == 1:
+                        raise OSError(f"复制中断: {source_path}")
+                    methods.pop(0)
+                    continue
+                offset += copied
+                used = used or method
+                if progress:
+                    progress(copied)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+    if verify and not files_match(source_path, temp_path):
+        os.remove(temp_path)
+        raise OSError(f"复制后校验失败: {source_path}")
+    shutil.copystat(source_path, temp_path)
+    os.replace(temp_path, target_path)
+    return used or methods[0]
+
+
+def copy_file(source_path: str, target_path: str, progress: Callable[[int], None] = None,
+              chunk_size: int = DEFAULT_CHUNK_SIZE, large_file_threshold: int = DEFAULT_LARGE_FILE_THRESHOLD):
+    """复制文件：超过 large_file_threshold 的大文件分块复制（有进度、可续传），小文件直接 copy2"""
+    size = os.path.getsize(source_path)
+    if size >= large_file_threshold:
+        chunked_copy(source_path, target_path, chunk_size, progress)
+        return
+    shutil.copy2(source_path, target_path)
+    if progress:
+        progress(size)
+
+
+def move_file(source_path: str, target_path: str, progress: Callable[[int], None] = None,
+              chunk_size: int = DEFAULT_CHUNK_SIZE) -> str:
+    """移动文件，返回实际执行的操作
+
+    同一设备上 os.replace 是原子的且不读写文件内容；跨设备（EXDEV）时分块复制、校验后删除源文件，
+    源文件删除失败时保留复制结果并返回 OP_COPY
+    """
+    try:
+        os.replace(source_path, target_path)
+        if progress:
+            progress(os.path.getsize(target_path))
+        return OP_RENAME
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    chunked_copy(source_path, target_path, chunk_size, progress, verify=True)
+    try:
+        os.remove(source_path)
+    except OSError as e:
+        print(f"  ⚠ 已复制到目标位置，但无法删除源文件 {source_path}: {e}")
+        return OP_COPY
+    return OP_MOVE
+
+
+def link_file(source_path: str, target_path: str, symbolic: bool = False) -> str:
+    """在目标位置创建指向源文件的链接，返回实际执行的操作
+
+    link 模式优先创建硬链接，跨设备等无法创建硬链接时改用符号链接（指向源文件的绝对路径）；
+    先创建临时链接再替换，目标位置已有同名文件时与复制模式一样覆盖；
+    目标已经是源文件的硬链接时不再重复创建
+    """
+    if not symbolic and not os.path.islink(target_path) and os.path.exists(target_path) \
+            and os.path.samefile(source_path, target_path):
+        return OP_HARDLINK
+
+    temp_path = f"{target_path}.link"
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+
+    operation = OP_SYMLINK
+    if not symbolic:
+        try:
+            os.link(source_path, temp_path)
+            operation = OP_HARDLINK
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP):
+                raise
+    if operation == OP_SYMLINK:
+        os.symlink(os.path.abspath(source_path), temp_path)
+
+    try:
+        os.replace(temp_path, target_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    # 临时链接和目标是同一个文件时 os.replace 什么也不做，临时链接会留下
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+    return operation
+
+
+def place_file(source_path: str, target_path: str, mode: str = 'copy',
+               progress: Callable[[int], None] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+               large_file_threshold: int = DEFAULT_LARGE_FILE_THRESHOLD) -> str:
+    """按放置模式把源文件放到目标位置，返回实际执行的操作"""
+    if mode == 'move':
+        return move_file(source_path, target_path, progress, chunk_size)
+    if mode in LINK_MODES:
+        operation = link_file(source_path, target_path, symbolic=mode == 'symlink')
+        if progress:
+            progress(os.path.getsize(source_path))
+        return operation
+    copy_file(source_path, target_path, progress, chunk_size, large_file_threshold)
+    return OP_COPY
+
+
+def source_removable(source_path: str, target_path: str) -> bool:
+    """清理源文件前的检查：目标文件存在，且不是指向源文件的符号链接（否则删除源文件会让链接失效）"""
+    if not os.path.exists(target_path):
+        return False
+    if os.path.islink(target_path) and os.path.exists(source_path):
+        return not os.path.samefile(target_path, source_path)
+    return True
+
+
+def verify_placement(source_path: str, target_path: str, operation: str, mode: str = 'fast') -> Tuple[str, str]:
+    """清理源文件前确认目标文件与源文件一致，返回 (校验结果, 说明)
+
+    fast 只比较 stat 结果：硬链接比较 inode，其余比较大小和修改时间（目标是原有的相同文件时只比较大小，
+    内容已在放置时按哈希确认）；strict 再流式计算两边的完整哈希
+    """
+    try:
+        source = os.stat(source_path)
+    except FileNotFoundError:
+        return VERDICT_SOURCE_MISSING, '源文件已不存在'
+    try:
+        target = os.lstat(target_path)
+    except FileNotFoundError:
+        return VERDICT_TARGET_MISSING, '目标文件不存在'
+
+    if S_ISLNK(target.st_mode):
+        return VERDICT_MISMATCH, '目标是符号链接'
+    if (source.st_dev, source.st_ino) == (target.st_dev, target.st_ino):
+        if operation == OP_HARDLINK:
+            return VERDICT_OK, '硬链接指向同一文件'
+        return VERDICT_MISMATCH, '目标与源文件是同一个文件'
+    if source.st_size != target.st_size:
+        return VERDICT_MISMATCH, f"大小不同（源 {source.st_size}，目标 {target.st_size}）"
+    if mode == 'strict':
+        if file_digest(source_path) != file_digest(target_path):
+            return VERDICT_MISMATCH, '内容不同'
+        return VERDICT_OK, '哈希一致'
+    if operation != OP_DUPLICATE and abs(source.st_mtime - target.st_mtime) > MTIME_TOLERANCE:
+        return VERDICT_MISMATCH, '修改时间不同'
+    return VERDICT_OK, '大小和修改时间一致'
+
+
+def replaced_path(target_path: str, run_id: Optional[str] = None) -> str:
+    """newest 策略替换掉的旧文件的备份路径
+
+    备份名带有运行ID，不同运行替换同一目标时不会覆盖其他运行撤回时需要的备份；
+    run_id 为 None 时为旧版本使用的 目标文件.replaced
+    """
+    return f"{target_path}.{run_id}{REPLACED_SUFFIX}" if run_id else target_path + REPLACED_SUFFIX
+
+
+def find_replaced(target_path: str, run_id: Optional[str] = None) -> Optional[str]:
+    """查找运行留下的旧文件备份，找不到时再查找旧版本的备份，都没有时返回 None"""
+    for path in ([replaced_path(target_path, run_id)] if run_id else []) + [replaced_path(target_path)]:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def discard_replaced(target_path: str, run_id: Optional[str] = None):
+    """删除 newest 策略留下的旧文件备份（确认整理结果、清理源文件后不再需要撤回）"""
+    path = find_replaced(target_path, run_id)
+    if path:
+        os.remove(path)
+
+
+def undo_placement(source_path: str, target_path: str, operation: str, source_kept: Optional[bool] = None,
+                   run_id: Optional[str] = None):
+    """撤回一次放置：复制的文件和链接直接删除目标，移动的文件移回源位置
+
+    复制或硬链接的源文件已被清理时，目标是唯一的副本，改为移回源位置；
+    source_kept 为调用方已知的源文件是否还在，为 None 时检查源文件（source_path 也为 None 时直接删除目标）；
+    目标是已有的相同文件时不删除，移动模式下删除过的（或复制模式下已被清理的）源文件从目标复制回来；
+    newest 策略替换掉的旧文件（run_id 为放置时的运行ID，见 replaced_path）会被恢复
+    """
+    if operation in (OP_DUPLICATE, OP_DEDUPED):
+        if not os.path.exists(source_path):
+            os.makedirs(os.path.dirname(source_path) or '.', exist_ok=True)
+            shutil.copy2(target_path, source_path)
+        return
+
+    if source_kept is None:
+        source_kept = source_path is None or os.path.exists(source_path)
+    if operation == OP_SYMLINK or (operation in (OP_COPY, OP_HARDLINK) and source_kept):
+        os.remove(target_path)
+    else:
+        if os.path.exists(source_path):
+            raise FileExistsError(f"源位置已存在同名文件: {source_path}")
+        os.makedirs(os.path.dirname(source_path) or '.', exist_ok=True)
+        move_file(target_path, source_path)
+    backup = find_replaced(target_path, run_id)
+    if backup:
+        os.replace(backup, target_path)
+
+
+class TargetFolders:
+    """目标文件夹中已有文件的大小索引和内容哈希缓存，以及本次放置中已占用的目标路径
+
+    只有大小相同的文件才需要计算哈希比较内容；同一文件的哈希按 (路径, 大小, 修改时间) 缓存；
+    run_id 用于 newest 策略的旧文件备份名（见 replaced_path），为 None 时生成一个随机ID
+    """
+
+    def __init__(self, run_id: Optional[str] = None):
+        self.run_id = run_id or uuid.uuid4().hex[:8]
+        self._sizes = {}      # 文件夹 -> 大小 -> [路径]
+        self._digests = {}    # (路径, 大小, 修改时间) -> 哈希
+        self._reserved = set()
+        self._lock = threading.Lock()
+
+    def _folder_sizes(self, folder: str) -> Dict[int, List[str]]:
+        sizes = self._sizes.get(folder)
+        if sizes is None:
+            sizes = {}
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        if entry.is_file(follow_symlinks=False):
+                            sizes.setdefault(entry.stat().st_size, []).append(entry.path)
+            except OSError:
+                pass
+            self._sizes[folder] = sizes
+        return sizes
+
+    def digest(self, path: str) -> Optional[str]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._digests.get(key)
+        if cached is None:
+            try:
+                cached = file_digest(path)
+            except OSError:
+                return None
+            with self._lock:
+                self._digests[key] = cached
+        return cached
+
+    def find_identical(self, folder: str, source_path: str, size: int) -> Optional[str]:
+        """在目标文件夹中查找与源文件内容相同的文件"""
+        with self._lock:
+            candidates = list(self._folder_sizes(folder).get(size, []))
+        if not candidates:
+            return None
+        source_digest = self.digest(source_path)
+        for path in candidates:
+            if path not in self._reserved and source_digest is not None and self.digest(path) == source_digest:
+                return path
+        return None
+
+    def claim(self, target_path: str, source_path: str, policy: str) -> Optional[str]:
+        """按冲突策略确定实际的目标路径并占用，返回 None 表示跳过"""
+        with self._lock:
+            if target_path in self._reserved:
+                # 本次放置中其他文件已经占用了这个路径（可能仍在写入），跳过或另存，不能再交给其他文件
+                if policy == 'skip':
+                    return None
+                policy = 'suffix'
+            elif not os.path.lexists(target_path):
+                self._reserved.add(target_path)
+                return target_path
+            elif policy == 'skip':
+                return None
+            if policy == 'newest':
+                if os.path.getmtime(source_path) <= os.path.getmtime(target_path):
+                    return None
+                os.replace(target_path, replaced_path(target_path, self.run_id))
+            elif policy == 'suffix':
+                n = 1
+                while os.path.lexists(suffixed_path(target_path, n)) or suffixed_path(target_path, n) in self._reserved:
+                    n += 1
+                target_path = suffixed_path(target_path, n)
+
+            self._reserved.add(target_path)
+            return target_path
+
+    def release(self, target_path: str, size: Optional[int] = None):
+        """释放占用；size 不为 None 表示已放置成功，加入大小索引供后续文件比较"""
+        with self._lock:
+            self._reserved.discard(target_path)
+            if size is not None:
+                sizes = self._sizes.get(os.path.dirname(target_path))
+                if sizes is not None:
+                    sizes.setdefault(size, []).append(target_path)
+
+
+class PlacementTask(NamedTuple):
+    """一次文件放置：target_dev 为目标文件夹所在设备，源和目标在同一设备时移动只需重命名"""
+    filename: str
+    source_path: str
+    target_path: str
+    size: int
+    source_dev: int
+    target_dev: int
+
+
+class PlacementStats:
+    """放置进度统计（已完成的文件数、已复制的字节数和吞吐量），大文件按块更新字节数"""
+
+    def __init__(self, files_total: int = 0, bytes_total: int = 0):
+        self.files_total = files_total
+        self.bytes_total = bytes_total
+        self.files = 0
+        self.bytes = 0
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add_bytes(self, count: int):
+        with self._lock:
+            self.bytes += count
+
+    def file_done(self):
+        with self._lock:
+            self.files += 1
+
+    def snapshot(self) -> Dict[str, float]:
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        return {
+            'files': self.files,
+            'files_total': self.files_total,
+            'bytes': self.bytes,
+            'bytes_total': self.bytes_total,
+            'elapsed': round(elapsed, 3),
+            'files_per_second': round(self.files / elapsed, 1),
+            'bytes_per_second': int(self.bytes / elapsed)
+        }
+
+
+class PlacementExecutor:
+    """并行放置文件，每个设备同时进行的复制数不超过 per_device_limit
+
+    一个任务同时占用源设备和目标设备的名额（按设备号顺序获取，不会死锁）；
+    同一设备上的移动只是重命名，不占用名额；run_id 为所属运行的ID（见 TargetFolders）
+    """
+
+    def __init__(self, mode: str = 'copy', max_workers: int = 8, per_device_limit: int = 4,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, large_file_threshold: int = DEFAULT_LARGE_FILE_THRESHOLD,
+                 dedupe: bool = True, collision_policy: str = 'suffix', run_id: Optional[str] = None):
+        self.mode = mode
+        # 链接不复制数据，放置与文件大小无关；去重要读取两边的完整内容计算哈希，反而更慢，链接模式下不去重
+        self.dedupe = dedupe and mode not in LINK_MODES
+        self.collision_policy = collision_policy
+        self.targets = TargetFolders(run_id)
+        self.max_workers = max(1, max_workers)
+        self.per_device_limit = max(1, per_device_limit)
+        self.chunk_size = max(1024 * 1024, chunk_size)
+        self.large_file_threshold = large_file_threshold
+        self._device_slots = {}
+        self._slots_lock = threading.Lock()
+
+    def _slot(self, device: int) -> threading.Semaphore:
+        with self._slots_lock:
+            slot = self._device_slots.get(device)
+            if slot is None:
+                slot = threading.Semaphore(self.per_device_limit)
+                self._device_slots[device] = slot
+            return slot
+
+    def _place(self, task: PlacementTask, progress: Callable[[int], None],
+               on_start: Callable[[PlacementTask, str, Optional[str]], None] = None) -> Tuple[str, Optional[str]]:
+        """放置单个文件，返回 (实际执行的操作, 实际的目标路径)
+
+        修改文件系统前调用 on_start(任务, 实际的目标路径, 操作)，操作为 None 表示正常放置
+        """
+        if self.dedupe:
+            identical = self.targets.find_identical(os.path.dirname(task.target_path), task.source_path, task.size)
+            if identical:
+                progress(task.size)
+                if self.mode == 'move':
+                    if on_start:
+                        on_start(task, identical, OP_DEDUPED)
+                    os.remove(task.source_path)
+                    return OP_DEDUPED, identical
+                return OP_DUPLICATE, identical
+
+        target_path = self.targets.claim(task.target_path, task.source_path, self.collision_policy)
+        if target_path is None:
+            progress(task.size)
+            return OP_SKIPPED, None
+
+        size = None
+        try:
+            if on_start:
+                on_start(task, target_path, None)
+            operation = self._transfer(task, target_path, progress)
+            size = task.size
+        finally:
+            self.targets.release(target_path, size)
+            backup = replaced_path(target_path, self.targets.run_id)
+            if size is None and not os.path.lexists(target_path) and os.path.exists(backup):
+                # 放置失败时恢复被替换的旧文件
+                os.replace(backup, target_path)
+        return operation, target_path
+
+    def _transfer(self, task: PlacementTask, target_path: str, progress: Callable[[int], None]) -> str:
+        def place():
+            return place_file(task.source_path, target_path, self.mode, progress,
+                              self.chunk_size, self.large_file_threshold)
+
+        # 链接和同一设备上的移动只修改目录项，不占用设备名额
+        if self.mode in LINK_MODES or (self.mode == 'move' and task.source_dev == task.target_dev):
+            return place()
+
+        slots = [self._slot(device) for device in sorted({task.source_dev, task.target_dev})]
+        for slot in slots:
+            slot.acquire()
+        try:
+            return place()
+        finally:
+            for slot in reversed(slots):
+                slot.release()
+
+    def run(self, tasks: List[PlacementTask],
+            on_done: Callable[[PlacementTask, Optional[Tuple[str, Optional[str]]], Optional[Exception]], None] = None,
+            on_progress: Callable[[Dict[str, float]], None] = None,
+            on_start: Callable[[PlacementTask, str, Optional[str]], None] = None
+            ) -> Tuple[Dict[str, Tuple[str, Optional[str]]], Dict[str, str], Dict[str, float]]:
+        """执行所有任务
+
+        返回 (文件名 -> (实际执行的操作, 实际的目标路径), 文件名 -> 错误信息, 吞吐量统计)；
+        每个任务完成后在工作线程中调用 on_done(任务, (操作, 目标路径), 异常)，on_start 见 _place，
+        每复制一块或完成一个小文件后调用 on_progress(进度统计)
+        """
+        stats = PlacementStats(len(tasks), sum(task.size for task in tasks))
+        operations = {}
+        errors = {}
+        lock = threading.Lock()
+
+        def progress(count):
+            stats.add_bytes(count)
+            if on_progress:
+                on_progress(stats.snapshot())
+
+        def work(task):
+            try:
+                operation, target_path = self._place(task, progress, on_start)
+            except Exception as e:
+                with lock:
+                    errors[task.filename] = str(e)
+                if on_done:
+                    on_done(task, None, e)
+                return
+            stats.file_done()
+            with lock:
+                operations[task.filename] = (operation, target_path)
+            if on_done:
+                on_done(task, (operation, target_path), None)
+
+        # 大文件先开始，避免最后只剩一个大文件单独复制
+        ordered = sorted(tasks, key=lambda task: task.size, reverse=True)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(work, ordered))
+
+        return operations, errors, stats.snapshot()
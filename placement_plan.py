@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+放置计划模块
+一次运行只解析一次目标路径：每个文件的源路径、目标路径、大小、分类下标和状态按列存放在数组中，
+整理、清理源文件和撤回都按状态从同一张表中选取文件，不再各自拼接路径、逐个检查文件是否存在
+"""
+
+import os
+from array import array
+from typing import List, Dict, Optional, Iterable
+
+from placement import PlacementTask, OP_COPY, OP_HARDLINK, OP_DUPLICATE, OP_SKIPPED
+
+
+# 行状态
+ROW_PENDING = 0   # 等待放置（或中断时尚未完成）
+ROW_PLACED = 1    # 已放置到目标位置
+ROW_FAILED = 2    # 放置失败，或分类无效、源文件不存在
+ROW_SKIPPED = 3   # 同名文件按冲突策略跳过
+ROW_CLEANED = 4   # 已放置且源文件已清理
+ROW_UNDONE = 5    # 已撤回
+
+ROW_STATUS_NAMES = ('pending', 'placed', 'failed', 'skipped', 'cleaned', 'undone')
+
+# 没有得到分类结果的文件的分类下标，不参与整理（不加入计划）
+UNRESOLVED = -1
+
+# 清理源文件时可以删除源文件的操作（移动和符号链接的源文件不能删除）
+REMOVABLE_OPERATIONS = (OP_COPY, OP_HARDLINK, OP_DUPLICATE)
+
+
+def resolve_target_folder(category: str, target_base_folder: str,
+                          category_paths: Dict[str, str] = None) -> str:
+    """确定分类的目标文件夹：优先使用自定义路径，否则使用 目标根目录/分类标签"""
+    if category_paths and category in category_paths:
+        target_folder = category_paths[category]
+        # 确保路径是相对于当前目录的绝对路径
+        if not os.path.isabs(target_folder):
+            target_folder = os.path.abspath(target_folder)
+        return target_folder
+    return os.path.join(target_base_folder, category)
+
+
+class PlacementPlan:
+    """一次运行的放置计划，每个文件一行
+
+    路径和操作存放在列表中，大小、分类下标、设备号和状态存放在 array 中；
+    放置完成后 targets 更新为实际的目标路径（同名另存或内容相同的已有文件）
+    """
+
+    def __init__(self, categories: List[str] = None):
+        self.categories = list(categories or [])
+        self._category_ids = {category: i for i, category in enumerate(self.categories)}
+        self.filenames = []
+        self.sources = []
+        self.targets = []
+        self.operations = []
+        self.sizes = array('q')
+        self.category_index = array('i')
+        self.source_devs = array('q')
+        self.target_devs = array('q')
+        self.status = array('b')
+        self.errors = {}      # 行号 -> 错误信息
+        self._rows = {}       # 文件名 -> 行号
+
+    def __len__(self) -> int:
+        return len(self.filenames)
+
+    @classmethod
+    def build(cls, filenames: List[str], classifications: List[int], categories: List[str],
+              source_folder: str, target_base_folder: str,
+              category_paths: Dict[str, str] = None) -> 'PlacementPlan':
+        """按分类结果生成计划：每个分类的目标文件夹只解析、创建一次，每个源文件只 stat 一次
+
+        分类为 UNRESOLVED 的文件不加入计划；分类无效、目标文件夹无法创建或源文件不存在的文件直接标记为失败
+        """
+        plan = cls(categories)
+        folders = {}
+
+        for i, filename in enumerate(filenames):
+            source_path = os.path.abspath(os.path.join(source_folder, filename))
+            category_idx = classifications[i] if i < len(classifications) else UNRESOLVED
+            if category_idx == UNRESOLVED:
+                continue
+            if not 0 <= category_idx < len(categories):
+                plan.add(filename, source_path, '', status=ROW_FAILED, error=f"分类索引 {category_idx} 无效")
+                continue
+
+            folder = folders.get(category_idx)
+            if folder is None:
+                path = os.path.abspath(resolve_target_folder(categories[category_idx], target_base_folder,
+                                                             category_paths))
+                try:
+                    os.makedirs(path, exist_ok=True)
+                    folder = (path, os.stat(path).st_dev, None)
+                except OSError as e:
+                    folder = (path, None, f"无法创建目标文件夹 {path}: {e}")
+                folders[category_idx] = folder
+
+            # 递归扫描时文件名可能带有子目录，目标位置只使用文件名本身
+            target_path = os.path.join(folder[0], os.path.basename(filename))
+            if folder[1] is None:
+                plan.add(filename, source_path, target_path, category=categories[category_idx],
+                         status=ROW_FAILED, error=folder[2])
+                continue
+            try:
+                stat = os.stat(source_path)
+            except OSError:
+                plan.add(filename, source_path, target_path, category=categories[category_idx],
+                         status=ROW_FAILED, error='源文件不存在')
+                continue
+            plan.add(filename, source_path, target_path, stat.st_size, categories[category_idx],
+                     stat.st_dev, folder[1])
+
+        return plan
+
+    def add(self, filename: str, source_path: str, target_path: str, size: int = 0,
+            category: Optional[str] = None, source_dev: int = 0, target_dev: int = 0,
+            status: int = ROW_PENDING, error: str = None) -> int:
+        """追加一行，返回行号"""
+        if category is None:
+            category_idx = -1
+        else:
+            category_idx = self._category_ids.get(category)
+            if category_idx is None:
+                category_idx = len(self.categories)
+                self.categories.append(category)
+                self._category_ids[category] = category_idx
+
+        row = len(self.filenames)
+        self.filenames.append(filename)
+        self.sources.append(source_path)
+        self.targets.append(target_path)
+        self.operations.append(None)
+        self.sizes.append(size)
+        self.category_index.append(category_idx)
+        self.source_devs.append(source_dev)
+        self.target_devs.append(target_dev)
+        self.status.append(status)
+        if error:
+            self.errors[row] = error
+        self._rows[filename] = row
+        return row
+
+    def row(self, filename: str) -> Optional[int]:
+        return self._rows.get(filename)
+
+    def category(self, row: int) -> Optional[str]:
+        category_idx = self.category_index[row]
+        return self.categories[category_idx] if category_idx >= 0 else None
+
+    def select(self, *statuses: int, operations: Iterable[str] = None) -> List[int]:
+        """按状态（和实际执行的操作）选取行号"""
+        wanted = set(statuses)
+        if operations is not None:
+            operations = set(operations)
+        return [
+            row for row, status in enumerate(self.status)
+            if status in wanted and (operations is None or self.operations[row] in operations)
+        ]
+
+    def tasks(self, rows: Iterable[int] = None) -> List[PlacementTask]:
+        """指定行（默认所有等待放置的行）的放置任务"""
+        if rows is None:
+            rows = self.select(ROW_PENDING)
+        return [
+            PlacementTask(self.filenames[row], self.sources[row], self.targets[row], self.sizes[row],
+                          self.source_devs[row], self.target_devs[row])
+            for row in rows
+        ]
+
+    def record(self, filename: str, operation: str, target_path: Optional[str]):
+        """记录放置结果"""
+        row = self._rows[filename]
+        self.operations[row] = operation
+        self.errors.pop(row, None)
+        if operation == OP_SKIPPED:
+            self.status[row] = ROW_SKIPPED
+        else:
+            self.targets[row] = target_path
+            self.status[row] = ROW_PLACED
+
+    def fail(self, filename: str, error: str):
+        row = self._rows[filename]
+        self.status[row] = ROW_FAILED
+        self.errors[row] = error
+
+    def mark(self, rows: Iterable[int], status: int):
+        for row in rows:
+            self.status[row] = status
+
+    def target_paths(self, rows: Iterable[int] = None) -> Dict[str, str]:
+        """文件名 -> 实际目标路径（默认所有已放置的行）"""
+        if rows is None:
+            rows = self.select(ROW_PLACED, ROW_CLEANED)
+        return {self.filenames[row]: self.targets[row] for row in rows}
+
+    def counts(self) -> Dict[str, int]:
+        """各状态的行数"""
+        counts = dict.fromkeys(ROW_STATUS_NAMES, 0)
+        for status in self.status:
+            counts[ROW_STATUS_NAMES[status]] += 1
+        return counts
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+本地规则预分类模块
+根据配置中的关键词 / 正则 / 扩展名规则直接分类特征明显的文件，
+只有匹配不上或匹配到多个分类的文件才交给AI
+"""
+
+import os
+import re
+import configparser
+from collections import Counter
+from typing import List, Dict, Tuple, Optional
+
+from classify_cache import normalize_filename
+from utils import parse_category_descriptions
+
+
+# 从分类描述中自动提取关键词时，超过该长度的短语视为说明性文字而不是关键词
+MAX_DESCRIPTION_KEYWORD_LENGTH = 4
+
+
+def parse_category_rules(rules_text: str) -> Dict[str, List[str]]:
+    """解析 category_rules 配置（每行格式：分类标签:规则1,规则2,...）
+
+    规则以 re: 开头为正则表达式，以 ext: 开头为扩展名，其余为关键词；
+    正则中可以含逗号，一条正则一直延续到下一条 re: / ext: 规则或行尾（写在它后面的关键词要换到前面或另起一行）
+    """
+    rules = {}
+    for line in rules_text.strip().split('\n'):
+        line = line.strip()
+        if ':' not in line:
+            continue
+        category, items = line.split(':', 1)
+        category_rules = rules.setdefault(category.strip(), [])
+        for segment in re.split(r'[,，]\s*(?=(?:re|ext):)', items.strip()):
+            segment = segment.strip()
+            if segment.startswith('re:'):
+                if segment[3:].strip():
+                    category_rules.append(segment)
+            else:
+                category_rules.extend(item.strip() for item in re.split(r'[,，]', segment) if item.strip())
+    return rules
+
+
+class RuleClassifier:
+    """编译后的规则集合；一个文件只命中一个分类的规则时才算可信"""
+
+    name = 'rules'
+
+    def __init__(self, categories: List[str], category_rules: Dict[str, List[str]]):
+        self.categories = categories
+        self.patterns = []     # [(分类索引, 合并后的正则, 各分组对应的规则名)]
+        self.extensions = {}   # 扩展名 -> 分类索引集合
+        self.hits = Counter()
+
+        for category_idx, category in enumerate(categories):
+            keywords = []
+            rule_names = []
+            for rule in category_rules.get(category, []):
+                if rule.startswith('ext:'):
+                    ext = rule[4:].strip().lower()
+                    ext = ext if ext.startswith('.') else f".{ext}"
+                    self.extensions.setdefault(ext, set()).add(category_idx)
+                elif rule.startswith('re:'):
+                    try:
+                        re.compile(rule[3:])
+                    except re.error as e:
+                        print(f"警告: 分类 {category} 的正则规则 {rule[3:]} 无效，已跳过: {e}")
+                        continue
+                    keywords.append(f"(?:{rule[3:]})")
+                    rule_names.append(rule)
+                else:
+                    keywords.append(re.escape(normalize_filename(rule)))
+                    rule_names.append(rule)
+
+            if keywords:
+                # 每条规则一个命名分组，匹配后通过 lastgroup 得知命中的是哪条规则
+                pattern = re.compile('|'.join(f"(?P<r{n}>{k})" for n, k in enumerate(keywords)))
+                self.patterns.append((category_idx, pattern, rule_names))
+
+    @classmethod
+    def from_config(cls, config: configparser.ConfigParser,
+                    categories: List[str]) -> Optional['RuleClassifier']:
+        """根据配置创建规则分类器，[SETTINGS] local_rules 关闭时返回 None"""
+        if not config['SETTINGS'].getboolean('local_rules', fallback=True):
+            return None
+
+        classification = config['CLASSIFICATION']
+        rules = parse_category_rules(classification.get('category_rules', ''))
+
+        # 分类标签本身和分类描述中的短词（如“高等数学”“线性代数”）也作为关键词
+        for category in categories:
+            if len(category) >= 2:
+                rules.setdefault(category, []).append(category)
+        descriptions = parse_category_descriptions(classification.get('category_descriptions', ''))
+        for category, description in descriptions.items():
+            for term in re.split(r'[,，、;；\s]+', description):
+                if 2 <= len(term) <= MAX_DESCRIPTION_KEYWORD_LENGTH:
+                    rules.setdefault(category, []).append(term)
+
+        classifier = cls(categories, rules)
+        return classifier if classifier.patterns or classifier.extensions else None
+
+    def match(self, filename: str) -> Optional[int]:
+        """返回唯一命中的分类索引；没有命中或命中多个分类时返回 None"""
+        normalized = normalize_filename(filename)
+        matched = {}
+
+        for category_idx, pattern, rule_names in self.patterns:
+            found = pattern.search(normalized)
+            if found:
+                matched[category_idx] = rule_names[int(found.lastgroup[1:])]
+
+        ext = os.path.splitext(normalized)[1]
+        for category_idx in self.extensions.get(ext, ()):
+            matched.setdefault(category_idx, f"ext:{ext}")
+
+        if len(matched) != 1:
+            return None
+
+        category_idx, rule = next(iter(matched.items()))
+        self.hits[f"{self.categories[category_idx]}:{rule}"] += 1
+        return category_idx
+
+    def split(self, filenames: List[str], indices: List[int]) -> Tuple[Dict[int, int], List[int]]:
+        """把指定下标的文件分为规则命中和未命中两部分"""
+        matched = {}
+        remaining = []
+        for i in indices:
+            category_idx = self.match(filenames[i])
+            if category_idx is None:
+                remaining.append(i)
+            else:
+                matched[i] = category_idx
+        return matched, remaining
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+扫描索引模块
+用 SQLite 记录源文件夹中见过的文件（路径、大小、修改时间、内容摘要、上次分类、状态），
+重新扫描时只列出修改时间变化了的目录，只有新增或内容变化的文件才需要重新分类
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import configparser
+from typing import List, Dict, Any, Optional, Iterable
+
+from utils import FileEntry, list_directory
+
+
+# 文件状态
+STATUS_NEW = 'new'                # 新发现的文件
+STATUS_MODIFIED = 'modified'      # 内容发生变化，需要重新分类
+STATUS_CLASSIFIED = 'classified'  # 已分类但还没有整理
+STATUS_EXECUTED = 'executed'      # 已整理到目标文件夹
+STATUS_REMOVED = 'removed'        # 已从源文件夹中消失
+
+STATUSES = [STATUS_NEW, STATUS_MODIFIED, STATUS_CLASSIFIED, STATUS_EXECUTED, STATUS_REMOVED]
+# 需要分类的状态（已分类未整理的文件沿用上次的分类，见 stored_categories）
+QUEUED_STATUSES = [STATUS_NEW, STATUS_MODIFIED]
+
+# 内容摘要只读取文件首尾各这么多字节，大文件也能快速计算
+HASH_CHUNK_SIZE = 64 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    content_hash TEXT,
+    category TEXT,
+    status TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_status ON files (status);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    subdirs TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def quick_hash(path: str, size: int) -> Optional[str]:
+    """文件大小加首尾数据的摘要，用于判断修改时间变化后内容是否真的变了"""
+    digest = hashlib.sha1(str(size).encode('ascii'))
+    try:
+        with open(path, 'rb') as f:
+            digest.update(f.read(HASH_CHUNK_SIZE))
+            if size > 2 * HASH_CHUNK_SIZE:
+                f.seek(-HASH_CHUNK_SIZE, os.SEEK_END)
+                digest.update(f.read(HASH_CHUNK_SIZE))
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class ScanIndex:
+    """源文件夹的持久化扫描索引"""
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else None
+
+    def rescan(self, source_folder: str, extensions: List[str] = None, recursive: bool = False,
+               max_depth: Optional[int] = None, include: List[str] = None, exclude: List[str] = None,
+               skip_hidden: bool = True, full: bool = False) -> Dict[str, int]:
+        """增量扫描源文件夹，返回本次 新增/修改/未变/消失 的文件数
+
+        修改时间没变的目录直接沿用索引中的记录，不再列出也不再逐个 stat；
+        扫描选项变化或 full 为真时重新列出所有目录。
+        原地修改文件不会改变目录的修改时间，这类变化需要 full 扫描才能发现
+        """
+        options_key = json.dumps([os.path.abspath(source_folder), sorted(extensions or []), recursive,
+                                  max_depth, include or [], exclude or [], skip_hidden])
+        summary = {'new': 0, 'modified': 0, 'unchanged': 0, 'removed': 0, 'listed_dirs': 0, 'skipped_dirs': 0}
+        now = time.time()
+
+        with self._lock, self._conn:
+            conn = self._conn
+            full = full or self._get_meta('scan_options') != options_key
+            visited = set()
+            stack = [(source_folder, '', 0)]
+
+            while stack:
+                folder, prefix, depth = stack.pop()
+                try:
+                    dir_mtime = os.stat(folder).st_mtime
+                except OSError:
+                    continue
+                visited.add(prefix)
+
+                row = conn.execute("SELECT mtime, subdirs FROM dirs WHERE path = ?", (prefix,)).fetchone()
+                if not full and row and row['mtime'] == dir_mtime:
+                    subdirs = json.loads(row['subdirs'])
+                    summary['unchanged'] += conn.execute(
+                        "SELECT COUNT(*) FROM files WHERE dir = ? AND status != ?", (prefix, STATUS_REMOVED)
+                    ).fetchone()[0]
+                    summary['skipped_dirs'] += 1
+                else:
+                    try:
+                        entries, subdir_entries = list_directory(folder, prefix, extensions, include,
+                                                                 exclude, skip_hidden)
+                    except OSError as e:
+                        print(f"警告: 无法读取目录 {folder}: {e}")
+                        continue
+                    self._update_dir(prefix, entries, summary, now)
+                    subdirs = [[path, rel_path] for path, rel_path in subdir_entries]
+                    conn.execute("INSERT OR REPLACE INTO dirs (path, mtime, subdirs) VALUES (?, ?, ?)",
+                                 (prefix, dir_mtime, json.dumps(subdirs, ensure_ascii=False)))
+                    summary['listed_dirs'] += 1
+
+                if recursive and (max_depth is None or depth < max_depth):
+                    stack.extend((path, rel_path, depth + 1) for path, rel_path in subdirs)
+
+            # 已经不存在（或不再扫描）的目录，其中的文件全部视为消失
+            stale = [row['path'] for row in conn.execute("SELECT path FROM dirs") if row['path'] not in visited]
+            for prefix in stale:
+                summary['removed'] += conn.execute(
+                    "UPDATE files SET status = ?, updated_at = ? WHERE dir = ? AND status != ?",
+                    (STATUS_REMOVED, now, prefix, STATUS_REMOVED)
+                ).rowcount
+                conn.execute("DELETE FROM dirs WHERE path = ?", (prefix,))
+
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('scan_options', ?)", (options_key,))
+
+        return summary
+
+    def _update_dir(self, prefix: str, entries: List[FileEntry], summary: Dict[str, int], now: float):
+        """用单个目录的最新列表更新索引"""
+        conn = self._conn
+        known = {row['name']: row for row in conn.execute("SELECT * FROM files WHERE dir = ?", (prefix,))}
+
+        for entry in entries:
+            row = known.pop(entry.name, None)
+            if row is None or row['status'] == STATUS_REMOVED:
+                conn.execute(
+                    "INSERT OR REPLACE INTO files (name, dir, size, mtime, content_hash, category, status, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, NULL, ?, ?)",
+                    (entry.name, prefix, entry.size, entry.mtime, quick_hash(entry.path, entry.size), STATUS_NEW, now)
+                )
+                summary['new'] += 1
+            elif row['size'] == entry.size and row['mtime'] == entry.mtime:
+                summary['unchanged'] += 1
+            else:
+                content_hash = quick_hash(entry.path, entry.size)
+                if content_hash is not None and content_hash == row['content_hash']:
+                    # 只是修改时间变了（如被 touch 过），沿用原来的分类和状态
+                    conn.execute("UPDATE files SET size = ?, mtime = ? WHERE name = ?",
+                                 (entry.size, entry.mtime, entry.name))
+                    summary['unchanged'] += 1
+                else:
+                    conn.execute(
+                        "UPDATE files SET size = ?, mtime = ?, content_hash = ?, category = NULL, status = ?, "
+                        "updated_at = ? WHERE name = ?",
+                        (entry.size, entry.mtime, content_hash, STATUS_MODIFIED, now, entry.name)
+                    )
+                    summary['modified'] += 1
+
+        for name, row in known.items():
+            if row['status'] != STATUS_REMOVED:
+                conn.execute("UPDATE files SET status = ?, updated_at = ? WHERE name = ?",
+                             (STATUS_REMOVED, now, name))
+                summary['removed'] += 1
+
+    def query(self, statuses: Iterable[str] = None, limit: int = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """按状态查询索引中的文件，按文件名排序"""
+        sql = "SELECT name, size, mtime, content_hash, category, status, updated_at FROM files"
+        params = []
+        statuses = list(statuses or [])
+        if statuses:
+            sql += f" WHERE status IN ({','.join('?' * len(statuses))})"
+            params.extend(statuses)
+        sql += " ORDER BY name"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([limit, offset])
+
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def queued_files(self, include_classified: bool = False) -> List[FileEntry]:
+        """需要分类的文件；include_classified 为真时追加已分类但还没有整理的文件（等待用户确认后整理）"""
+        statuses = QUEUED_STATUSES + ([STATUS_CLASSIFIED] if include_classified else [])
+        return [
+            FileEntry(row['name'], '', row['size'], row['mtime'])
+            for row in self.query(statuses)
+        ]
+
+    def stored_categories(self, files: List[str], categories: List[str]) -> Dict[int, int]:
+        """已分类未整理的文件沿用上次的分类，返回 文件下标 -> 分类下标（分类标签已不存在的文件需要重新分类）"""
+        category_ids = {category: i for i, category in enumerate(categories)}
+        with self._lock:
+            stored = {row['name']: row['category'] for row in self._conn.execute(
+                "SELECT name, category FROM files WHERE status = ?", (STATUS_CLASSIFIED,))}
+        return {
+            i: category_ids[stored[filename]]
+            for i, filename in enumerate(files)
+            if stored.get(filename) in category_ids
+        }
+
+    def counts(self) -> Dict[str, int]:
+        """各状态的文件数"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM files GROUP BY status").fetchall()
+        counts = {status: 0 for status in STATUSES}
+        counts.update({row['status']: row['n'] for row in rows})
+        return counts
+
+    def mark_classified(self, results: Dict[str, str]):
+        """记录分类结果，results 为 文件名 -> 分类标签"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE files SET category = ?, status = ?, updated_at = ? WHERE name = ? AND status != ?",
+                [(category, STATUS_CLASSIFIED, now, name, STATUS_REMOVED) for name, category in results.items()]
+            )
+
+    def set_status(self, names: Iterable[str], status: str):
+        """批量修改文件状态（整理完成后标记为 executed，撤回后恢复为 classified）"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE files SET status = ?, updated_at = ? WHERE name = ? AND status != ?",
+                [(status, now, name, STATUS_REMOVED) for name in names]
+            )
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_scan_index(config: configparser.ConfigParser) -> Optional[ScanIndex]:
+    """获取（或打开）共享的扫描索引，未启用或 scan_index_file 为空时返回 None"""
+    settings = config['SETTINGS']
+    db_file = settings.get('scan_index_file', '.scan_index.db').strip()
+    if not db_file or not settings.getboolean('scan_index', fallback=True):
+        return None
+
+    with _indexes_lock:
+        index = _indexes.get(db_file)
+        if index is None:
+            index = ScanIndex(db_file)
+            _indexes[db_file] = index
+        return index
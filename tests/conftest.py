@@ -0,0 +1,30 @@
+# tests/conftest.py
+"""测试公用的夹具：项目根目录加入模块搜索路径，源/目标文件夹建在临时目录中"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def folders(tmp_path):
+    """返回 (源文件夹, 目标文件夹, 日志文件夹)"""
+    source = tmp_path / 'src'
+    target = tmp_path / 'dst'
+    source.mkdir()
+    target.mkdir()
+    return str(source), str(target), str(tmp_path / 'journal')
+
+
+@pytest.fixture
+def write_file():
+    """返回写入文本文件（自动创建上级文件夹）的函数：write_file(路径, 内容) -> 路径"""
+    def write(path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+    return write
@@ -0,0 +1,89 @@
+# tests/test_job_store.py
+"""任务存储：服务重启后恢复任务，中断的分类从最后写入的批次继续"""
+
+import threading
+
+import pytest
+
+from app.job_store import JobStore
+from app.jobs import JobManager, JOB_PROCESSING, JOB_INTERRUPTED, JOB_COMPLETED
+
+CATEGORIES = ['数学', '英语']
+FILES = [f"file_{i}.txt" for i in range(6)]
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / 'jobs.db')
+
+
+def start_processing(db_file):
+    """创建任务并写入第一个批次的结果，第二个批次只记录在内存中（尚未写入）时“崩溃”"""
+    manager = JobManager(store=JobStore(db_file, batch_size=100))
+    job = manager.create('/tmp/src', files=FILES, categories=CATEGORIES)
+    job.update(status=JOB_PROCESSING, progress=50)
+    with job.lock:
+        job['classifications'] = [0, 1, 0, None, None, None]
+    manager.record_results(job, {0: 0, 1: 1, 2: 0})
+    manager.persist(job)
+    manager.record_results(job, {3: 1})
+    return job.id
+
+
+def test_restart_marks_job_interrupted(db_file):
+    job_id = start_processing(db_file)
+    manager = JobManager(store=JobStore(db_file))
+    job = manager.get(job_id)
+    assert not job.loaded
+    assert job.summary()['status'] == JOB_INTERRUPTED
+    assert job.summary()['file_count'] == len(FILES)
+
+
+def test_resume_from_last_written_batch(db_file):
+    job_id = start_processing(db_file)
+    manager = JobManager(store=JobStore(db_file))
+    job = manager.get(job_id)
+
+    # 只有已写入的批次保留下来，结果页面可以查看
+    assert job['classifications'] == [0, 1, 0, None, None, None]
+    assert [item['filename'] for item in job['results']['files']] == FILES[:3]
+
+    seen = {}
+    done = threading.Event()
+
+    def worker(job):
+        seen['resume'] = job['resume']
+        seen['classifications'] = list(job['classifications'])
+        results = {i: 1 for i, category_idx in enumerate(job['classifications']) if category_idx is None}
+        with job.lock:
+            for i, category_idx in results.items():
+                job['classifications'][i] = category_idx
+        manager.record_results(job, results)
+        job.update(status=JOB_COMPLETED, progress=100)
+        done.set()
+
+    assert manager.submit(job, worker) is None
+    assert done.wait(5)
+    manager._executor.shutdown(wait=True)
+    assert seen == {'resume': True, 'classifications': [0, 1, 0, None, None, None]}
+
+    # 再次重启：完成的任务和全部结果都已保存
+    job = JobManager(store=JobStore(db_file)).get(job_id)
+    assert job['status'] == JOB_COMPLETED
+    assert job['classifications'] == [0, 1, 0, 1, 1, 1]
+
+
+def test_reset_results(db_file):
+    job_id = start_processing(db_file)
+    store = JobStore(db_file)
+    manager = JobManager(store=store)
+    job = manager.get(job_id)
+    manager.reset_results(job)
+    assert store.load_state(job_id)['classifications'] == [None] * len(FILES)
+
+
+def test_remove_deletes_stored_job(db_file):
+    job_id = start_processing(db_file)
+    manager = JobManager(store=JobStore(db_file))
+    assert manager.remove(job_id)
+    assert JobManager(store=JobStore(db_file)).get(job_id) is None
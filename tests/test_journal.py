@@ -0,0 +1,223 @@
+# tests/test_journal.py
+"""操作日志：模拟崩溃后继续和撤回、清理前校验、运行锁定"""
+
+import os
+import shutil
+
+import pytest
+
+from journal import (
+    OperationJournal, RunLockedError, load_run, list_runs, resume_run, rollback_run, cleanup_run,
+    RUN_INCOMPLETE, RUN_RUNNING, RUN_COMPLETED, RUN_ROLLED_BACK
+)
+from placement import PlacementExecutor, OP_COPY, OP_RENAME, OP_DUPLICATE, OP_DEDUPED, VERDICT_DELETED, VERDICT_MISMATCH
+from placement_plan import PlacementPlan
+
+CATEGORIES = ['数学', '英语']
+FILES = ['高数.txt', '线代.txt', 'english.txt', 'grammar.txt']
+CLASSIFICATIONS = [0, 0, 1, 1]
+
+
+@pytest.fixture
+def crashed_run(folders, write_file):
+    """返回函数 crashed_run(placed, mode)：开始一次运行，只放置前 placed 个文件后“崩溃”（不写结束记录），
+    返回运行ID"""
+    def run(placed=2, mode='copy'):
+        source, target, journal_dir = folders
+        for filename in FILES:
+            write_file(os.path.join(source, filename), f"内容 {filename}")
+        plan = PlacementPlan.build(FILES, CLASSIFICATIONS, CATEGORIES, source, target)
+        journal = OperationJournal.create(journal_dir, mode, source, target)
+        journal.plan(plan)
+        PlacementExecutor(mode).run(plan.tasks()[:placed], on_done=journal.finished, on_start=journal.started)
+        journal.sync()
+        # 进程崩溃：文件句柄关闭（锁随之释放），没有结束记录
+        journal._file.close()
+        return journal.run_id
+    return run
+
+
+def target_of(folders, filename):
+    category = CATEGORIES[CLASSIFICATIONS[FILES.index(filename)]]
+    return os.path.join(folders[1], category, filename)
+
+
+def test_crashed_run_is_incomplete(folders, crashed_run):
+    run_id = crashed_run()
+    state = load_run(folders[2], run_id)
+    assert state['status'] == RUN_INCOMPLETE
+    assert state['plan'].counts()['placed'] == 2
+    assert list_runs(folders[2])[0]['status'] == RUN_INCOMPLETE
+
+
+def test_resume_after_crash(folders, crashed_run, write_file):
+    run_id = crashed_run()
+    # 第三个文件开始放置后崩溃：只写了一半，也没有完成记录
+    source, target, journal_dir = folders
+    journal = OperationJournal.open(journal_dir, run_id)
+    journal.append({'type': 'start', 'file': FILES[2], 'target': target_of(folders, FILES[2]), 'op': None})
+    journal._file.close()
+    write_file(target_of(folders, FILES[2]), '内容')
+
+    result = resume_run(journal_dir, run_id)
+    assert result['failed'] == 0
+    assert result['placed'] == 2
+    for filename in FILES:
+        with open(target_of(folders, filename), encoding='utf-8') as f:
+            assert f.read() == f"内容 {filename}"
+    assert load_run(journal_dir, run_id)['status'] == RUN_COMPLETED
+    with pytest.raises(ValueError):
+        resume_run(journal_dir, run_id)
+
+
+def test_resume_recovers_lost_done_record(folders, crashed_run):
+    run_id = crashed_run()
+    source, target, journal_dir = folders
+    # 文件已经复制完成，但完成记录在同步前丢失
+    journal = OperationJournal.open(journal_dir, run_id)
+    journal.append({'type': 'start', 'file': FILES[2], 'target': target_of(folders, FILES[2]), 'op': None})
+    journal._file.close()
+    shutil.copy2(os.path.join(source, FILES[2]), target_of(folders, FILES[2]))
+
+    result = resume_run(journal_dir, run_id)
+    assert result['recovered'] == 1
+    assert result['placed'] == 1
+    plan = load_run(journal_dir, run_id)['plan']
+    assert plan.operations[plan.row(FILES[2])] == OP_COPY
+
+
+def test_rollback_after_crash(folders, crashed_run, write_file):
+    run_id = crashed_run()
+    source, target, journal_dir = folders
+    write_file(target_of(folders, FILES[2]), '写了一半')
+    journal = OperationJournal.open(journal_dir, run_id)
+    journal.append({'type': 'start', 'file': FILES[2], 'target': target_of(folders, FILES[2]), 'op': None})
+    journal._file.close()
+    write_file(target_of(folders, FILES[2]) + '.part', '写了')
+
+    result = rollback_run(journal_dir, run_id)
+    assert not result['failed_files']
+    for filename in FILES:
+        assert os.path.exists(os.path.join(source, filename))
+        assert not os.path.exists(target_of(folders, filename))
+    assert not os.path.exists(target_of(folders, FILES[2]) + '.part')
+    assert load_run(journal_dir, run_id)['status'] == RUN_ROLLED_BACK
+    with pytest.raises(ValueError):
+        rollback_run(journal_dir, run_id)
+
+
+def test_rollback_after_move_crash(folders, crashed_run):
+    run_id = crashed_run(mode='move')
+    source, target, journal_dir = folders
+    assert not os.path.exists(os.path.join(source, FILES[0]))
+    rollback_run(journal_dir, run_id)
+    for filename in FILES:
+        with open(os.path.join(source, filename), encoding='utf-8') as f:
+            assert f.read() == f"内容 {filename}"
+
+
+def test_cleanup_verifies_before_deleting(folders, crashed_run, write_file):
+    run_id = crashed_run(placed=len(FILES))
+    source, target, journal_dir = folders
+    resume_run(journal_dir, run_id)
+    # 目标文件被改过：清理时必须保留对应的源文件
+    write_file(target_of(folders, FILES[1]), '被修改的内容，长度不同')
+
+    result = cleanup_run(journal_dir, run_id, verify='fast')
+    verdicts = {item['file']: item['verdict'] for item in result['verdicts']}
+    assert verdicts[FILES[1]] == VERDICT_MISMATCH
+    assert result['deleted_count'] == len(FILES) - 1
+    assert os.path.exists(os.path.join(source, FILES[1]))
+    for filename in FILES[:1] + FILES[2:]:
+        assert verdicts[filename] == VERDICT_DELETED
+        assert not os.path.exists(os.path.join(source, filename))
+
+    # 撤回时把清理掉的源文件从目标复制回来
+    rollback_run(journal_dir, run_id)
+    for filename in FILES:
+        assert os.path.exists(os.path.join(source, filename))
+
+
+def test_locked_run_is_refused(folders, crashed_run):
+    run_id = crashed_run()
+    journal_dir = folders[2]
+    journal = OperationJournal.open(journal_dir, run_id)
+    try:
+        assert list_runs(journal_dir)[0]['status'] == RUN_RUNNING
+        for operation in (resume_run, rollback_run, cleanup_run):
+            with pytest.raises(RunLockedError):
+                operation(journal_dir, run_id)
+    finally:
+        journal.close()
+    assert list_runs(journal_dir)[0]['status'] == RUN_INCOMPLETE
+    resume_run(journal_dir, run_id)
+
+
+@pytest.mark.parametrize('mode', ['move', 'copy'])
+def test_rollback_same_run_duplicates(folders, write_file, mode):
+    """同一次运行中内容相同的文件只放置一份，撤回后两个源文件都要回来"""
+    source, target, journal_dir = folders
+    files = ['a.txt', 'b.txt']
+    for filename in files:
+        write_file(os.path.join(source, filename), '相同的内容')
+    plan = PlacementPlan.build(files, [0, 0], CATEGORIES, source, target)
+    journal = OperationJournal.create(journal_dir, mode, source, target)
+    journal.plan(plan)
+    # 单线程按顺序放置：b.txt 与刚放置的 a.txt 内容相同
+    PlacementExecutor(mode, max_workers=1).run(plan.tasks(), on_done=journal.finished, on_start=journal.started)
+    journal.commit()
+    journal.close()
+    run_id = journal.run_id
+
+    operations = load_run(journal_dir, run_id)['plan'].operations
+    assert sorted(operations) == sorted([OP_DEDUPED if mode == 'move' else OP_DUPLICATE,
+                                         OP_RENAME if mode == 'move' else OP_COPY])
+    if mode == 'copy':
+        assert cleanup_run(journal_dir, run_id)['deleted_count'] == 2
+
+    result = rollback_run(journal_dir, run_id)
+    assert not result['failed_files']
+    for filename in files:
+        with open(os.path.join(source, filename), encoding='utf-8') as f:
+            assert f.read() == '相同的内容'
+    assert not os.path.exists(os.path.join(target, CATEGORIES[0]))
+
+
+def test_rollback_reports_missing_only_copy(folders, crashed_run):
+    """源文件已清理、目标又不见了：撤回失败，不能当作“无需删除”"""
+    source, target, journal_dir = folders
+    run_id = crashed_run(placed=len(FILES))
+    resume_run(journal_dir, run_id)
+    cleanup_run(journal_dir, run_id)
+    os.remove(target_of(folders, FILES[0]))
+
+    result = rollback_run(journal_dir, run_id)
+    assert result['failed_files'] == [FILES[0]]
+    assert load_run(journal_dir, run_id)['status'] == RUN_COMPLETED
+    for filename in FILES[1:]:
+        assert os.path.exists(os.path.join(source, filename))
+
+
+def test_newest_backups_of_different_runs_do_not_collide(folders, write_file):
+    """两次运行先后用 newest 策略替换同一目标，撤回时各自恢复自己替换掉的文件"""
+    source, target, journal_dir = folders
+    target_path = write_file(os.path.join(target, CATEGORIES[0], 'a.txt'), '原有')
+    os.utime(target_path, (1000, 1000))
+
+    run_ids = []
+    for n, content in enumerate(['第一次', '第二次']):
+        src = write_file(os.path.join(source, 'a.txt'), content)
+        os.utime(src, (2000 + n, 2000 + n))
+        plan = PlacementPlan.build(['a.txt'], [0], CATEGORIES, source, target)
+        journal = OperationJournal.create(journal_dir, 'copy', source, target)
+        journal.plan(plan)
+        PlacementExecutor('copy', collision_policy='newest', run_id=journal.run_id).run(
+            plan.tasks(), on_done=journal.finished, on_start=journal.started)
+        journal.commit()
+        journal.close()
+        run_ids.append(journal.run_id)
+
+    for run_id, expected in zip(reversed(run_ids), ['第一次', '原有']):
+        assert not rollback_run(journal_dir, run_id)['failed_files']
+        with open(target_path, encoding='utf-8') as f:
+            assert f.read() == expected
@@ -0,0 +1,138 @@
+# tests/test_placement.py
+"""目标路径占用（claim）与冲突策略、清理前校验"""
+
+import os
+import time
+
+import pytest
+
+import placement
+from placement import (
+    TargetFolders, PlacementExecutor, PlacementTask, link_file, verify_placement, suffixed_path, replaced_path,
+    OP_COPY, OP_HARDLINK, OP_SYMLINK, OP_DUPLICATE,
+    VERDICT_OK, VERDICT_MISMATCH, VERDICT_TARGET_MISSING, VERDICT_SOURCE_MISSING
+)
+
+
+@pytest.mark.parametrize('policy', ['suffix', 'newest', 'skip', 'overwrite'])
+def test_claim_free_path(folders, policy, write_file):
+    source, target, _ = folders
+    src = write_file(os.path.join(source, 'a.txt'), 'a')
+    path = os.path.join(target, 'a.txt')
+    assert TargetFolders().claim(path, src, policy) == path
+
+
+def test_claim_suffix_skips_existing_and_reserved(folders, write_file):
+    source, target, _ = folders
+    src = write_file(os.path.join(source, 'a.txt'), 'new')
+    path = write_file(os.path.join(target, 'a.txt'), 'old')
+    folders_ = TargetFolders()
+    folders_.claim(suffixed_path(path, 1), src, 'suffix')
+    assert folders_.claim(path, src, 'suffix') == suffixed_path(path, 2)
+
+
+def test_claim_skip_existing(folders, write_file):
+    source, target, _ = folders
+    src = write_file(os.path.join(source, 'a.txt'), 'new')
+    path = write_file(os.path.join(target, 'a.txt'), 'old')
+    assert TargetFolders().claim(path, src, 'skip') is None
+
+
+def test_claim_reserved_path_never_handed_out_twice(folders, write_file):
+    source, target, _ = folders
+    src = write_file(os.path.join(source, 'a.txt'), 'a')
+    path = os.path.join(target, 'a.txt')
+    for policy in ('suffix', 'newest', 'overwrite'):
+        folders_ = TargetFolders()
+        assert folders_.claim(path, src, policy) == path
+        assert folders_.claim(path, src, policy) == suffixed_path(path, 1)
+    folders_ = TargetFolders()
+    folders_.claim(path, src, 'skip')
+    assert folders_.claim(path, src, 'skip') is None
+
+
+def test_claim_release_frees_path(folders, write_file):
+    source, target, _ = folders
+    src = write_file(os.path.join(source, 'a.txt'), 'a')
+    path = os.path.join(target, 'a.txt')
+    folders_ = TargetFolders()
+    folders_.claim(path, src, 'suffix')
+    folders_.release(path)
+    assert folders_.claim(path, src, 'suffix') == path
+
+
+def test_claim_newest(folders, write_file):
+    source, target, _ = folders
+    path = write_file(os.path.join(target, 'a.txt'), 'old')
+    src = write_file(os.path.join(source, 'a.txt'), 'new')
+    now = time.time()
+
+    os.utime(src, (now - 100, now - 100))
+    assert TargetFolders().claim(path, src, 'newest') is None
+    assert os.listdir(target) == ['a.txt']
+
+    os.utime(src, (now + 100, now + 100))
+    folders_ = TargetFolders('run1')
+    assert folders_.claim(path, src, 'newest') == path
+    assert not os.path.exists(path)
+    assert open(replaced_path(path, 'run1'), encoding='utf-8').read() == 'old'
+
+
+def test_claim_overwrite(folders, write_file):
+    source, target, _ = folders
+    path = write_file(os.path.join(target, 'a.txt'), 'old')
+    src = write_file(os.path.join(source, 'a.txt'), 'new')
+    assert TargetFolders().claim(path, src, 'overwrite') == path
+
+
+def test_find_identical(folders, write_file):
+    source, target, _ = folders
+    src = write_file(os.path.join(source, 'a.txt'), 'same')
+    existing = write_file(os.path.join(target, 'b.txt'), 'same')
+    write_file(os.path.join(target, 'c.txt'), 'diff')
+    assert TargetFolders().find_identical(target, src, os.path.getsize(src)) == existing
+
+
+def test_link_file_same_inode_leaves_no_temp(folders, write_file):
+    source, target, _ = folders
+    src = write_file(os.path.join(source, 'a.txt'), 'a')
+    path = os.path.join(target, 'a.txt')
+    assert link_file(src, path) == OP_HARDLINK
+    assert link_file(src, path) == OP_HARDLINK
+    assert os.listdir(target) == ['a.txt']
+
+
+def test_verify_placement(folders, write_file):
+    source, target, _ = folders
+    src = write_file(os.path.join(source, 'a.txt'), 'content')
+    path = write_file(os.path.join(target, 'a.txt'), 'content')
+    stat = os.stat(src)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert verify_placement(src, path, OP_COPY, 'fast')[0] == VERDICT_OK
+    assert verify_placement(src, path, OP_COPY, 'strict')[0] == VERDICT_OK
+
+    # 大小和修改时间相同、内容不同：只有 strict 能发现
+    write_file(path, 'CONTENT')
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert verify_placement(src, path, OP_COPY, 'fast')[0] == VERDICT_OK
+    assert verify_placement(src, path, OP_COPY, 'strict')[0] == VERDICT_MISMATCH
+
+    write_file(path, 'longer content')
+    assert verify_placement(src, path, OP_COPY, 'fast')[0] == VERDICT_MISMATCH
+
+    os.remove(path)
+    assert verify_placement(src, path, OP_COPY, 'fast')[0] == VERDICT_TARGET_MISSING
+    os.remove(src)
+    assert verify_placement(src, path, OP_DUPLICATE, 'fast')[0] == VERDICT_SOURCE_MISSING
+
+
+def test_link_modes_skip_dedupe(folders, write_file, monkeypatch):
+    source, target, _ = folders
+    src = write_file(os.path.join(source, 'a.txt'), 'same')
+    write_file(os.path.join(target, 'b.txt'), 'same')
+    monkeypatch.setattr(placement, 'file_digest', lambda path: pytest.fail('链接模式不应计算哈希'))
+    for mode in ('link', 'symlink'):
+        task = PlacementTask('a.txt', src, os.path.join(target, f"{mode}.txt"), 4, 0, 0)
+        operations, errors, _ = PlacementExecutor(mode).run([task])
+        assert not errors
+        assert operations['a.txt'][0] in (OP_HARDLINK, OP_SYMLINK)
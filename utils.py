@@ -6,12 +6,22 @@
 import os
 import re
 import json
-import shutil
+import fnmatch
 import configparser
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator, Iterable, NamedTuple
 import requests
 
+from ai_client import AIClient
+from placement import (
+    PlacementExecutor, undo_placement,
+    OP_COPY, OP_HARDLINK, OP_SYMLINK, OP_DUPLICATE, OP_DEDUPED
+)
+from placement_plan import PlacementPlan, resolve_target_folder, ROW_PLACED, ROW_FAILED, ROW_SKIPPED, ROW_CLEANED, ROW_UNDONE
+
+
+# 发送给AI的系统提示词
+SYSTEM_PROMPT = "你是一个专业的文件分类助手，需要根据文件名推测内容并进行准确分类。"
 
 def load_config(config_file: str = "config.ini") -> Optional[configparser.ConfigParser]:
     """加载配置文件"""
@@ -45,27 +55,130 @@ def load_config(config_file: str = "config.ini") -> Optional[configparser.Config
         return None
 
 
-def get_files(source_folder: str, extensions: List[str] = None) -> List[str]:
-    """获取指定文件夹中的所有文件（支持多种扩展名）"""
+class FileEntry(NamedTuple):
+    """扫描到的文件：name 为相对于源文件夹的路径，size/mtime 来自目录项的同一次 stat"""
+    name: str
+    path: str
+    size: int
+    mtime: float
+
+
+# 下载中、编辑器锁定或临时生成的文件，扫描时跳过
+TEMP_FILE_PATTERNS = ['~$*', '.~lock.*', '*.tmp', '*.temp', '*.part', '*.crdownload', '*.download', '*.swp']
+
+
+def _match_any(name: str, rel_path: str, patterns: List[str]) -> bool:
+    """文件名或相对路径匹配任一通配符"""
+    return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel_path, p) for p in patterns)
+
+
+def list_directory(folder: str, prefix: str = '', extensions: List[str] = None,
+                   include: List[str] = None, exclude: List[str] = None,
+                   skip_hidden: bool = True) -> Tuple[List[FileEntry], List[Tuple[str, str]]]:
+    """用一次 os.scandir 列出单个目录
+    
+    返回 (符合条件的文件, 子目录列表 [(路径, 相对路径)])；prefix 为该目录相对于源文件夹的路径；
+    include / exclude 为通配符列表，匹配文件名或相对路径，exclude 也作用于目录；
+    skip_hidden 为真时跳过隐藏文件、隐藏目录和临时文件
+    """
+    normalized_exts = {ext.lower() if ext.startswith('.') else f".{ext.lower()}" for ext in extensions or []}
+    exclude = exclude or []
+    files, subdirs = [], []
+    
+    with os.scandir(folder) as it:
+        for entry in it:
+            name = entry.name
+            rel_path = os.path.join(prefix, name) if prefix else name
+            if skip_hidden and (name.startswith('.') or _match_any(name, rel_path, TEMP_FILE_PATTERNS)):
+                continue
+            if _match_any(name, rel_path, exclude):
+                continue
+            
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append((entry.path, rel_path))
+                continue
+            
+            if not entry.is_file():
+                continue
+            if normalized_exts and os.path.splitext(name)[1].lower() not in normalized_exts:
+                continue
+            if include and not _match_any(name, rel_path, include):
+                continue
+            
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append(FileEntry(rel_path, entry.path, stat.st_size, stat.st_mtime))
+    
+    return files, subdirs
+
+
+def iter_files(source_folder: str, extensions: List[str] = None, recursive: bool = False,
+               max_depth: Optional[int] = None, include: List[str] = None,
+               exclude: List[str] = None, skip_hidden: bool = True) -> Iterator[FileEntry]:
+    """基于 os.scandir 逐个目录产出文件，不需要先列出整个目录树
+    
+    recursive 为真时进入子目录（max_depth 限制层数，0 表示只扫描顶层），其余参数见 list_directory
+    """
+    stack = [(source_folder, '', 0)]
+    
+    while stack:
+        folder, prefix, depth = stack.pop()
+        try:
+            files, subdirs = list_directory(folder, prefix, extensions, include, exclude, skip_hidden)
+        except OSError as e:
+            print(f"警告: 无法读取目录 {folder}: {e}")
+            continue
+        
+        yield from files
+        if recursive and (max_depth is None or depth < max_depth):
+            stack.extend((path, rel_path, depth + 1) for path, rel_path in subdirs)
+
+
+def get_scan_options(config: configparser.ConfigParser) -> Dict[str, Any]:
+    """从 [PATHS] 配置读取扫描选项"""
+    paths = config['PATHS']
+    
+    def patterns(key):
+        return [p.strip() for p in paths.get(key, '').split(',') if p.strip()]
+    
+    max_depth = paths.get('max_depth', '').strip()
+    return {
+        'recursive': paths.getboolean('recursive', fallback=False),
+        'max_depth': int(max_depth) if max_depth else None,
+        'include': patterns('include'),
+        'exclude': patterns('exclude'),
+        'skip_hidden': paths.getboolean('skip_hidden', fallback=True)
+    }
+
+
+def stream_pending(entries: Iterable[FileEntry], filenames: List[str],
+                   prepare: Callable[[List[int]], List[int]], chunk_size: Optional[int] = 256) -> Iterator[int]:
+    """边扫描边产出需要调用AI的文件下标（供 dispatch_batches 使用）
+
+    扫描到的文件名追加到 filenames，每攒够 chunk_size 个（None 表示全部扫描完）调用一次
+    prepare(这些文件的下标)，由它查询缓存、运行本地分类和聚类，返回仍需调用AI的下标
+    """
+    chunk = []
+    for entry in entries:
+        filenames.append(entry.name)
+        chunk.append(len(filenames) - 1)
+        if chunk_size and len(chunk) >= chunk_size:
+            yield from prepare(chunk)
+            chunk = []
+    if chunk:
+        yield from prepare(chunk)
+
+
+def get_files(source_folder: str, extensions: List[str] = None, **scan_options) -> List[str]:
+    """获取指定文件夹中的所有文件（支持多种扩展名），scan_options 见 iter_files"""
     if not os.path.exists(source_folder):
         print(f"警告: 源文件夹 {source_folder} 不存在，正在创建...")
         os.makedirs(source_folder, exist_ok=True)
         return []
     
-    all_files = []
-    
-    for file in os.listdir(source_folder):
-        if os.path.isfile(os.path.join(source_folder, file)):
-            if extensions:
-                # 检查文件扩展名
-                file_ext = os.path.splitext(file)[1].lower()
-                if any(file_ext == ext.lower() or file_ext == f".{ext.lower()}" for ext in extensions):
-                    all_files.append(file)
-            else:
-                # 如果没有指定扩展名，返回所有文件
-                all_files.append(file)
-    
-    return sorted(all_files)
+    return sorted(entry.name for entry in iter_files(source_folder, extensions, **scan_options))
 
 
 def build_ai_prompt(filenames: List[str], 
@@ -99,61 +212,80 @@ def build_ai_prompt(filenames: List[str],
 """
     
     # 添加每个文件的信息
-    for i, filename in enumerate(filenames, 1):
-        prompt += f"\n[{i}] 文件名: {filename}"
-        prompt += "\n" + "-"*40
-    
-    return prompt
+    separator = "\n" + "-"*40
+    return prompt + "".join(f"\n[{i}] 文件名: {filename}{separator}" for i, filename in enumerate(filenames, 1))
+
+
+def parse_category_descriptions(category_descriptions: str) -> Dict[str, str]:
+    """解析分类描述配置（每行格式：分类标签:描述）"""
+    descriptions = {}
+    for line in category_descriptions.strip().split('\n'):
+        line = line.strip()
+        if ':' not in line:
+            continue
+        category, description = line.split(':', 1)
+        descriptions[category.strip()] = description.strip()
+    return descriptions
+
+
+def build_compact_system_prompt(categories: List[str], category_descriptions: str) -> str:
+    """构建紧凑模式的系统提示词
+
+    指令和分类表只依赖配置，所有批次完全相同，可以命中服务商的前缀缓存
+    """
+    descriptions = parse_category_descriptions(category_descriptions)
+    category_table = "\n".join(
+        f"{i}={cat}（{descriptions[cat]}）" if descriptions.get(cat) else f"{i}={cat}"
+        for i, cat in enumerate(categories, 1)
+    )
+    return f"""{SYSTEM_PROMPT}
+类别：
+{category_table}
+根据文件名（含扩展名）推测主题，选最突出的一类。每行输出"序号:类别号"，不输出其他内容。"""
+
+
+def build_ai_messages(filenames: List[str], categories: List[str],
+                      category_descriptions: str, prompt_mode: str = 'standard') -> List[Dict[str, str]]:
+    """构建发送给AI的消息列表
+
+    standard: 原有的详细提示词；compact: 稳定的系统提示词前缀 + 紧凑的编号文件列表
+    """
+    if prompt_mode == 'compact':
+        return [
+            {"role": "system", "content": build_compact_system_prompt(categories, category_descriptions)},
+            {"role": "user", "content": "\n".join(f"{i}.{filename}" for i, filename in enumerate(filenames, 1))}
+        ]
+    
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_ai_prompt(filenames, categories, category_descriptions)}
+    ]
 
 
 def call_ai_api(filenames: List[str],
                 categories: List[str], category_descriptions: str,
-                api_config: Dict[str, str]) -> str:
-    """调用AI API进行分类（仅基于文件名）"""
+                api_config: Dict[str, str], settings=None,
+                max_tokens: int = 500, on_line: Callable[[str], None] = None) -> str:
+    """调用AI API进行分类（仅基于文件名）
+
+    settings 为配置中的 [SETTINGS] 部分，用于超时、重试、限流和提示词模式；
+    max_tokens 应与批次大小匹配，避免回复被截断；
+    提供 on_line 时使用流式请求，每收到一行回复就回调一次
+    """
     
     # 构建提示词
-    prompt = build_ai_prompt(filenames, categories, category_descriptions)
-    
-    # API配置
-    api_key = api_config.get('api_key')
-    base_url = api_config.get('base_url', 'https://api.deepseek.com')
-    model = api_config.get('model', 'deepseek-chat')
+    prompt_mode = settings.get('prompt_mode', 'standard') if settings else 'standard'
+    messages = build_ai_messages(filenames, categories, category_descriptions, prompt_mode)
     
-    # 准备请求数据
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "model": model,
-        "messages": [
-            {
-                "role": "system", 
-                "content": "你是一个专业的文件分类助手，需要根据文件名推测内容并进行准确分类。"
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "temperature": 0.1,  # 低温度以获得更确定的输出
-        "max_tokens": 500
-    }
-    
-    # 确定API端点
-    if "openai.com" in base_url:
-        url = f"{base_url}/chat/completions"
-    else:
-        url = f"{base_url}/chat/completions"
+    client = AIClient(api_config, settings)
     
     try:
-        print(f"调用AI API ({model})...")
-        response = requests.post(url, headers=headers, json=data, timeout=30)
-        response.raise_for_status()
-        
-        result = response.json()
-        ai_response = result['choices'][0]['message']['content'].strip()
+        print(f"调用AI API ({client.model})...")
+        # 低温度以获得更确定的输出
+        if on_line is not None:
+            ai_response = client.chat_stream(messages, max_tokens=max_tokens, temperature=0.1, on_line=on_line)
+        else:
+            ai_response = client.chat(messages, max_tokens=max_tokens, temperature=0.1)
         
         print("AI响应接收成功")
         return ai_response
@@ -166,46 +298,122 @@ def call_ai_api(filenames: List[str],
         raise
 
 
-def parse_ai_response(response: str, expected_count: int, category_count: int) -> List[int]:
-    """解析AI返回的分类结果"""
-    classifications = []
+def parse_response_line(line: str, expected_count: int,
+                        category_count: int) -> Optional[Tuple[int, int]]:
+    """解析一行 "序号:标签序号"，有效时返回 (文件下标, 分类索引)（均为0-based）"""
+    match = re.match(r'^(\d+)[:\s]+(\d+)$', line.strip())
+    if not match:
+        return None
     
-    # 按行分割
-    lines = response.strip().split('\n')
+    file_index = int(match.group(1))
+    category_index = int(match.group(2))
     
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # 匹配格式: "序号:标签序号"
-        match = re.match(r'^(\d+)[:\s]+(\d+)$', line)
-        if match:
-            file_index = int(match.group(1))
-            category_index = int(match.group(2))
-            
-            # 验证索引范围
-            if 1 <= file_index <= expected_count and 1 <= category_index <= category_count:
-                classifications.append(category_index - 1)  # 转换为0-based索引
+    # 验证索引范围
+    if 1 <= file_index <= expected_count and 1 <= category_index <= category_count:
+        return file_index - 1, category_index - 1  # 转换为0-based索引
+    return None
+
+
+def parse_ai_response(response: str, expected_count: int, category_count: int) -> Dict[int, int]:
+    """解析AI返回的分类结果
+    
+    返回 文件下标(0-based) -> 分类索引(0-based) 的映射，只包含格式正确、
+    序号和标签都有效的行；缺失的文件由调用方单独重新查询，不做猜测
+    """
+    classifications = {}
+    
+    # 按行分割，同一序号重复出现时以第一次为准
+    for line in response.strip().split('\n'):
+        parsed = parse_response_line(line, expected_count, category_count)
+        if parsed and parsed[0] not in classifications:
+            classifications[parsed[0]] = parsed[1]
     
-    # 如果解析出的结果数量不对，尝试其他格式
     if len(classifications) != expected_count:
         print(f"警告: 解析结果数量({len(classifications)})与预期({expected_count})不符")
         print(f"AI原始响应:\n{response}")
-        
-        # 尝试只提取数字
-        all_numbers = re.findall(r'\b\d+\b', response)
-        if len(all_numbers) >= expected_count:
-            classifications = []
-            for i in range(expected_count):
-                if i < len(all_numbers):
-                    num = int(all_numbers[i])
-                    if 1 <= num <= category_count:
-                        classifications.append(num - 1)
     
     return classifications
 
 
+def find_missing_indices(classifications: Dict[int, int], expected_count: int) -> List[int]:
+    """找出没有得到有效分类的文件下标"""
+    return [i for i in range(expected_count) if i not in classifications]
+
+
+def classify_batch(filenames: List[str], categories: List[str], category_descriptions: str,
+                   api_config: Dict[str, str], settings=None,
+                   max_tokens: int = 500,
+                   on_result: Callable[[int, int], None] = None) -> Tuple[Dict[int, int], int]:
+    """分类一批文件，对缺失或无效的序号只重新提交这些文件
+    
+    返回 (文件下标 -> 分类索引, 首次请求中缺失的文件数)；
+    重试 requery_rounds 轮后仍缺失的文件不会出现在结果中。
+    提供 on_result 且启用 stream_responses 时，每解析出一个文件就回调 on_result(文件下标, 分类索引)
+    """
+    stream = (settings is not None
+              and str(settings.get('stream_responses', 'false')).lower() in ('true', 'yes', '1', 'on'))
+    
+    def line_handler(index_map):
+        """把流式回复的每一行映射回本批次的文件下标"""
+        if on_result is None or not stream:
+            return None
+        seen = set()
+        
+        def on_line(line):
+            parsed = parse_response_line(line, len(index_map), len(categories))
+            if parsed and parsed[0] not in seen:
+                seen.add(parsed[0])
+                on_result(index_map[parsed[0]], parsed[1])
+        return on_line
+    
+    response = call_ai_api(filenames, categories, category_descriptions,
+                           api_config, settings, max_tokens=max_tokens,
+                           on_line=line_handler(list(range(len(filenames)))))
+    classifications = parse_ai_response(response, len(filenames), len(categories))
+    missing = find_missing_indices(classifications, len(filenames))
+    first_pass_missing = len(missing)
+    
+    requery_rounds = int(settings.get('requery_rounds', 2)) if settings else 2
+    for _ in range(requery_rounds):
+        if not missing:
+            break
+        
+        print(f"有 {len(missing)} 个文件未得到有效分类，仅重新查询这些文件...")
+        retry_files = [filenames[i] for i in missing]
+        try:
+            response = call_ai_api(retry_files, categories, category_descriptions,
+                                   api_config, settings, max_tokens=max_tokens,
+                                   on_line=line_handler(missing))
+        except Exception as e:
+            print(f"重新查询失败: {e}")
+            break
+        
+        retry_classifications = parse_ai_response(response, len(retry_files), len(categories))
+        for j, category_idx in retry_classifications.items():
+            classifications[missing[j]] = category_idx
+        missing = find_missing_indices(classifications, len(filenames))
+    
+    return classifications, first_pass_missing
+
+
+def run_local_stages(stages: List[Any], filenames: List[str],
+                     pending: List[int]) -> Tuple[Dict[int, int], List[int], Dict[str, int]]:
+    """依次运行本地分类阶段，每个阶段只处理前面阶段没有分类的文件
+    
+    每个阶段需提供 name 属性和 split(文件名列表, 文件下标列表) -> (命中结果, 剩余下标) 方法；
+    返回 (文件下标 -> 分类索引, 仍需调用AI的文件下标, 各阶段命中数)
+    """
+    resolved = {}
+    stage_hits = {}
+    for stage in stages:
+        if not pending:
+            break
+        matched, pending = stage.split(filenames, pending)
+        resolved.update(matched)
+        stage_hits[stage.name] = len(matched)
+    return resolved, pending, stage_hits
+
+
 def parse_category_paths(config: configparser.ConfigParser) -> Dict[str, str]:
     """解析分类标签的目标路径配置"""
     category_paths = {}
@@ -231,88 +439,96 @@ def parse_category_paths(config: configparser.ConfigParser) -> Dict[str, str]:
 def classify_files(filenames: List[str], classifications: List[int], 
                   categories: List[str], source_folder: str, 
                   target_base_folder: str,
-                  category_paths: Dict[str, str] = None) -> Dict[str, Any]:
-    """根据分类结果整理文件"""
+                  category_paths: Dict[str, str] = None,
+                  placement_mode: str = 'copy',
+                  on_progress: Callable[[Dict[str, float]], None] = None,
+                  journal=None,
+                  **executor_options) -> Dict[str, Any]:
+    """根据分类结果整理文件，placement_mode 为 copy（复制）、move（移动）、link（硬链接）或 symlink（符号链接）
+    
+    先生成放置计划（见 PlacementPlan.build），再在线程池中并行放置，
+    executor_options 见 PlacementExecutor（线程数、每个设备的并发数、大文件分块复制参数）；
+    on_progress(进度统计) 在复制过程中按块回调；
+    目标文件夹中已有内容相同的文件时不再放置，记录的目标路径为该文件；按冲突策略跳过的文件列入 skipped_files；
+    journal 为 journal.OperationJournal 时，放置前写入计划，每个文件开始和完成时追加记录，全部结束后写入结束记录
+    """
+    action = {'move': '移动', 'link': '链接', 'symlink': '链接'}.get(placement_mode, '复制')
+    
+    plan = PlacementPlan.build(filenames, classifications, categories, source_folder,
+                               target_base_folder, category_paths)
+    tasks = plan.tasks()
+    
+    executor = PlacementExecutor(placement_mode, run_id=journal.run_id if journal is not None else None,
+                                 **executor_options)
+    if journal is not None:
+        journal.plan(plan)
+        operations, errors, throughput = executor.run(tasks, on_done=journal.finished, on_progress=on_progress,
+                                                      on_start=journal.started)
+    else:
+        operations, errors, throughput = executor.run(tasks, on_progress=on_progress)
     
-    # 如果没有提供自定义路径映射，使用默认目标文件夹
-    if category_paths is None:
-        category_paths = {}
+    for filename, (operation, target_path) in operations.items():
+        plan.record(filename, operation, target_path)
+    for filename, error in errors.items():
+        plan.fail(filename, f"{action}失败 - {error}")
     
-    # 分类统计
+    # 按原始顺序汇总结果
     category_stats = {category: 0 for category in categories}
-    success_count = 0
-    failed_count = 0
-    failed_files = []
-    
-    # 记录每个文件的目标路径，用于可能的撤回操作
-    file_target_paths = {}
-    
-    # 复制文件到对应分类文件夹
-    for i, (filename, category_idx) in enumerate(zip(filenames, classifications)):
-        if i >= len(classifications):
-            print(f"警告: 文件 {filename} 没有对应的分类，跳过")
-            failed_count += 1
-            failed_files.append(filename)
-            continue
-            
-        if category_idx < 0 or category_idx >= len(categories):
-            print(f"警告: 文件 {filename} 的分类索引 {category_idx} 无效，跳过")
-            failed_count += 1
-            failed_files.append(filename)
-            continue
-        
-        category = categories[category_idx]
-        source_path = os.path.join(source_folder, filename)
-        
-        # 确定目标路径：优先使用自定义路径，否则使用默认路径
-        if category in category_paths:
-            target_folder = category_paths[category]
-            # 确保路径是相对于当前目录的绝对路径
-            if not os.path.isabs(target_folder):
-                target_folder = os.path.abspath(target_folder)
-        else:
-            target_folder = os.path.join(target_base_folder, category)
-        
-        # 确保目标文件夹存在
-        os.makedirs(target_folder, exist_ok=True)
-        
-        target_path = os.path.join(target_folder, filename)
-        
-        try:
-            if os.path.exists(source_path):
-                shutil.copy2(source_path, target_path)
-                category_stats[category] += 1
-                success_count += 1
-                
-                # 记录文件的目标路径，用于可能的撤回操作
-                file_target_paths[filename] = target_path
-                
-                # 显示目标路径信息
-                if category in category_paths:
-                    print(f"  ✓ {filename} → {category} ({target_folder})")
-                else:
-                    print(f"  ✓ {filename} → {category}")
-            else:
-                print(f"  ✗ {filename}: 源文件不存在")
-                failed_count += 1
-                failed_files.append(filename)
-                
-        except Exception as e:
-            print(f"  ✗ {filename}: 复制失败 - {e}")
-            failed_count += 1
-            failed_files.append(filename)
+    duplicate_count = 0
+    for row in range(len(plan)):
+        filename = plan.filenames[row]
+        status = plan.status[row]
+        if status == ROW_FAILED:
+            print(f"  ✗ {filename}: {plan.errors.get(row)}")
+        elif status == ROW_SKIPPED:
+            print(f"  ⚠ {filename}: 目标位置已有同名文件，跳过")
+        elif plan.operations[row] in (OP_DUPLICATE, OP_DEDUPED):
+            print(f"  = {filename}: 与已有文件 {os.path.basename(plan.targets[row])} 内容相同，不再{action}")
+            duplicate_count += 1
+        elif os.path.basename(plan.targets[row]) != os.path.basename(filename):
+            print(f"  ⚠ {filename}: 目标位置已有同名文件，另存为 {os.path.basename(plan.targets[row])}")
+        if status == ROW_PLACED:
+            category_stats[plan.category(row)] += 1
+    
+    placed_rows = plan.select(ROW_PLACED)
+    failed_files = [plan.filenames[row] for row in plan.select(ROW_FAILED)]
+    skipped_files = [plan.filenames[row] for row in plan.select(ROW_SKIPPED)]
+    
+    if placed_rows:
+        print(f"  ✓ 已{action} {len(placed_rows)} 个文件（{throughput['bytes'] / 1048576:.1f} MB），"
+              f"用时 {throughput['elapsed']:.2f} 秒，{throughput['bytes_per_second'] / 1048576:.1f} MB/s，"
+              f"{throughput['files_per_second']} 个文件/秒")
+    if duplicate_count or skipped_files:
+        print(f"  其中 {duplicate_count} 个文件与目标文件夹中已有文件内容相同，{len(skipped_files)} 个同名文件被跳过")
+    if journal is not None:
+        journal.commit({'success': len(placed_rows), 'failed': len(failed_files), 'skipped': len(skipped_files)})
     
     return {
-        'success_count': success_count,
-        'failed_count': failed_count,
+        'success_count': len(placed_rows),
+        'failed_count': len(failed_files),
         'failed_files': failed_files,
+        'skipped_files': skipped_files,
+        'duplicate_count': duplicate_count,
         'category_stats': category_stats,
-        'file_target_paths': file_target_paths  # 新增：记录目标路径
+        'file_target_paths': plan.target_paths(placed_rows),  # 记录目标路径
+        'file_operations': {plan.filenames[row]: plan.operations[row] for row in placed_rows},
+        'throughput': throughput,
+        'plan': plan,
+        'run_id': journal.run_id if journal is not None else None
     }
 
 
-def rollback_classification(file_target_paths: Dict[str, str]) -> Dict[str, any]:
-    """撤回分类操作：删除已复制到目标位置的文件"""
+def rollback_classification(plan: PlacementPlan, rows: List[int] = None, journal=None) -> Dict[str, any]:
+    """撤回分类操作：删除已复制到目标位置的文件和链接，已移动的文件移回源文件夹
+    
+    rows 为要撤回的行号，默认为计划中所有已放置（含已清理源文件）的行；
+    源文件是否还在以计划中的状态为准（已清理的复制和硬链接改为移回源文件夹）；
+    journal 不为 None 时每撤回一个文件追加一条撤回记录
+    """
+    if rows is None:
+        rows = plan.select(ROW_PLACED, ROW_CLEANED)
+    # 内容相同而没有放置的行可能指向本次放置的其他文件，先从目标恢复它们的源文件，再撤回被指向的文件
+    rows = sorted(rows, key=lambda row: plan.operations[row] not in (OP_DUPLICATE, OP_DEDUPED))
     
     deleted_count = 0
     failed_to_delete_count = 0
@@ -320,22 +536,48 @@ def rollback_classification(file_target_paths: Dict[str, str]) -> Dict[str, any]
     
     print("\n[撤回操作] 正在删除已分类的文件...")
     
-    for filename, target_path in file_target_paths.items():
+    for row in rows:
+        filename = plan.filenames[row]
+        source_path, target_path, operation = plan.sources[row], plan.targets[row], plan.operations[row]
+        source_kept = plan.status[row] != ROW_CLEANED
+        # 源文件仍在时目标只是副本或链接；否则目标是唯一的副本，找不到就无法恢复
+        target_is_copy = operation == OP_SYMLINK or (operation in (OP_COPY, OP_HARDLINK) and source_kept)
         try:
-            if os.path.exists(target_path):
-                os.remove(target_path)
-                deleted_count += 1
+            undo_placement(source_path, target_path, operation, source_kept,
+                           run_id=journal.run_id if journal is not None else None)
+            plan.mark([row], ROW_UNDONE)
+            if journal is not None:
+                journal.append({'type': 'undo', 'file': filename})
+            if operation == OP_DUPLICATE and source_kept:
+                print(f"  = {filename}: 目标是原有的相同文件，保留")
+                continue
+            deleted_count += 1
+            if operation in (OP_DEDUPED, OP_DUPLICATE):
+                print(f"  ✓ 已恢复源文件: {target_path} → {source_path}")
+            elif target_is_copy:
                 print(f"  ✓ 已删除: {target_path}")
+            elif operation in (OP_COPY, OP_HARDLINK):
+                print(f"  ✓ 已恢复源文件: {target_path} → {source_path}")
             else:
-                print(f"  ⚠ {filename}: 目标文件不存在，无需删除")
-                
+                print(f"  ✓ 已移回: {target_path} → {source_path}")
+        except FileNotFoundError:
+            if not target_is_copy:
+                print(f"  ✗ 无法恢复 {filename}: 目标文件 {target_path} 不存在，源文件已不在")
+                failed_to_delete_count += 1
+                failed_files.append(filename)
+                continue
+            # 源文件被删除后符号链接会失效，undo_placement 只删除链接本身
+            plan.mark([row], ROW_UNDONE)
+            if journal is not None:
+                journal.append({'type': 'undo', 'file': filename})
+            print(f"  ⚠ {filename}: 目标文件不存在，无需删除")
         except Exception as e:
             print(f"  ✗ 删除失败 {target_path}: {e}")
             failed_to_delete_count += 1
             failed_files.append(filename)
     
     # 尝试删除空的分类文件夹
-    for target_path in set(os.path.dirname(path) for path in file_target_paths.values()):
+    for target_path in set(os.path.dirname(plan.targets[row]) for row in rows):
         try:
             if os.path.exists(target_path) and not os.listdir(target_path):
                 os.rmdir(target_path)
@@ -368,16 +610,121 @@ category_paths =
     数学:../学习/数学
     信息学:../学习/信息学
 
+# 本地分类规则（格式：分类标签:规则1,规则2；re: 开头为正则（匹配小写化后的文件名），ext: 开头为扩展名，其余为关键词；
+# 正则可以含逗号，一直延续到下一条 re: / ext: 规则或行尾，无效的正则会被跳过）
+category_rules = 
+    数学:高数,线代,微积分
+    信息学:re:算法|数据结构,ext:.py
+
 [PATHS]
 # 文件路径配置（现在作为默认路径）
 source_folder = ./source_files
 target_base_folder = ./classified_files
+# 是否扫描子目录，以及最大层数（留空表示不限制）
+recursive = false
+max_depth = 
+# 只包含 / 排除匹配这些通配符的文件（逗号分隔，匹配文件名或相对路径）
+include = 
+exclude = 
+# 是否跳过隐藏文件和临时文件
+skip_hidden = true
 
 [SETTINGS]
 # API超时时间（秒）
 api_timeout = 30
 # 最大重试次数
 max_retries = 3
+# 每分钟最大请求数 / token数（0 表示不限制）
+requests_per_minute = 0
+tokens_per_minute = 0
+# 每批最多占用的token数（提示词 + 回复），以及批次大小的初始值和上下限
+batch_token_budget = 3000
+batch_size = 30
+min_batch_size = 5
+max_batch_size = 60
+# 单批目标延迟（秒），超过后自动缩小批次
+target_batch_latency = 20
+# 命令行工具不使用扫描索引时边扫描边分类，每扫描到这么多个文件就开始查询缓存、本地分类并发送批次
+scan_chunk_files = 256
+# 并发请求的最大批次数
+max_concurrency = 4
+# 是否使用流式回复（每个文件的结果到达后立即更新进度）
+stream_responses = true
+# 是否启用本地规则预分类（关键词 / 正则 / 扩展名命中唯一分类的文件不再调用AI）
+local_rules = true
+# 是否启用从用户调整和确认结果中学习的本地模型
+local_learner = true
+# 是否根据已整理的目标文件夹中的相似文件名直接分类
+neighbor_index = true
+# 目标文件夹扫描结果缓存、近邻数、最低相似度、近邻意见的最低一致度
+neighbor_index_file = .neighbor_index.json
+neighbor_k = 5
+neighbor_min_similarity = 0.6
+neighbor_min_agreement = 0.8
+# 是否用 SQLite 扫描索引记录见过的文件（重新扫描只列出有变化的目录，已整理的文件不再重新分类）
+scan_index = true
+scan_index_file = .scan_index.db
+# 文件放置方式：copy 复制（源文件保留，之后可清理）；move 移动（同一文件系统内直接重命名，跨文件系统时复制校验后删除源文件）；
+# link 硬链接（跨设备时改用符号链接），symlink 符号链接，两者都不占用额外空间，symlink 模式下源文件不能清理
+placement_mode = copy
+# 并行放置文件的线程数，以及每个磁盘同时进行的复制数（机械硬盘建议 1~2）
+placement_workers = 8
+placement_per_device = 4
+# 超过该大小（MB）的文件分块复制（reflink / copy_file_range / sendfile），可显示进度并在中断后续传
+large_file_threshold_mb = 64
+copy_chunk_mb = 64
+# 目标文件夹中已有内容相同的文件时不再放置（只对大小相同的文件计算哈希；link / symlink 模式不去重）
+dedupe_identical = true
+# 同名文件内容不同时：suffix 另存为“文件名 (1).扩展名”；newest 保留较新的文件（旧文件暂存为 .replaced，撤回时恢复）；
+# skip 跳过；overwrite 直接覆盖
+collision_policy = suffix
+# 清理源文件前的校验：fast 比较大小和修改时间；strict 比较完整内容的哈希（较慢，最安全）
+cleanup_verify = fast
+# 操作日志目录：每次整理的计划和完成情况写入 运行ID.jsonl，中断后可继续或按运行ID撤回（python journal.py）
+journal_dir = .journal
+# 日志每写入这么多条或每隔这么多秒同步到磁盘一次（放置计划总是在开始前同步）
+journal_fsync_batch = 64
+journal_fsync_interval = 1.0
+# 网页端同时进行分类的任务数（更多任务排队），结束超过该分钟数的任务自动清除
+max_jobs = 2
+job_retention_minutes = 60
+# 任务存储（SQLite）：服务重启后任务仍在，中断的分类从已保存的结果继续；留空则只保存在内存中
+job_store_file = .jobs.db
+# 分类结果每完成一个批次或攒够这么多条写入一次
+job_store_batch = 500
+# 监视模式（python watch.py）：优先使用 inotify，不可用时按 watch_poll_interval 秒轮询
+watch_use_inotify = true
+watch_poll_interval = 10
+# 有变化后等待安静下来再扫描的秒数；文件修改时间距今不足 watch_settle_seconds 秒视为仍在写入
+watch_debounce_seconds = 2
+watch_settle_seconds = 5
+# 攒批等待秒数、待分类队列上限（队列满时暂停入队）
+watch_batch_wait = 3
+watch_queue_size = 1000
+# 是否自动整理置信度达到阈值的结果；AI结果（含缓存的AI结果）的置信度按 watch_ai_confidence 计算
+watch_auto_execute = false
+watch_min_confidence = 0.9
+watch_ai_confidence = 0.8
+# 标注数据文件（留空则不保存）、启用模型所需的最少样本数、直接本地分类的置信度阈值
+learner_data_file = .training_data.jsonl
+learner_min_samples = 30
+learner_threshold = 0.9
+# 是否对近似重复的文件名聚类，每簇只发送一个代表文件给AI
+cluster_filenames = true
+# 同簇文件被调整为不同分类时是否提示
+flag_inconsistent_clusters = true
+# 部分文件未得到有效分类时，只针对这些文件重新查询的轮数
+requery_rounds = 2
+# 提示词模式：compact（紧凑，节省token）或 standard（详细）
+prompt_mode = compact
+# HTTP连接池大小（0 表示按并发数自动设置）
+http_pool_size = 0
+# 分类结果缓存文件（留空则不启用缓存）
+cache_file = .classify_cache.json
+# 缓存最大条目数（超出后淘汰最久未使用的条目）
+cache_max_entries = 20000
+# 缓存有效期（天）
+cache_ttl_days = 30
 """
     
     with open('config.ini', 'w', encoding='utf-8') as f:
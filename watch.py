@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+监视模式
+持续监视源文件夹，新文件写入完成后自动分批分类；
+置信度达到阈值的结果可直接整理到目标文件夹，其余结果留在扫描索引中，在网页中扫描后确认
+
+用法: python watch.py [--poll] [--once]
+  --poll  不使用 inotify，定时轮询源文件夹
+  --once  处理当前已有的文件后退出
+"""
+
+import os
+import sys
+import time
+import queue
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+import configparser
+from collections import deque
+from typing import List, Dict, Tuple, Optional
+
+from utils import (
+    load_config, iter_files, get_scan_options, classify_batch,
+    classify_files, parse_category_paths
+)
+from classify_cache import load_cache, make_category_key
+from batch_planner import BatchPlanner
+from rules import RuleClassifier
+from learner import LearnedClassifier
+from neighbors import NeighborIndex
+from scan_index import get_scan_index, STATUS_NEW, STATUS_MODIFIED, STATUS_EXECUTED
+from placement import get_placement_options
+from journal import open_journal
+
+
+# inotify 常量（见 <sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class InotifyWatcher:
+    """基于 inotify 的目录变化通知（仅 Linux）
+
+    只报告“有变化”，具体是哪些文件由重新扫描得出，事件队列溢出也不会漏掉文件
+    """
+
+    def __init__(self, root: str, recursive: bool = False, max_depth: Optional[int] = None):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 失败')
+        self.root = root
+        self.recursive = recursive
+        self.max_depth = max_depth
+        self.watches = {}  # 监视描述符 -> 目录
+        self.watch_tree()
+
+    def watch_tree(self):
+        """为根目录（递归模式下还有各级子目录）添加监视，已监视的目录不会重复添加"""
+        watched = set(self.watches.values())
+        stack = [(self.root, 0)]
+        while stack:
+            folder, depth = stack.pop()
+            if folder not in watched:
+                wd = self._libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+                if wd < 0:
+                    print(f"警告: 无法监视目录 {folder}: {os.strerror(ctypes.get_errno())}")
+                    continue
+                self.watches[wd] = folder
+            if self.recursive and (self.max_depth is None or depth < self.max_depth):
+                try:
+                    with os.scandir(folder) as it:
+                        stack.extend((entry.path, depth + 1) for entry in it
+                                     if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.'))
+                except OSError:
+                    continue
+
+    def wait(self, timeout: float) -> bool:
+        """等待最多 timeout 秒，期间有变化时返回 True"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+
+        new_dirs = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size + length
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+            if (mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO)) or mask & IN_Q_OVERFLOW:
+                new_dirs = True
+        if new_dirs and self.recursive:
+            self.watch_tree()
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """轮询：每隔 interval 秒报告一次可能有变化（启用扫描索引时重新扫描只列出有变化的目录，开销很小）"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_poll = time.monotonic() + interval
+
+    def wait(self, timeout: float) -> bool:
+        delay = self._next_poll - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return False
+        time.sleep(max(0.0, delay))
+        self._next_poll = time.monotonic() + self.interval
+        return True
+
+    def close(self):
+        pass
+
+
+def create_watcher(config: configparser.ConfigParser, force_polling: bool = False):
+    """优先使用 inotify，不可用时（非 Linux 或超出监视数量限制）退回轮询"""
+    settings = config['SETTINGS']
+    scan_options = get_scan_options(config)
+    if not force_polling and settings.getboolean('watch_use_inotify', fallback=True):
+        try:
+            return InotifyWatcher(config['PATHS']['source_folder'], scan_options['recursive'],
+                                  scan_options['max_depth'])
+        except (OSError, AttributeError) as e:
+            print(f"inotify 不可用，改为轮询: {e}")
+    return PollingWatcher(settings.getfloat('watch_poll_interval', fallback=10.0))
+
+
+class WatchService:
+    """监视服务：监视线程发现写入完成的新文件放入有界队列，工作线程攒成小批次分类
+
+    队列满时监视线程阻塞等待（新的变化留在 inotify 事件中，之后重新扫描即可发现），
+    突发大量文件时按工作线程的处理速度逐批调用AI
+    """
+
+    def __init__(self, config: configparser.ConfigParser, watcher, once: bool = False):
+        settings = config['SETTINGS']
+        self.config = config
+        self.watcher = watcher
+        self.once = once
+        self.source_folder = config['PATHS']['source_folder']
+        self.scan_options = get_scan_options(config)
+        self.debounce_seconds = settings.getfloat('watch_debounce_seconds', fallback=2.0)
+        self.settle_seconds = settings.getfloat('watch_settle_seconds', fallback=5.0)
+        self.idle_timeout = settings.getfloat('watch_poll_interval', fallback=10.0)
+        self.batch_wait = settings.getfloat('watch_batch_wait', fallback=3.0)
+        self.auto_execute = settings.getboolean('watch_auto_execute', fallback=False)
+        self.min_confidence = settings.getfloat('watch_min_confidence', fallback=0.9)
+
+        self.categories = [c.strip() for c in config['CLASSIFICATION']['categories'].split(',')]
+        self.category_descriptions = config['CLASSIFICATION'].get('category_descriptions', '')
+        self.category_paths = parse_category_paths(config)
+        self.placement_options = get_placement_options(config)
+        self.model = config['API'].get('model', 'deepseek-chat')
+        self.category_key = make_category_key(self.categories, self.category_descriptions)
+        self.cache = load_cache(config)
+        self.scan_index = get_scan_index(config)
+        self.planner = BatchPlanner.from_config(config, self.categories, self.category_descriptions)
+
+        self.learned_classifier = LearnedClassifier.from_config(config, self.categories)
+        neighbor_index = NeighborIndex.from_config(config, self.categories)
+        self.local_stages = [
+            stage for stage in [RuleClassifier.from_config(config, self.categories),
+                                self.learned_classifier, neighbor_index] if stage
+        ]
+        # 各来源结果的置信度：学习模型使用实际的后验概率，近邻取一致度下限，AI结果使用配置值；
+        # 缓存中只有以前的AI结果，与AI结果同样对待
+        ai_confidence = settings.getfloat('watch_ai_confidence', fallback=0.8)
+        self.source_confidence = {
+            'cache': ai_confidence,
+            'rules': 1.0,
+            'neighbors': neighbor_index.min_agreement if neighbor_index else 0.0,
+            'ai': ai_confidence
+        }
+
+        self.queue = queue.Queue(maxsize=max(1, settings.getint('watch_queue_size', fallback=1000)))
+        self.stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self.inflight = set()  # 已入队或正在处理的文件
+        self.handled = {}      # 文件名 -> 处理时的 (大小, 修改时间)，没有变化的文件不再重复处理
+        self.stats = {'classified': 0, 'executed': 0, 'unresolved': 0}
+
+    def find_candidates(self) -> List[str]:
+        """重新扫描源文件夹，返回可能需要分类的文件"""
+        if self.scan_index:
+            self.scan_index.rescan(self.source_folder, **self.scan_options)
+            return [row['name'] for row in self.scan_index.query([STATUS_NEW, STATUS_MODIFIED])]
+        return [entry.name for entry in iter_files(self.source_folder, **self.scan_options)]
+
+    def enqueue_ready(self) -> Optional[float]:
+        """把写入已稳定的文件放入队列
+
+        修改时间距今不足 watch_settle_seconds 的文件视为仍在写入，返回最早需要再检查的等待秒数（没有则返回 None）
+        """
+        next_check = None
+        for name in self.find_candidates():
+            with self._lock:
+                if name in self.inflight:
+                    continue
+            try:
+                stat = os.stat(os.path.join(self.source_folder, name))
+            except OSError:
+                continue
+            if self.handled.get(name) == (stat.st_size, stat.st_mtime):
+                continue
+
+            age = time.time() - stat.st_mtime
+            if age < self.settle_seconds:
+                wait = self.settle_seconds - age
+                next_check = wait if next_check is None else min(next_check, wait)
+                continue
+
+            with self._lock:
+                self.inflight.add(name)
+            if not self._put(name):
+                break
+        return next_check
+
+    def _put(self, name: str) -> bool:
+        """放入队列，队列满时阻塞等待；服务停止时返回 False"""
+        warned = False
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(name, timeout=1)
+                return True
+            except queue.Full:
+                if not warned:
+                    print(f"待分类队列已满（{self.queue.maxsize} 个文件），等待处理...")
+                    warned = True
+        return False
+
+    def run(self):
+        worker = threading.Thread(target=self.worker_loop, daemon=True)
+        worker.start()
+        print(f"开始监视 {self.source_folder}（{type(self.watcher).__name__}），按 Ctrl+C 停止")
+
+        try:
+            # 启动时先处理已有的文件
+            next_check = self.enqueue_ready()
+            while not self.once and not self.stop_event.is_set():
+                changed = self.watcher.wait(self.idle_timeout if next_check is None else next_check)
+                if not changed and next_check is None:
+                    continue
+                if changed:
+                    # 防抖：持续有变化时等待安静下来再扫描，但最多等待 10 个防抖周期
+                    deadline = time.monotonic() + self.debounce_seconds * 10
+                    while time.monotonic() < deadline and self.watcher.wait(self.debounce_seconds):
+                        pass
+                next_check = self.enqueue_ready()
+
+            if self.once:
+                if next_check is not None:
+                    print("部分文件仍在写入，本次跳过")
+                self.queue.join()
+        except KeyboardInterrupt:
+            print("\n正在停止，等待当前批次完成...")
+        finally:
+            self.stop_event.set()
+            worker.join()
+            self.watcher.close()
+            if self.cache:
+                self.cache.save()
+            print(f"共分类 {self.stats['classified']} 个文件，自动整理 {self.stats['executed']} 个，"
+                  f"未得到分类 {self.stats['unresolved']} 个")
+
+    def worker_loop(self):
+        """从队列中攒批：拿到第一个文件后最多再等待 watch_batch_wait 秒，或攒满一个批次"""
+        while not self.stop_event.is_set():
+            try:
+                batch = [self.queue.get(timeout=1)]
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.planner.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self.process(batch)
+            except Exception as e:
+                print(f"处理失败（{len(batch)} 个文件）: {e}")
+            finally:
+                with self._lock:
+                    self.inflight.difference_update(batch)
+                for _ in batch:
+                    self.queue.task_done()
+
+    def classify(self, files: List[str]) -> Dict[int, Tuple[int, str]]:
+        """依次经过缓存、本地分类阶段和AI，返回 文件下标 -> (分类索引, 结果来源)"""
+        results = {}
+        if self.cache:
+            cached, pending = self.cache.split_cached(files, self.category_key, self.model)
+        else:
+            cached, pending = {}, list(range(len(files)))
+        results.update((i, (category_idx, 'cache')) for i, category_idx in cached.items())
+
+        for stage in self.local_stages:
+            if not pending:
+                break
+            matched, pending = stage.split(files, pending)
+            results.update((i, (category_idx, stage.name)) for i, category_idx in matched.items())
+
+        remaining = deque(pending)
+        while remaining:
+            batch_indices = self.planner.next_batch(remaining, files)
+            started_at = time.monotonic()
+            try:
+                batch_classifications, failed = classify_batch(
+                    [files[i] for i in batch_indices],
+                    self.categories,
+                    self.category_descriptions,
+                    self.config['API'],
+                    self.config['SETTINGS'],
+                    max_tokens=self.planner.max_tokens_for(len(batch_indices))
+                )
+                latency = time.monotonic() - started_at
+            except Exception as e:
+                print(f"批次处理失败（{len(batch_indices)} 个文件）: {e}")
+                batch_classifications, latency, failed = {}, None, len(batch_indices)
+
+            self.planner.record(len(batch_indices), latency, failed)
+            for j, category_idx in batch_classifications.items():
+                results[batch_indices[j]] = (category_idx, 'ai')
+                if self.cache:
+                    self.cache.put(files[batch_indices[j]], self.category_key, self.model, category_idx)
+
+        if self.cache:
+            self.cache.save()
+        return results
+
+    def confidence(self, filename: str, source: str) -> float:
+        if source == 'learner':
+            return self.learned_classifier.model.predict(filename)[1]
+        return self.source_confidence.get(source, 0.0)
+
+    def process(self, files: List[str]):
+        """分类一个小批次，置信度达到阈值的文件在启用 watch_auto_execute 时直接整理"""
+        snapshot = {}
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(self.source_folder, name))
+                snapshot[name] = (stat.st_size, stat.st_mtime)
+            except OSError:
+                pass
+
+        results = self.classify(files)
+        executed = {}
+        if self.auto_execute:
+            confident = sorted(i for i, (_, source) in results.items()
+                               if self.confidence(files[i], source) >= self.min_confidence)
+            if confident:
+                journal = open_journal(self.config, self.placement_options['placement_mode'],
+                                       self.source_folder, self.config['PATHS']['target_base_folder'])
+                try:
+                    result = classify_files(
+                        [files[i] for i in confident],
+                        [results[i][0] for i in confident],
+                        self.categories,
+                        self.source_folder,
+                        self.config['PATHS']['target_base_folder'],
+                        self.category_paths,
+                        journal=journal,
+                        **self.placement_options
+                    )
+                finally:
+                    journal.close()
+                executed = result['file_target_paths']
+
+        if self.scan_index:
+            self.scan_index.mark_classified({
+                files[i]: self.categories[category_idx] for i, (category_idx, _) in results.items()
+            })
+            self.scan_index.set_status(executed, STATUS_EXECUTED)
+        self.handled.update(snapshot)
+
+        unresolved = len(files) - len(results)
+        self.stats['classified'] += len(results)
+        self.stats['executed'] += len(executed)
+        self.stats['unresolved'] += unresolved
+        print(f"已分类 {len(results)}/{len(files)} 个文件：自动整理 {len(executed)} 个，"
+              f"等待确认 {len(results) - len(executed)} 个，未得到分类 {unresolved} 个")
+
+
+def main():
+    config = load_config()
+    if not config:
+        print("错误: 无法加载配置文件")
+        sys.exit(1)
+
+    os.makedirs(config['PATHS']['source_folder'], exist_ok=True)
+    watcher = create_watcher(config, force_polling='--poll' in sys.argv)
+    WatchService(config, watcher, once='--once' in sys.argv).run()
+
+
+if __name__ == "__main__":
+    main()